@@ -1,69 +1,332 @@
 """Utilities to adapt puzzles until they have a unique solution."""
 
-from typing import List, Tuple
-from nonogram_clues import load_grid, extract_clues
-from nonogram_solver import solve_nonogram
+import random
+from typing import List, Optional, Tuple
 
-Grid = List[List[int]]
+import numpy as np
+from ortools.sat.python import cp_model
 
+from line_solver import UNKNOWN, propagate, solve_line, unknown_components
+from nonogram_clues import load_grid, extract_clues, rle_line
+from nonogram_grid import Grid, GridLike, as_grid_array, diff_mask, to_grid_list
+from nonogram_solver import (
+    Budget,
+    UniquenessResult,
+    Verdict,
+    add_line_constraint,
+    prove_unique,
+)
+from solution_cache import SolutionCache, default_cache
 
-def grid_from_array(arr) -> Grid:
-    return [[int(x) for x in row] for row in arr]
 
+def grid_from_array(arr: GridLike) -> Grid:
+    return to_grid_list(arr)
 
-def adapt_grid_for_unique_solution(grid: Grid, max_attempts: int = 1000) -> Tuple[Grid, bool]:
-    """Return a modified grid with a unique solution if possible."""
-    import numpy as np
-    import random
 
-    grid = [row[:] for row in grid]
+class AdaptationSession:
+    """Re-solve a grid incrementally while single cells are flipped.
+
+    The CP-SAT model is built once.  Flipping a cell re-encodes only the clues
+    of its row and column and swaps out those two automaton constraints.
+    Cells settled by the line solver get a fixed domain and the last
+    alternative solution seeds the search as a hint.
+    """
+
+    def __init__(self, grid: GridLike, cache: Optional[SolutionCache] = None):
+        self.grid = as_grid_array(grid).copy()
+        self.cache = cache if cache is not None else default_cache()
+        self.row_clues, self.col_clues = extract_clues(self.grid)
+        h, w = self.grid.shape
+
+        self.model = cp_model.CpModel()
+        self.cells = [
+            [self.model.NewIntVar(0, 1, f"cell_{r}_{c}") for c in range(w)]
+            for r in range(h)
+        ]
+        self._row_cts = [
+            add_line_constraint(self.model, self.cells[r], clues).Index()
+            for r, clues in enumerate(self.row_clues)
+        ]
+        self._col_cts = [
+            add_line_constraint(self.model, self._column(c), clues).Index()
+            for c, clues in enumerate(self.col_clues)
+        ]
+        self._hint: Optional[np.ndarray] = None
+        self._fixed: Optional[np.ndarray] = None
+
+    def fixed(self) -> Optional[np.ndarray]:
+        """Return the line solver's deductions for the current clues.
+
+        Computed once per grid; `check_unique` fills it in when it propagates.
+        """
+        if self._fixed is None:
+            self._fixed = propagate(self.row_clues, self.col_clues)
+        return self._fixed
+
+    def _column(self, c: int) -> List[cp_model.IntVar]:
+        return [row[c] for row in self.cells]
+
+    def set_cell(self, r: int, c: int, value: int) -> None:
+        """Set one cell of the grid and update the affected clues."""
+        if self.grid[r, c] == value:
+            return
+        self.grid[r, c] = value
+        self._fixed = None
+        self.row_clues[r] = rle_line(self.grid[r])
+        self.col_clues[c] = rle_line(self.grid[:, c])
+
+        # a cleared constraint stays in the proto as an empty no-op
+        constraints = self.model.Proto().constraints
+        constraints[self._row_cts[r]].clear_automaton()
+        constraints[self._col_cts[c]].clear_automaton()
+        self._row_cts[r] = add_line_constraint(
+            self.model, self.cells[r], self.row_clues[r]
+        ).Index()
+        self._col_cts[c] = add_line_constraint(
+            self.model, self._column(c), self.col_clues[c]
+        ).Index()
+
+    def check_unique(
+        self, as_array: bool = False, budget: Optional[Budget] = None
+    ) -> UniquenessResult:
+        """Return whether the current grid is the only solution of its clues.
+
+        The first witness is always the current grid.  The verdict is
+        `UNKNOWN` if `budget` runs out.
+        """
+        result = None
+        if self.cache is not None:
+            hit = self.cache.get(self.row_clues, self.col_clues)
+            if hit is not None:
+                result = self._from_cache(*hit)
+        if result is None:
+            result = self._check_unique(budget)
+            if self.cache is not None and result.verdict is not Verdict.UNKNOWN:
+                self.cache.put(
+                    self.row_clues,
+                    self.col_clues,
+                    result.verdict.value,
+                    result.solution,
+                    result.alternative,
+                )
+        if result.alternative is not None:
+            self._hint = result.alternative
+        return result if as_array else result.to_lists()
+
+    def _from_cache(self, verdict: str, solution, alternative) -> UniquenessResult:
+        current = self.grid.copy()
+        verdict = Verdict(verdict)
+        if verdict is not Verdict.AMBIGUOUS:
+            return UniquenessResult(verdict, current if verdict is Verdict.UNIQUE else None)
+        other = alternative if np.array_equal(solution, current) else solution
+        return UniquenessResult(verdict, current, other)
+
+    def _check_unique(self, budget: Optional[Budget] = None) -> UniquenessResult:
+        current = self.grid.copy()
+        fixed = self.fixed()
+        if fixed is None:
+            return UniquenessResult(Verdict.UNSOLVABLE)
+        if not (fixed == UNKNOWN).any():
+            return UniquenessResult(Verdict.UNIQUE, current)
+
+        # narrow the domains of the cells the line solver settled; unlike
+        # assumptions, fixed domains are removed by presolve
+        cells = [cell for cell_row in self.cells for cell in cell_row]
+        variables = self.model.Proto().variables
+        free = []
+        for k, value in enumerate(fixed.ravel().tolist()):
+            domain = variables[cells[k].Index()].domain
+            if value == UNKNOWN:
+                free.append(k)
+                domain[0], domain[1] = 0, 1
+            else:
+                domain[0] = domain[1] = value
+
+        # only the cells left open by the line solver need a hint
+        self.model.ClearHints()
+        if self._hint is not None:
+            hint = self._hint.ravel().tolist()
+            for k in free:
+                self.model.AddHint(cells[k], hint[k])
+
+        # the grid always solves its own clues, so only the proof that no
+        # other solution exists is left to the solver
+        return prove_unique(self.model, self.cells, current, as_array=True, budget=budget)
+
+
+STRATEGIES = ("backbone", "random")
+
+
+def _flip_gain(grid: np.ndarray, fixed: np.ndarray, r: int, c: int) -> int:
+    """Count the open cells of row `r` and column `c` settled once (r, c) flips.
+
+    Only the two lines whose clues change are solved again, starting from
+    what `fixed` knows about them; the flipped grid still solves its clues,
+    so that knowledge stays consistent.
+    """
+    gain = 0
+    for cells, known, i in ((grid[r], fixed[r], c), (grid[:, c], fixed[:, c], r)):
+        trial = cells.copy()
+        trial[i] ^= 1
+        line = known.tolist()
+        line[i] = UNKNOWN
+        solved = solve_line(rle_line(trial), line)
+        gain += sum(1 for a, b in zip(line, solved) if a == UNKNOWN and b != UNKNOWN)
+    return gain
+
+
+def plan_flips(
+    grid: np.ndarray,
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    fixed: np.ndarray,
+    alternative: Optional[np.ndarray] = None,
+    max_flips: int = 8,
+    candidates: int = 12,
+    exclude: Optional[set] = None,
+) -> List[Tuple[int, int]]:
+    """Pick cells to flip so that the line solver settles more of the grid.
+
+    `fixed` is the propagated grid.  The cells where `alternative` differs
+    from `grid` are grouped into regions linked through shared rows and
+    columns (`unknown_components` of the difference); each is a separate
+    ambiguity, typically a small swappable pattern.  Independent parts of
+    the open cells that the witnesses agree on follow as regions of their
+    own, since they may hide further ambiguities.  No two regions share a
+    line.  For each region, largest first and at most `max_flips`, a few
+    candidate cells are tried: the flip settling the most open cells of its
+    own row and column wins (`_flip_gain`), which is much cheaper than
+    re-propagating the grid, and stays valid next to the other flips.
+    Cells in `exclude` are never flipped.
+    """
+    regions = unknown_components(fixed)
+    if alternative is not None:
+        differs = diff_mask(grid, alternative)
+        untouched = [part for part in regions if not differs[part[:, 0], part[:, 1]].any()]
+        regions = unknown_components(np.where(differs, UNKNOWN, 0)) + untouched
+    exclude = exclude or set()
+
+    flips: List[Tuple[int, int]] = []
+    for cells in regions:
+        if len(flips) == max_flips:
+            break
+        cells = [(r, c) for r, c in cells.tolist() if (r, c) not in exclude]
+        if len(cells) > candidates:
+            cells = random.sample(cells, candidates)
+
+        best, best_gain = None, -1
+        for r, c in cells:
+            gain = _flip_gain(grid, fixed, r, c)
+            if gain > best_gain:
+                best, best_gain = (r, c), gain
+        if best is not None:
+            flips.append(best)
+    return flips
+
+
+def adapt_grid_for_unique_solution(
+    grid: GridLike,
+    max_attempts: int = 1000,
+    cache: Optional[SolutionCache] = None,
+    stats: Optional[dict] = None,
+    strategy: str = "backbone",
+    max_flips: int = 8,
+    time_limit: Optional[float] = None,
+    cancel=None,
+) -> Tuple[GridLike, bool]:
+    """Return a modified grid with a unique solution if possible.
+
+    The grid is returned as a uint8 array if one was passed in, otherwise as
+    nested lists.  `cache` defaults to `solution_cache.default_cache()`.  If
+    a `stats` dict is given it receives the number of `iterations` and the
+    CP-SAT counters summed over all checks.
+
+    With `strategy="backbone"` every iteration flips one cell in each of up
+    to `max_flips` regions where the two witnesses differ, chosen by
+    `plan_flips`.
+    `strategy="random"` flips a single random cell towards the alternative
+    solution per iteration.
+
+    `time_limit` (seconds) and `cancel` bound the whole adaptation; when
+    they run out the grid so far is returned with False and
+    `stats["budget_exhausted"]` is set.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    as_array = isinstance(grid, np.ndarray)
+    session = AdaptationSession(grid, cache=cache)
+
+    def output() -> GridLike:
+        return session.grid.copy() if as_array else session.grid.tolist()
+
+    if stats is None:
+        stats = {}
+    stats.setdefault("iterations", 0)
+    flipped: set = set()
+    budget = Budget(time_limit, cancel=cancel)
+
     attempt = 0
     while attempt < max_attempts:
-        clues_row, clues_col = extract_clues(np.array(grid, dtype=np.uint8))
-        solutions = solve_nonogram(clues_row, clues_col, max_solutions=2)
-        if len(solutions) == 1:
-            return grid, True
-        if len(solutions) < 2:
+        result = session.check_unique(as_array=True, budget=budget)
+        stats["iterations"] += 1
+        for name, value in result.stats.items():
+            stats[name] = stats.get(name, 0) + value
+        if result.is_unique:
+            return output(), True
+        if result.verdict is Verdict.UNKNOWN or budget.exhausted():
+            stats["budget_exhausted"] = True
+            break
+        if result.verdict is not Verdict.AMBIGUOUS:
             break
 
-        sol_a, sol_b = solutions[0], solutions[1]
-
-        # choose a solution that differs from the current grid so that a change
-        # is actually made. if both differ, pick the one farther from the grid
-        if sol_a == grid:
-            target = sol_b
-        elif sol_b == grid:
-            target = sol_a
-        else:
-            diff_a = sum(sol_a[i][j] != grid[i][j] for i in range(len(grid)) for j in range(len(grid[0])))
-            diff_b = sum(sol_b[i][j] != grid[i][j] for i in range(len(grid)) for j in range(len(grid[0])))
-            target = sol_a if diff_a >= diff_b else sol_b
-
-        diff_cells = [(i, j) for i in range(len(grid)) for j in range(len(grid[0])) if grid[i][j] != target[i][j]]
-        if not diff_cells:
+        # the first witness is the grid itself, move towards the other one
+        target = result.alternative
+
+        if strategy == "backbone":
+            flips = plan_flips(
+                session.grid,
+                session.row_clues,
+                session.col_clues,
+                session.fixed(),  # already propagated by the check
+                target,
+                max_flips=max_flips,
+                exclude=flipped,
+            )
+            if not flips:
+                break
+            for r, c in flips:
+                session.set_cell(r, c, 1 - session.grid[r, c])
+            # flipping a cell back would only restore an ambiguity
+            flipped.update(flips)
+            attempt += 1
+            continue
+
+        diff_cells = np.argwhere(diff_mask(session.grid, target))
+        if not len(diff_cells):
             break
 
-        i, j = random.choice(diff_cells)
-        grid[i][j] = target[i][j]
+        i, j = diff_cells[random.randrange(len(diff_cells))]
+        session.set_cell(i, j, target[i, j])
         attempt += 1
-    return grid, False
+    return output(), False
 
 
 if __name__ == "__main__":
     import argparse
     from PIL import Image
-    import numpy as np
 
     parser = argparse.ArgumentParser(description="Adapt a puzzle for unique solubility")
     parser.add_argument("input", help="Path to preprocessed puzzle image")
     parser.add_argument("output", help="Path to save adapted image")
     parser.add_argument("--max-attempts", type=int, default=10)
+    parser.add_argument("--strategy", choices=STRATEGIES, default="backbone")
     args = parser.parse_args()
 
     arr = load_grid(args.input)
-    grid = grid_from_array(arr)
-    grid, ok = adapt_grid_for_unique_solution(grid, max_attempts=args.max_attempts)
-    out_arr = (1 - np.array(grid, dtype=np.uint8)) * 255
+    grid, ok = adapt_grid_for_unique_solution(
+        arr, max_attempts=args.max_attempts, strategy=args.strategy
+    )
+    out_arr = (1 - grid) * 255
     Image.fromarray(out_arr).save(args.output)
     if ok:
         print("Puzzle adapted to unique solution")
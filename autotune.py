@@ -0,0 +1,229 @@
+"""Search preprocessing parameters for a uniquely solvable puzzle.
+
+`batching.py` binarizes every image with one fixed setting and leaves the
+rest to the adaptation loop.  `autotune` instead tries a grid of methods,
+block sizes, C values, erode/dilate counts and grid sizes, all decoded from
+one `sweep`, and ranks the candidates by cheap proxies:
+
+- `ink`: share of filled cells; near-empty or near-full grids are dropped,
+- `open`: share of cells line deduction leaves undecided (0 means unique),
+- `switches`: 2x2 checkerboard windows, the local pattern behind most
+  ambiguities.
+
+A candidate settled by line deduction is unique without a solver call.
+Otherwise only the `top_k` candidates with at most `MAX_OPEN` open cells
+get a full `check_unique`, on up to `workers` threads, and the search stops
+at the first unique one.  If none is unique the candidate with the fewest
+open cells is returned for adaptation; if even that one leaves more than
+`MAX_OPEN` open, the preferred setting at the largest grid size is.
+
+    python autotune.py input.jpg --output tuned.png
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from line_solver import UNKNOWN, propagate
+from nonogram_clues import extract_clues
+from nonogram_preprocess import sweep
+from nonogram_solver import Verdict, check_unique
+
+GRID_SIZES = [30, 40, 50]
+VARIANTS = [
+    *({"method": "threshold", "threshold": t} for t in (96, 128, 160)),
+    {"method": "otsu"},
+    *(
+        {"method": "adaptive", "block_size": b, "C": c}
+        for b in (11, 15, 21)
+        for c in (2, 3, 5)
+    ),
+]
+MORPHOLOGY = [{}, {"erode": 1}, {"dilate": 1}]
+# the hand-picked setting of `batching.METHODS`; wins ties
+PREFERRED = {"method": "adaptive", "block_size": 15, "C": 3}
+
+# candidates outside this ink share are not worth a puzzle
+MIN_INK = 0.08
+MAX_INK = 0.7
+# above this open share a full check is slow and rarely unique, and the
+# proxies say little about how hard adaptation will be
+MAX_OPEN = 0.05
+
+
+@dataclass
+class Candidate:
+    """One preprocessing setting and the puzzle it produces."""
+
+    grid_size: int
+    params: dict
+    image: Image.Image = field(repr=False)
+    ink: float = 0.0
+    open: float = 1.0
+    switches: int = 0
+    # number of parameters differing from `PREFERRED`
+    distance: int = 0
+    verdict: Optional[Verdict] = None
+
+    @property
+    def rank(self) -> tuple:
+        # settled first, then fewer open cells and switches; on ties larger
+        # grids keep more detail, then the setting closest to the preferred
+        return (self.open, self.switches / self.grid_size ** 2, -self.grid_size, self.distance)
+
+
+def count_switches(grid: np.ndarray) -> int:
+    """Count 2x2 windows holding a checkerboard (`10/01` or `01/10`)."""
+    a, b = grid[:-1, :-1], grid[:-1, 1:]
+    c, d = grid[1:, :-1], grid[1:, 1:]
+    return int(np.count_nonzero((a == d) & (b == c) & (a != b)))
+
+
+def measure(candidate: Candidate) -> Candidate:
+    """Fill in the proxies of `candidate`."""
+    grid = (np.asarray(candidate.image) == 0).astype(np.uint8)
+    candidate.ink = float(grid.mean())
+    candidate.switches = count_switches(grid)
+    fixed = propagate(*extract_clues(grid))
+    # clues taken from a real grid never contradict each other
+    candidate.open = float((fixed == UNKNOWN).mean())
+    if candidate.open == 0:
+        candidate.verdict = Verdict.UNIQUE
+    return candidate
+
+
+def candidates(
+    image_path: str,
+    grid_sizes: Sequence[int] = GRID_SIZES,
+    variants: Sequence[dict] = VARIANTS,
+    morphology: Sequence[dict] = MORPHOLOGY,
+    preferred: dict = PREFERRED,
+) -> List[Candidate]:
+    """Preprocess `image_path` with every setting; return them best first.
+
+    Settings whose ink share is outside `MIN_INK`..`MAX_INK` are left out.
+    """
+    params = [dict(v, **m) for v in variants for m in morphology]
+    images = sweep(image_path, grid_sizes, params)
+    found = []
+    for (grid_size, i), image in images.items():
+        ink = float((np.asarray(image) == 0).mean())
+        if MIN_INK <= ink <= MAX_INK:
+            p = params[i]
+            distance = sum(p.get(k) != v for k, v in preferred.items()) + len(set(p) - set(preferred))
+            found.append(measure(Candidate(grid_size, p, image, distance=distance)))
+    found.sort(key=lambda c: c.rank)
+    return found
+
+
+def autotune(
+    image_path: str,
+    grid_sizes: Sequence[int] = GRID_SIZES,
+    variants: Sequence[dict] = VARIANTS,
+    morphology: Sequence[dict] = MORPHOLOGY,
+    preferred: dict = PREFERRED,
+    top_k: int = 4,
+    workers: int = 1,
+    time_limit: Optional[float] = None,
+    stats: Optional[Dict[str, float]] = None,
+    ranked: Optional[List[Candidate]] = None,
+) -> Optional[Candidate]:
+    """Return the best candidate for `image_path`, or None if none is usable.
+
+    The result's `verdict` is `UNIQUE` if it was proved unique (by line
+    deduction or `check_unique`) and None otherwise.  `time_limit` bounds
+    the solver checks together.  `stats` receives `candidates`, `checked`
+    (full checks started) and `tune_s`.  `ranked` is the output of
+    `candidates` if the caller already has it; the grid and variant
+    arguments are then ignored.
+    """
+    if stats is None:
+        stats = {}
+    start = time.perf_counter()
+    if ranked is None:
+        ranked = candidates(image_path, grid_sizes, variants, morphology, preferred)
+    stats["candidates"] = len(ranked)
+    stats["checked"] = 0
+    try:
+        if not ranked or ranked[0].verdict is Verdict.UNIQUE:
+            return ranked[0] if ranked else None
+
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        cancel = threading.Event()
+
+        def check(candidate: Candidate) -> Candidate:
+            grid = (np.asarray(candidate.image) == 0).astype(np.uint8)
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            candidate.verdict = check_unique(
+                *extract_clues(grid), time_limit=remaining, cancel=cancel, hint=grid
+            ).verdict
+            return candidate
+
+        top = [c for c in ranked[:top_k] if c.open <= MAX_OPEN]
+        stats["checked"] = len(top)
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            futures = [pool.submit(check, c) for c in top]
+            for future in as_completed(futures):
+                if future.result().verdict is Verdict.UNIQUE:
+                    cancel.set()  # running checks stop, queued ones return at once
+                    return future.result()
+        for candidate in top:
+            candidate.verdict = None  # ambiguous or undecided
+        if top:
+            return ranked[0]
+        return min(ranked, key=lambda c: (c.distance, -c.grid_size, c.open))
+    finally:
+        stats["tune_s"] = time.perf_counter() - start
+
+
+def describe(candidate: Candidate) -> str:
+    params = " ".join(f"{k}={v}" for k, v in candidate.params.items())
+    verdict = candidate.verdict.value if candidate.verdict else "-"
+    return (
+        f"grid {candidate.grid_size:3} {params:40} ink {candidate.ink:.2f} "
+        f"open {candidate.open:.3f} switches {candidate.switches:4} {verdict}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find preprocessing parameters for a unique puzzle")
+    parser.add_argument('input', help="Input image path")
+    parser.add_argument('--output', default=None, help="Save the chosen puzzle image here")
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=GRID_SIZES)
+    parser.add_argument('--top-k', type=int, default=4, help="Candidates given a full check")
+    parser.add_argument('--workers', type=int, default=1, help="Threads for the full checks")
+    parser.add_argument('--time-limit', type=float, default=None, help="Solver budget in seconds")
+    parser.add_argument('--show', type=int, default=10, help="Print this many ranked candidates")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ranked = candidates(args.input, args.grid_sizes)
+    for candidate in ranked[:args.show]:
+        print(describe(candidate))
+    stats: Dict[str, float] = {}
+    best = autotune(
+        args.input,
+        top_k=args.top_k,
+        workers=args.workers,
+        time_limit=args.time_limit,
+        stats=stats,
+        ranked=ranked,
+    )
+    if best is None:
+        print("No usable setting found")
+        return
+    print("Chosen:", describe(best))
+    elapsed = time.perf_counter() - start
+    print(f"{stats['candidates']} candidates, {stats['checked']} full checks, {elapsed:.2f}s")
+    if args.output:
+        best.image.save(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Content-addressed manifest of batch runs.
+
+Every preprocessing variant of a source image is identified by a key
+derived from the image bytes, the method parameters and the grid size.
+Outcomes are appended to a JSON-lines file, one record per attempt; the last
+record of a key wins.  `batching.py` uses it to skip work that is already
+done and to retry only failed or changed inputs.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+COMPLETED = ("valid", "invalid")
+# a timed-out variant is retried on the next run, e.g. with a larger budget
+FAILED = ("invalid", "timeout", "error")
+
+
+def file_digest(path: str) -> str:
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_key(image_digest: str, params: dict, grid_size: int) -> str:
+    """Return the manifest key of one preprocessing variant of an image."""
+    payload = json.dumps(
+        {"image": image_digest, "params": params, "grid_size": grid_size},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Manifest:
+    """Append-only JSON-lines record of variant outcomes."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.records: Dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a run killed mid-write leaves a truncated last line
+                        continue
+                    self.records[record["key"]] = record
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.records.get(key)
+
+    def is_completed(self, key: str) -> bool:
+        """Return True if the variant finished and its output still exists."""
+        record = self.records.get(key)
+        if record is None or record["status"] not in COMPLETED:
+            return False
+        outputs = [record.get("output"), record.get("clues_output")]
+        return all(os.path.exists(p) for p in outputs if p)
+
+    def has_failed(self, key: str) -> bool:
+        record = self.records.get(key)
+        return record is not None and record["status"] in FAILED
+
+    def add(self, record: dict) -> None:
+        """Append a record (which must contain `key` and `status`)."""
+        record = dict(record, finished_at=time.time())
+        self.records[record["key"]] = record
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def extend(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.add(record)
@@ -1,119 +1,748 @@
 import os
 import glob
+import json
+import hashlib
+import time
 import shutil
-import subprocess
+import argparse
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-import numpy as np
+import cv2
 from PIL import Image
 
-from nonogram_clues import load_grid, extract_clues, puzzle_from_image
-from nonogram_solver import solve_nonogram
-from adapt_puzzle import grid_from_array, adapt_grid_for_unique_solution
+from nonogram_clues import load_grid, extract_clues, puzzle_from_image, trim_grid
+from nonogram_solver import Verdict, check_unique, set_default_parameters
+from nonogram_preprocess import sweep
+from adapt_puzzle import adapt_grid_for_unique_solution
+from autotune import autotune
 from clue_grid import render_clue_grid
+from batch_manifest import Manifest, file_digest, variant_key
+from puzzle_archive import ArchiveWriter
+from solution_cache import CACHE_ENV
+from tracing import Tracer
+from work_queue import DEFAULT_LEASE_TTL, WorkQueue
 
+# Binarization variants; "params" are keyword arguments of binarize_image
+# plus optional "erode"/"dilate" iteration counts for post_process.
+METHODS = [
+    # {"name": "threshold", "params": {"method": "threshold", "threshold": 128}}, # TODO MAYBE ADD LATER
+    {"name": "adaptive", "params": {"method": "adaptive", "block_size": 15, "C": 3}},
+]
+GRID_SIZES = [50]
+# With --autotune every image gets this single variant instead; the setting
+# and grid size are picked per image by `autotune.autotune`.  Grid size 0
+# stands for "chosen by autotune" in manifest keys.
+AUTO_METHOD = {"name": "auto", "params": {"method": "auto"}}
 
-def validate_or_adapt(puzzle_path: str) -> bool:
-    """Return True if the puzzle has a unique solution, adapting if necessary."""
+
+def validate_or_adapt(
+    puzzle_path: str, stats: Optional[dict] = None, time_limit: Optional[float] = None
+) -> bool:
+    """Return True if the puzzle has a unique solution, adapting if necessary.
+
+    If a `stats` dict is given it receives the initial `verdict`, the solver
+    counters of that check and, when adapting, `adapt_iterations` plus the
+    adaptation's counters under `adapt_`-prefixed keys.  `time_limit` bounds
+    the check and the adaptation together; if it runs out the puzzle is
+    given up on and `stats["timed_out"]` is set.
+    """
+    if stats is None:
+        stats = {}
+    deadline = None if time_limit is None else time.monotonic() + time_limit
     arr = load_grid(puzzle_path)
     clues_row, clues_col = extract_clues(arr)
-    solutions = solve_nonogram(clues_row, clues_col, max_solutions=2)
-    if len(solutions) == 1:
+    # the grid solves its own clues, so only the proof of uniqueness is left
+    result = check_unique(clues_row, clues_col, time_limit=time_limit, hint=arr)
+    stats["verdict"] = result.verdict.value
+    stats.update(result.stats)
+    if result.is_unique:
         return True
-    else:
-        print(f"Puzzle at {puzzle_path} has {len(solutions)} solutions, adapting...")
+    if result.verdict is Verdict.UNKNOWN:
+        stats["timed_out"] = True
+        return False
+    print(f"Puzzle at {puzzle_path} is {result.verdict.value}, adapting...")
 
-    grid = grid_from_array(arr)
-    grid, ok = adapt_grid_for_unique_solution(grid)
+    adapt_stats: dict = {}
+    grid, ok = adapt_grid_for_unique_solution(
+        arr,
+        stats=adapt_stats,
+        time_limit=None if deadline is None else max(0.0, deadline - time.monotonic()),
+    )
+    for name, value in adapt_stats.items():
+        stats[f"adapt_{name}"] = value
+    if adapt_stats.get("budget_exhausted"):
+        stats["timed_out"] = True
     if ok:
-        Image.fromarray((1 - np.array(grid, dtype=np.uint8)) * 255).save(puzzle_path)
+        Image.fromarray((1 - grid) * 255).save(puzzle_path)
     return ok
 
 
-def batch_process_images() -> None:
-    """Process all images in the 'potential' folder."""
+def find_images(folder: str) -> List[str]:
+    """Return all image files directly inside `folder`."""
+    image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.tiff', '*.tif']
+    image_files: List[str] = []
+    for ext in image_extensions:
+        image_files.extend(glob.glob(os.path.join(folder, ext)))
+        image_files.extend(glob.glob(os.path.join(folder, ext.upper())))
+    return image_files
+
+
+def all_variants(
+    methods: List[dict] = METHODS, grid_sizes: List[int] = GRID_SIZES
+) -> List[Tuple[int, dict]]:
+    return [(grid_size, method) for grid_size in grid_sizes for method in methods]
+
+
+def process_image(
+    image_path: str,
+    output_root: str = "output",
+    variants: Optional[List[Tuple[int, dict]]] = None,
+    trace_allocations: bool = False,
+    time_limit: Optional[float] = None,
+    tune_workers: int = 1,
+) -> List[dict]:
+    """Preprocess, validate and render one image for every variant.
+
+    `variants` is a list of `(grid_size, method)` pairs and defaults to every
+    combination of `GRID_SIZES` and `METHODS`; `(0, AUTO_METHOD)` searches
+    for the setting instead and adds a `tuned` entry (`grid_size`, `params`)
+    to its result.  Returns one result dict per
+    variant with the keys `image`, `method`, `params`, `grid_size`, `status`
+    ("valid", "invalid", "timeout" or "error"), `output`, `clues_output`, `error`,
+    `timings` (seconds per stage) and `metrics` (the variant's tracing spans,
+    see `tracing.Tracer`).  The shared preprocessing span is attached to the
+    first variant only so that totals are not counted twice.
+
+    `time_limit` is the solver budget in seconds for the whole image, shared
+    by its variants; variants left without budget end up as "timeout".
+    `tune_workers` candidates are checked at once while auto-tuning.
+    """
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    if variants is None:
+        variants = all_variants()
+    base_name = Path(image_path).stem
+    output_folder = Path(output_root) / base_name
+    output_folder.mkdir(parents=True, exist_ok=True)
+    shutil.copy(image_path, output_folder / Path(image_path).name)
+
+    # decode the image once and binarize every variant from shared arrays
+    fixed_variants = [(size, method) for size, method in variants if method != AUTO_METHOD]
+    grid_sizes = sorted({grid_size for grid_size, _ in fixed_variants})
+    params = []
+    for _, method in fixed_variants:
+        if method["params"] not in params:
+            params.append(method["params"])
+    tracer = Tracer(trace_allocations=trace_allocations)
+    images, sweep_error, sweep_time = {}, None, 0.0
+    if fixed_variants:
+        try:
+            with tracer.stage("preprocess", image=image_path, variants=len(fixed_variants)) as span:
+                images = sweep(image_path, grid_sizes, params)
+        except Exception as e:
+            sweep_error = e
+        sweep_time = span["wall_s"]
+
+    results = []
+    for grid_size, method in variants:
+        # the first variant's metrics also carry the preprocess span
+        first_span = len(tracer.spans) if results else 0
+        method_name = method["name"]
+        output_file = output_folder / f"{method_name}_grid{grid_size}.png"
+        result = {
+            "image": image_path,
+            "method": method_name,
+            "params": method["params"],
+            "grid_size": grid_size,
+            "status": "error",
+            "output": None,
+            "clues_output": None,
+            "error": None,
+            "timings": {},
+        }
+        timings = result["timings"]
+        tags = {"image": image_path, "method": method_name, "grid_size": grid_size}
+
+        try:
+            tuned = None
+            if method == AUTO_METHOD:
+                print("  Searching preprocessing settings...")
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                with tracer.stage("autotune", **tags) as span:
+                    tuned = autotune(
+                        image_path, workers=tune_workers, time_limit=remaining, stats=span
+                    )
+                timings["autotune"] = span["wall_s"]
+                if tuned is None:
+                    raise ValueError("No preprocessing setting gives a usable grid")
+                result["tuned"] = {"grid_size": tuned.grid_size, "params": tuned.params}
+                tags["grid_size"] = tuned.grid_size
+                output_file = output_folder / f"{method_name}_grid{tuned.grid_size}.png"
+                tuned.image.save(output_file)
+            else:
+                print(f"  Creating {method_name} (grid {grid_size})...")
+                if sweep_error is not None:
+                    raise sweep_error
+                images[(grid_size, params.index(method["params"]))].save(output_file)
+                timings["preprocess"] = sweep_time
+
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            with tracer.stage("validate", **tags) as checked:
+                if tuned is not None and tuned.verdict is Verdict.UNIQUE:
+                    checked["verdict"] = Verdict.UNIQUE.value  # proved while tuning
+                    ok = True
+                else:
+                    ok = validate_or_adapt(str(output_file), stats=checked, time_limit=remaining)
+            timings["validate"] = checked["wall_s"]
+            if ok:
+                print(f"    Valid puzzle created: {output_file}")
+                with tracer.stage("render", **tags) as span:
+                    puzzle = puzzle_from_image(str(output_file))
+                    print("   Puzzle made")
+                    clue_img = render_clue_grid(
+                        puzzle.clues_row,
+                        puzzle.clues_col,
+                        image_path=str(image_path),
+                    )
+                    clue_path = output_file.with_name(f"{output_file.stem}_clues.png")
+                    clue_img.save(clue_path)
+                timings["render"] = span["wall_s"]
+                result["status"] = "valid"
+                result["output"] = str(output_file)
+                result["clues_output"] = str(clue_path)
+            elif checked.get("timed_out"):
+                output_file.unlink(missing_ok=True)
+                result["status"] = "timeout"
+                print("    Time budget exhausted, skipped.")
+            else:
+                output_file.unlink(missing_ok=True)
+                result["status"] = "invalid"
+                print("    Invalid puzzle, logged.")
+        except Exception as e:
+            print(f"    Unexpected error: {e}")
+            result["error"] = str(e)
+        result["metrics"] = tracer.spans[first_span:]
+        results.append(result)
+    return results
+
+
+def plan_work(
+    image_files: List[str],
+    manifest: Manifest,
+    only_failed: bool = False,
+    tune: bool = False,
+) -> List[Tuple[str, str, List[Tuple[int, dict]]]]:
+    """Return `(image_path, digest, variants)` for everything left to do.
+
+    Variants already completed for identical image bytes are skipped.  With
+    `only_failed` only variants whose last outcome was a failure are kept.
+    With `tune` the only variant is `AUTO_METHOD`.
+    """
+    work = []
+    for image_path in image_files:
+        digest = file_digest(image_path)
+        todo = []
+        variants = [(0, AUTO_METHOD)] if tune else all_variants()
+        for grid_size, method in variants:
+            key = variant_key(digest, method["params"], grid_size)
+            if only_failed:
+                if manifest.has_failed(key):
+                    todo.append((grid_size, method))
+            elif not manifest.is_completed(key):
+                todo.append((grid_size, method))
+        if todo:
+            work.append((image_path, digest, todo))
+    return work
+
+
+def cp_workers_per_process(
+    workers: int, cp_workers: Optional[int] = None, tune_workers: int = 1
+) -> int:
+    """Return the CP-SAT threads per solve in each of `workers` processes.
+
+    Unless `cp_workers` is given, the cores are split evenly between the
+    processes and the `tune_workers` checks each one runs at once while
+    auto-tuning; CP-SAT on its own starts one search thread per core in
+    every solve.
+    """
+    if cp_workers:
+        return cp_workers
+    return max(1, (os.cpu_count() or 1) // (max(1, workers) * max(1, tune_workers)))
+
+
+def _init_worker(cv2_threads: int, cp_workers: int = 1) -> None:
+    # several workers each spawning a full cv2 thread pool or CP-SAT
+    # portfolio oversubscribe the CPU
+    cv2.setNumThreads(cv2_threads)
+    set_default_parameters({"num_workers": cp_workers})
+
+
+class Recorder:
+    """Record variant results in the manifest, metrics, archive and bad log.
+
+    With `shared` the archive is only opened for the duration of `report`,
+    so that several processes can take turns appending to it (the caller
+    must serialize the calls).
+    """
+
+    def __init__(
+        self,
+        manifest: Manifest,
+        metrics_path: Optional[str] = None,
+        archive_path: Optional[str] = None,
+        bad_log_path: str = "bad_logging.txt",
+        shared: bool = False,
+    ):
+        self.manifest = manifest
+        self.metrics_file = open(metrics_path, "a") if metrics_path else None
+        self.tracer = Tracer(sink=self.metrics_file)
+        self.archive_path = archive_path
+        self.shared = shared
+        self.archive = ArchiveWriter(archive_path) if archive_path and not shared else None
+        self.bad_log = open(bad_log_path, "a")
+
+    def report(self, digest: str, results: List[dict]) -> None:
+        if self.shared and self.archive_path:
+            self.archive = ArchiveWriter(self.archive_path)
+        try:
+            self._report(digest, results)
+        finally:
+            if self.shared and self.archive is not None:
+                self.archive.close()
+                self.archive = None
+
+    def _report(self, digest: str, results: List[dict]) -> None:
+        for result in results:
+            key = variant_key(digest, result["params"], result["grid_size"])
+            for span in result["metrics"]:
+                self.tracer.add(dict(span, key=key))
+            self.manifest.add(dict(result, key=key, sha256=digest))
+            if self.archive is not None and result["status"] == "valid":
+                # the trimmed grid is the one the clue image was rendered from
+                self.archive.add(
+                    trim_grid(load_grid(result["output"])),
+                    verdict="unique",
+                    metadata={
+                        "image": result["image"],
+                        "method": result["method"],
+                        "params": result["params"],
+                        "grid_size": result["grid_size"],
+                        "tuned": result.get("tuned"),
+                        "key": key,
+                        "sha256": digest,
+                    },
+                )
+            if result["status"] in ("invalid", "timeout"):
+                self.bad_log.write(
+                    f"{result['image']} - {result['method']} grid{result['grid_size']} {result['status']}\n"
+                )
+        self.bad_log.flush()
+        if self.archive is not None:
+            self.archive.flush()
+
+    def close(self) -> None:
+        if self.tracer.spans:
+            print(self.tracer.summary_table())
+        self.bad_log.close()
+        if self.metrics_file is not None:
+            self.metrics_file.close()
+        if self.archive is not None:
+            self.archive.close()
+
+
+def batch_process_images(
+    workers: int = 1,
+    cv2_threads: int = 1,
+    manifest_path: str = "output/manifest.jsonl",
+    only_failed: bool = False,
+    metrics_path: Optional[str] = "output/metrics.jsonl",
+    trace_allocations: bool = False,
+    time_limit: Optional[float] = None,
+    archive_path: Optional[str] = None,
+    tune: bool = False,
+    cp_workers: Optional[int] = None,
+    tune_workers: int = 1,
+) -> None:
+    """Process all images in the 'potential' folder.
+
+    With `workers > 1` images are handled by a pool of long-lived worker
+    processes and results are reported as they complete.  Outcomes are
+    recorded in the manifest at `manifest_path`, so a rerun only processes
+    new, changed or failed inputs.  Per-stage spans (timings, RSS, solver
+    statistics) are appended to `metrics_path` as JSON lines and summarised
+    at the end of the run.  `time_limit` caps the solver time per image (see
+    `process_image`).  Valid puzzles are also appended to the puzzle archive
+    at `archive_path` if one is given.  With `tune` each image gets one
+    puzzle from the setting `autotune` picks instead of the fixed variants.
+    `tune_workers` is passed on to `process_image`.  Pool processes run
+    `cp_workers` CP-SAT threads per solve (see `cp_workers_per_process`).
+    """
     potential_folder = "potential"
     output_root = Path("output")
     output_root.mkdir(exist_ok=True)
-    bad_log = open("bad_logging.txt", "a")
 
     if not os.path.exists(potential_folder):
         print(f"Folder '{potential_folder}' not found!")
         return
 
-    image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.tiff', '*.tif']
-    image_files: List[str] = []
-    for ext in image_extensions:
-        image_files.extend(glob.glob(os.path.join(potential_folder, ext)))
-        image_files.extend(glob.glob(os.path.join(potential_folder, ext.upper())))
-
+    image_files = find_images(potential_folder)
     if not image_files:
         print(f"No image files found in '{potential_folder}' folder!")
         return
 
-    methods = [
-        # {"name": "threshold", "args": ["--method", "threshold", "--threshold", "128"]}, # TODO MAYBE ADD LATER
-        {"name": "adaptive", "args": ["--method", "adaptive", "--block-size", "15", "--C", "3"]},
-    ]
-    grid_sizes = [50]
-    image_files = image_files
-    print(f"Found {len(image_files)} images to process")
+    manifest = Manifest(manifest_path)
+    recorder = Recorder(manifest, metrics_path, archive_path)
+    work = plan_work(image_files, manifest, only_failed=only_failed, tune=tune)
+    print(f"Found {len(image_files)} images, {len(work)} to process")
 
-    for idx, image_path in enumerate(image_files):
-        print(f"\nProcessing image {idx + 1}/{len(image_files)}: {os.path.basename(image_path)}")
+    if workers <= 1:
+        for idx, (image_path, digest, variants) in enumerate(work):
+            print(f"\nProcessing image {idx + 1}/{len(work)}: {os.path.basename(image_path)}")
+            results = process_image(
+                image_path, str(output_root), variants, trace_allocations, time_limit, tune_workers
+            )
+            recorder.report(digest, results)
+            print(f"  Completed image {idx + 1} -> folder '{output_root / Path(image_path).stem}'")
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(cv2_threads, cp_workers_per_process(workers, cp_workers, tune_workers)),
+        ) as pool:
+            futures = {
+                pool.submit(
+                    process_image,
+                    image_path,
+                    str(output_root),
+                    variants,
+                    trace_allocations,
+                    time_limit,
+                    tune_workers,
+                ): (image_path, digest)
+                for image_path, digest, variants in work
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                image_path, digest = futures[future]
+                try:
+                    recorder.report(digest, future.result())
+                except Exception as e:
+                    print(f"    Worker failed on {image_path}: {e}")
+                print(f"  Completed image {done}/{len(work)}: {os.path.basename(image_path)}")
 
-        base_name = Path(image_path).stem
-        output_folder = output_root / base_name
-        output_folder.mkdir(exist_ok=True)
-        shutil.copy(image_path, output_folder / Path(image_path).name)
+    print("\nBatch processing complete! Check the 'output' folder.")
+    recorder.close()
 
-        for grid_size in grid_sizes:
-            for method in methods:
-                method_name = method["name"]
-                method_args = method["args"]
 
-                output_file = output_folder / f"{method_name}_grid{grid_size}.png"
+def watch_folder(
+    folder: str = "potential",
+    workers: int = 1,
+    cv2_threads: int = 1,
+    manifest_path: str = "output/manifest.jsonl",
+    metrics_path: Optional[str] = "output/metrics.jsonl",
+    trace_allocations: bool = False,
+    time_limit: Optional[float] = None,
+    archive_path: Optional[str] = None,
+    output_root: str = "output",
+    poll_interval: float = 1.0,
+    settle_time: float = 2.0,
+    stop: Optional[threading.Event] = None,
+    tune: bool = False,
+    cp_workers: Optional[int] = None,
+    tune_workers: int = 1,
+) -> None:
+    """Process images as they appear in (or change inside) `folder`.
 
-                cmd = [
-                    "python",
-                    "nonogram_preprocess.py",
-                    image_path,
-                    str(output_file),
-                    "--grid-size",
-                    str(grid_size),
-                ] + method_args
+    The folder is polled every `poll_interval` seconds.  A file is picked up
+    once its size and mtime have not changed for `settle_time` seconds, so
+    half-written uploads are not read.  At most `workers` images are in
+    flight (in a process pool if `workers > 1`, inline otherwise); the rest
+    wait for a free slot.  Work already recorded in the manifest is skipped,
+    so restarting the watcher does not redo anything.  Runs until `stop` is
+    set or the process is interrupted.  `tune`, `cp_workers` and
+    `tune_workers` are as in `batch_process_images`.
+    """
+    Path(output_root).mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(manifest_path)
+    recorder = Recorder(manifest, metrics_path, archive_path)
+    stop = stop or threading.Event()
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(cv2_threads, cp_workers_per_process(workers, cp_workers, tune_workers)),
+        )
+
+    handled: Dict[str, Tuple[int, int]] = {}  # path -> (mtime_ns, size) done
+    changing: Dict[str, Tuple[Tuple[int, int], float]] = {}  # path -> (signature, since)
+    in_flight: Dict[Future, Tuple[str, str]] = {}
 
+    def finish(future: Future) -> None:
+        image_path, digest = in_flight.pop(future)
+        try:
+            recorder.report(digest, future.result())
+            print(f"  Completed {os.path.basename(image_path)}")
+        except Exception as e:
+            print(f"    Worker failed on {image_path}: {e}")
+
+    print(f"Watching '{folder}' (Ctrl-C to stop)")
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            present = set()
+            for image_path in find_images(folder):
+                present.add(image_path)
                 try:
-                    print(f"  Creating {method_name} (grid {grid_size})...")
-                    subprocess.run(cmd, check=True, capture_output=True)
-                    if validate_or_adapt(str(output_file)):
-                        print(f"    Valid puzzle created: {output_file}")
-                        puzzle = puzzle_from_image(str(output_file))
-                        print("   Puzzle made")
-                        clue_img = render_clue_grid(
-                            puzzle.clues_row,
-                            puzzle.clues_col,
-                            image_path=str(image_path),
-                        )
-                        clue_path = output_folder / f"{method_name}_grid{grid_size}_clues.png"
-                        clue_img.save(clue_path)
+                    st = os.stat(image_path)
+                except FileNotFoundError:
+                    continue
+                signature = (st.st_mtime_ns, st.st_size)
+                if handled.get(image_path) == signature:
+                    continue
+                seen = changing.get(image_path)
+                if seen is None or seen[0] != signature:
+                    changing[image_path] = (signature, now)
+
+            busy = {path for path, _ in in_flight.values()}
+            for image_path, (signature, since) in sorted(changing.items()):
+                if len(in_flight) >= max(workers, 1):
+                    break
+                if image_path not in present:
+                    del changing[image_path]
+                    continue
+                if now - since < settle_time or image_path in busy:
+                    continue
+                del changing[image_path]
+                try:
+                    planned = plan_work([image_path], manifest, tune=tune)
+                except OSError as e:
+                    # unreadable for now; retried once it settles again
+                    print(f"    Skipping {image_path}: {e}")
+                    continue
+                handled[image_path] = signature
+                for image, digest, variants in planned:
+                    print(f"\nProcessing {os.path.basename(image)}")
+                    if pool is None:
+                        future: Future = Future()
+                        try:
+                            future.set_result(
+                                process_image(
+                                    image,
+                                    output_root,
+                                    variants,
+                                    trace_allocations,
+                                    time_limit,
+                                    tune_workers,
+                                )
+                            )
+                        except Exception as e:
+                            future.set_exception(e)
                     else:
-                        output_file.unlink(missing_ok=True)
-                        bad_log.write(f"{image_path} - {method_name} grid{grid_size} invalid\n")
-                        print("    Invalid puzzle, logged.")
-                except subprocess.CalledProcessError as e:
-                    print(f"    Error processing {method_name}: {e}")
-                except Exception as e:
-                    print(f"    Unexpected error: {e}")
+                        future = pool.submit(
+                            process_image,
+                            image,
+                            output_root,
+                            variants,
+                            trace_allocations,
+                            time_limit,
+                            tune_workers,
+                        )
+                    in_flight[future] = (image, digest)
 
-        print(f"  Completed image {idx + 1} -> folder '{output_folder}'")
+            for future in [f for f in in_flight if f.done()]:
+                finish(future)
+            for path in set(handled) - present:
+                del handled[path]
+            stop.wait(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for future in list(in_flight):
+            future.exception()  # wait for it
+            finish(future)
+        if pool is not None:
+            pool.shutdown()
+        recorder.close()
 
-    print("\nBatch processing complete! Check the 'output' folder.")
-    bad_log.close()
 
+def work_key(image_path: str, digest: str, variants: List[Tuple[int, dict]]) -> str:
+    """Return the queue key of one image's planned variants.
 
-if __name__ == "__main__":
+    The key covers the file name, so copies of an image under other names are
+    processed as in a normal run, and the variant keys, so work left over
+    from an earlier run is a new item.
+    """
+    keys = sorted(variant_key(digest, method["params"], size) for size, method in variants)
+    payload = json.dumps({"name": os.path.basename(image_path), "variants": keys})
+    return hashlib.sha256(payload.encode()).hexdigest()
 
-    batch_process_images()
 
+def run_queue_worker(
+    queue_dir: str,
+    folder: str = "potential",
+    output_root: str = "output",
+    manifest_path: str = "output/manifest.jsonl",
+    metrics_path: Optional[str] = "output/metrics.jsonl",
+    trace_allocations: bool = False,
+    time_limit: Optional[float] = None,
+    archive_path: Optional[str] = None,
+    only_failed: bool = False,
+    tune: bool = False,
+    lease_ttl: float = DEFAULT_LEASE_TTL,
+    poll_interval: float = 1.0,
+    worker_id: Optional[str] = None,
+    stop: Optional[threading.Event] = None,
+    tune_workers: int = 1,
+) -> int:
+    """Process images of `folder` together with other workers; return the count done.
+
+    Workers on any host that sees the same `folder`, `output_root` and
+    `queue_dir` split the images through the lease files of
+    `work_queue.WorkQueue`.  An image is processed by exactly one worker
+    unless its worker stops heartbeating for `lease_ttl` seconds, after which
+    another one takes it over.  Results are merged into the shared manifest,
+    metrics, archive and output tree under a queue-wide lock, and the image
+    is only marked done after that.  Returns once every planned image is
+    done; images leased by others are waited for in case their worker dies.
+    A failed image is not retried in the same queue; retry it from a fresh
+    `queue_dir`.  `tune` and `tune_workers` are as in `batch_process_images`.
+    """
+    Path(output_root).mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(manifest_path)
+    queue = WorkQueue(queue_dir, worker_id, lease_ttl)
+    recorder = Recorder(manifest, metrics_path, archive_path, shared=True)
+    stop = stop or threading.Event()
+    pending = {
+        work_key(image_path, digest, variants): (image_path, digest, variants)
+        for image_path, digest, variants in plan_work(
+            find_images(folder), manifest, only_failed=only_failed, tune=tune
+        )
+    }
+    print(f"Worker {queue.worker_id}: {len(pending)} images planned")
+    processed = 0
+    try:
+        while pending and not stop.is_set():
+            claimed = None
+            for key in list(pending):
+                if queue.is_done(key):
+                    del pending[key]
+                elif queue.claim(key):
+                    claimed = key
+                    break
+            if claimed is None:
+                stop.wait(poll_interval)  # the rest is leased to other workers
+                continue
+            image_path, digest, variants = pending.pop(claimed)
+            print(f"\nProcessing {os.path.basename(image_path)}")
+            try:
+                results = process_image(
+                    image_path, output_root, variants, trace_allocations, time_limit, tune_workers
+                )
+            except BaseException:
+                queue.release(claimed)
+                raise
+            statuses = [result["status"] for result in results]
+            # record first: an item marked done is never picked up again, so
+            # a crash before `complete` must leave it to another worker
+            with queue.locked("results"):
+                if queue.is_done(claimed):
+                    print(f"  {os.path.basename(image_path)} was finished by another worker")
+                    queue.release(claimed)
+                    continue
+                recorder.report(digest, results)
+                queue.complete(claimed, {"image": image_path, "statuses": statuses})
+            processed += 1
+    finally:
+        queue.close()
+        recorder.close()
+    return processed
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Batch-generate nonograms from the 'potential' folder")
+    p.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    p.add_argument('--cv2-threads', type=int, default=1, help="OpenCV threads per worker")
+    p.add_argument('--cp-workers', type=int, default=None, help="CP-SAT threads per solve in each worker (default: cores / (--workers * --tune-workers))")
+    p.add_argument('--manifest', default="output/manifest.jsonl", help="Manifest of completed work")
+    p.add_argument('--only-failed', action='store_true', help="Only retry variants that failed before")
+    p.add_argument('--cache', default=None, help="SQLite verdict cache shared by all workers")
+    p.add_argument('--metrics', default="output/metrics.jsonl", help="JSON-lines file for per-stage spans")
+    p.add_argument('--trace-alloc', action='store_true', help="Record Python allocation peaks (slow)")
+    p.add_argument('--time-limit', type=float, default=None, help="Solver budget per image in seconds")
+    p.add_argument('--archive', default=None, help="Also append valid puzzles to this puzzle archive")
+    p.add_argument('--watch', action='store_true', help="Keep running and process new or changed images")
+    p.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between folder scans in --watch")
+    p.add_argument('--settle-time', type=float, default=2.0, help="Seconds a file must stay unchanged in --watch")
+    p.add_argument('--autotune', action='store_true', help="Search preprocessing settings per image")
+    p.add_argument('--tune-workers', type=int, default=1, help="Settings checked at once per image with --autotune")
+    p.add_argument('--queue', default=None, help="Share the work with other workers through this directory")
+    p.add_argument('--lease-ttl', type=float, default=DEFAULT_LEASE_TTL,
+                   help="Seconds without heartbeat after which a --queue lease is taken over")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.cache:
+        # picked up by solution_cache.default_cache() here and in every worker
+        os.environ[CACHE_ENV] = args.cache
+    threads = cp_workers_per_process(args.workers, args.cp_workers, args.tune_workers)
+    if args.workers <= 1 and (args.cp_workers or args.tune_workers > 1):
+        # no pool initializer runs; keep parallel tuning checks within the cores
+        set_default_parameters({"num_workers": threads})
+    if args.queue:
+        options = dict(
+            queue_dir=args.queue,
+            manifest_path=args.manifest,
+            metrics_path=args.metrics,
+            trace_allocations=args.trace_alloc,
+            time_limit=args.time_limit,
+            archive_path=args.archive,
+            only_failed=args.only_failed,
+            tune=args.autotune,
+            tune_workers=args.tune_workers,
+            lease_ttl=args.lease_ttl,
+        )
+        if args.workers <= 1:
+            run_queue_worker(**options)
+        else:
+            # every process is an independent queue worker, like those on other hosts
+            with ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=_init_worker,
+                initargs=(args.cv2_threads, threads),
+            ) as pool:
+                futures = [pool.submit(run_queue_worker, **options) for _ in range(args.workers)]
+                done = sum(future.result() for future in futures)
+            print(f"\n{done} images processed by {args.workers} workers")
+    elif args.watch:
+        watch_folder(
+            workers=args.workers,
+            cv2_threads=args.cv2_threads,
+            cp_workers=args.cp_workers,
+            manifest_path=args.manifest,
+            metrics_path=args.metrics,
+            trace_allocations=args.trace_alloc,
+            time_limit=args.time_limit,
+            archive_path=args.archive,
+            poll_interval=args.poll_interval,
+            settle_time=args.settle_time,
+            tune=args.autotune,
+            tune_workers=args.tune_workers,
+        )
+    else:
+        batch_process_images(
+            workers=args.workers,
+            cv2_threads=args.cv2_threads,
+            cp_workers=args.cp_workers,
+            manifest_path=args.manifest,
+            only_failed=args.only_failed,
+            metrics_path=args.metrics,
+            trace_allocations=args.trace_alloc,
+            time_limit=args.time_limit,
+            archive_path=args.archive,
+            tune=args.autotune,
+            tune_workers=args.tune_workers,
+        )
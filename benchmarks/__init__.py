@@ -0,0 +1,4 @@
+"""Reproducible benchmarks for the solve, adapt, preprocess and render stages.
+
+Run with `python -m benchmarks.run`; see `benchmarks/run.py` for options.
+"""
@@ -0,0 +1,76 @@
+"""Deterministic puzzle corpus for the benchmarks.
+
+Three families are generated for every size:
+
+- `random`: i.i.d. cells at a fixed density from a seeded generator,
+- `image`: the repository's `input.jpg` scaled (up if need be) and cropped
+  to fill the grid, then binarized by `nonogram_preprocess`,
+- `lattice`: the ambiguous `[2], [1, 1], ..., [2]` family from
+  `interactive_solver`, given only as clues.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from nonogram_clues import extract_clues
+from nonogram_preprocess import binarize_image
+
+SIZES = [10, 25, 50, 100, 200]
+FAMILIES = ["random", "image", "lattice"]
+IMAGE_PATH = Path(__file__).resolve().parent.parent / "input.jpg"
+
+
+@dataclass
+class Puzzle:
+    name: str
+    family: str
+    size: int
+    row_clues: list
+    col_clues: list
+    grid: Optional[np.ndarray] = None
+
+
+def random_grid(size: int, density: float = 0.5, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng([seed, size])
+    return (rng.random((size, size)) < density).astype(np.uint8)
+
+
+def image_grid(size: int, path: Path = IMAGE_PATH) -> np.ndarray:
+    # `load_and_resize` only shrinks and pads; the corpus wants every cell
+    # covered, also at sizes beyond the source resolution
+    with Image.open(path) as source:
+        img = ImageOps.fit(source.convert("L"), (size, size), Image.LANCZOS)
+    binary = np.array(binarize_image(img, method="adaptive", block_size=15, C=3))
+    return (binary == 0).astype(np.uint8)
+
+
+def lattice_clues(size: int):
+    clues = [[2], *[[1, 1] for _ in range(size - 2)], [2]]
+    return clues, [list(c) for c in clues]
+
+
+def build_corpus(
+    sizes: List[int] = SIZES, families: List[str] = FAMILIES, seed: int = 0
+) -> List[Puzzle]:
+    corpus = []
+    for size in sizes:
+        for family in families:
+            grid = None
+            if family == "random":
+                grid = random_grid(size, seed=seed)
+            elif family == "image":
+                grid = image_grid(size)
+            elif family == "lattice":
+                row_clues, col_clues = lattice_clues(size)
+            else:
+                raise ValueError(f"Unknown family: {family}")
+            if grid is not None:
+                row_clues, col_clues = extract_clues(grid)
+            corpus.append(
+                Puzzle(f"{family}-{size}", family, size, row_clues, col_clues, grid)
+            )
+    return corpus
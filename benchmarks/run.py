@@ -0,0 +1,230 @@
+"""Time the pipeline stages on the benchmark corpus.
+
+Usage:
+
+    python -m benchmarks.run --sizes 10 25 50 --output bench.json
+    python -m benchmarks.run --baseline bench.json
+
+Every stage runs in a fresh worker process per grid size, so the peak RSS
+reported for a size is that of the size alone.  Results are reported per stage and grid size as throughput,
+p50/p95 latency and peak RSS, written as JSON.  With `--baseline` the p50
+latencies are compared against a stored report and the exit status is 1 if
+any of them regressed by more than `--threshold`.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.corpus import FAMILIES, IMAGE_PATH, SIZES, build_corpus
+
+STAGES = ["solve", "check_enumerate", "check_disprove", "adapt", "extract_clues", "binarize", "render"]
+# `nonogram_solver.BACKENDS`, or a race of all of them (`solver_portfolio`)
+BACKEND_CHOICES = ["cpsat", "cpsat-lite", "cpsat-placement", "search", "portfolio"]
+
+
+def _stage_calls(stage: str, sizes: List[int], families: List[str], seed: int, args: dict):
+    """Return `(size, callable)` pairs to time for one stage."""
+    from adapt_puzzle import adapt_grid_for_unique_solution
+    from clue_grid import render_clue_grid
+    from nonogram_clues import extract_clues
+    from nonogram_preprocess import binarize_image, load_and_resize
+    from nonogram_solver import solve_nonogram
+
+    corpus = build_corpus(sizes, families, seed)
+    calls = []
+    if stage == "solve":
+        from nonogram_solver import BACKENDS
+        from solver_portfolio import race
+
+        for p in corpus:
+            if args["backend"] == "portfolio":
+                call = lambda p=p: race(p.row_clues, p.col_clues, time_limit=args["time_limit"])
+            else:
+                call = lambda p=p: solve_nonogram(
+                    p.row_clues,
+                    p.col_clues,
+                    2,
+                    time_limit=args["time_limit"],
+                    backend=BACKENDS[args["backend"]],
+                )
+            calls.append((p.size, call))
+    elif stage in ("check_enumerate", "check_disprove"):
+        # the two ways `prove_unique` tells one solution from two, on
+        # `--cp-workers` CP-SAT workers (0: all cores)
+        from nonogram_solver import CpSatBackend, check_unique
+
+        backend = CpSatBackend(
+            parameters={"num_workers": args["cp_workers"]}, method=stage.split("_")[1]
+        )
+        for p in corpus:
+            call = lambda p=p: check_unique(
+                p.row_clues, p.col_clues, time_limit=args["time_limit"], backend=backend
+            )
+            calls.append((p.size, call))
+    elif stage == "adapt":
+        for p in corpus:
+            if p.grid is None:
+                continue
+
+            def adapt(p=p):
+                random.seed(seed)
+                adapt_grid_for_unique_solution(p.grid, max_attempts=args["adapt_attempts"])
+
+            calls.append((p.size, adapt))
+    elif stage == "extract_clues":
+        for p in corpus:
+            if p.grid is not None:
+                calls.append((p.size, lambda p=p: extract_clues(p.grid)))
+    elif stage == "binarize":
+        for size in sizes:
+            img = load_and_resize(str(IMAGE_PATH), size, size)
+            for method in ("threshold", "adaptive", "otsu", "canny"):
+                calls.append((size, lambda img=img, m=method: binarize_image(img, method=m)))
+    elif stage == "render":
+        for p in corpus:
+            calls.append((p.size, lambda p=p: render_clue_grid(p.row_clues, p.col_clues)))
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+    return calls
+
+
+def run_stage(stage: str, sizes: List[int], families: List[str], seed: int, repeat: int, args: dict) -> dict:
+    """Run one stage and return its per-size statistics (in a worker).
+
+    `peak_rss_mb` is the peak of the whole process, so callers run one size
+    per process.
+    """
+    from solution_cache import set_default_cache
+
+    # cached verdicts would turn the solve stage into a lookup benchmark
+    set_default_cache(None)
+    calls = _stage_calls(stage, sizes, families, seed, args)
+    latencies: Dict[int, List[float]] = {}
+    for _ in range(repeat):
+        for size, call in calls:
+            start = time.perf_counter()
+            call()
+            latencies.setdefault(size, []).append(time.perf_counter() - start)
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+    report = {}
+    for size, samples in sorted(latencies.items()):
+        samples_ms = np.array(samples) * 1000
+        report[str(size)] = {
+            "count": len(samples),
+            "throughput": len(samples) / max(sum(samples), 1e-12),
+            "p50_ms": float(np.percentile(samples_ms, 50)),
+            "p95_ms": float(np.percentile(samples_ms, 95)),
+            "peak_rss_mb": rss_mb,
+        }
+    return report
+
+
+def run(stages: List[str], sizes: List[int], families: List[str], seed: int, repeat: int, args: dict) -> dict:
+    import ortools
+
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for stage in stages:
+        print(f"Running {stage}...", file=sys.stderr)
+        results[stage] = {}
+        for size in sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                results[stage].update(
+                    pool.submit(run_stage, stage, [size], families, seed, repeat, args).result()
+                )
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "ortools": ortools.__version__,
+            "machine": platform.machine(),
+            "sizes": sizes,
+            "families": families,
+            "seed": seed,
+            "repeat": repeat,
+            **args,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """Print p50 ratios against `baseline`; return the regressed entries."""
+    regressions = []
+    print(f"{'stage':15} {'size':>5} {'base p50':>10} {'p50':>10} {'ratio':>7}")
+    for stage, per_size in report["results"].items():
+        for size, stats in per_size.items():
+            old = baseline.get("results", {}).get(stage, {}).get(size)
+            if old is None:
+                continue
+            ratio = stats["p50_ms"] / max(old["p50_ms"], 1e-9)
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{stage}/{size}")
+            print(f"{stage:15} {size:>5} {old['p50_ms']:10.2f} {stats['p50_ms']:10.2f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark the nonogram pipeline stages")
+    p.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    p.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    p.add_argument('--families', nargs='+', choices=FAMILIES, default=FAMILIES)
+    p.add_argument('--repeat', type=int, default=3, help="Timed runs per puzzle")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--adapt-attempts', type=int, default=20, help="max_attempts for the adapt stage")
+    p.add_argument('--time-limit', type=float, default=None, help="Per-puzzle time_limit for the solve and check stages")
+    p.add_argument('--backend', choices=BACKEND_CHOICES, default="cpsat", help="Engine for the solve stage")
+    p.add_argument('--cp-workers', type=int, default=1, help="CP-SAT workers for the check stages (0: all cores)")
+    p.add_argument('--output', help="Write the JSON report here instead of stdout")
+    p.add_argument('--baseline', help="Compare against a stored JSON report")
+    p.add_argument('--threshold', type=float, default=0.2, help="Allowed p50 slowdown vs baseline")
+    return p.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    report = run(
+        args.stages,
+        args.sizes,
+        args.families,
+        args.seed,
+        args.repeat,
+        {
+            "adapt_attempts": args.adapt_attempts,
+            "time_limit": args.time_limit,
+            "backend": args.backend,
+            "cp_workers": args.cp_workers,
+        },
+    )
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,83 +2,270 @@
 
 `render_clue_grid` can optionally embed a preview of the puzzle image
 in the top-left corner beneath the dimensions label.
+
+The raster renderer works on a NumPy canvas: grid lines are written as
+array slices, and every distinct clue number is rasterized once into a
+glyph tile that is then blended in at all of its positions.  Preview
+thumbnails of image files are cached too, so rendering many puzzles of the
+same image decodes it once.  `render_clue_grid_svg` draws the same layout
+as an SVG document whose size depends on the number of clues, not on the
+resolution.
 """
 
-from typing import List, Optional
-from PIL import Image, ImageDraw, ImageFont
+import base64
+import io
+import os
+from typing import List, Optional, Union
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont
 from PIL.Image import Resampling
 
+from nonogram_automaton import LRUCache
+
+BACKGROUND = "lavenderblush"
+LABEL_COLOR = "darkblue"
+
+PreviewLike = Union[np.ndarray, Image.Image]
+
+# glyph alpha masks keyed by (font, text); preview thumbnails keyed by file
+_GLYPHS = LRUCache(1024)
+_PREVIEWS = LRUCache(64)
+_FONT: Optional[ImageFont.ImageFont] = None
+
+
+def _default_font() -> ImageFont.ImageFont:
+    """Return PIL's default font, loaded once so glyph cache keys stay valid."""
+    global _FONT
+    if _FONT is None:
+        _FONT = ImageFont.load_default()
+    return _FONT
+
+
+def _font_key(font: ImageFont.ImageFont) -> tuple:
+    # FreeType fonts are identified by name and size; bitmap fonts only by
+    # object, which is fine as long as the caller keeps the font alive
+    if isinstance(font, ImageFont.FreeTypeFont):
+        return (*font.getname(), font.size)
+    return (id(font),)
+
+
+def choose_color(idx: int, max_idx: int) -> str:
+    if idx == max_idx // 2:
+        return "mediumorchid"
+    if idx % 5 == 0:
+        return "darkviolet"
+    if idx % 2 == 0:
+        return "pink"
+    return "gray"
+
+
+def _glyph(font: ImageFont.ImageFont, text: str) -> np.ndarray:
+    """Return the alpha mask `draw.text((0, 0), text)` would paint."""
+
+    def build() -> np.ndarray:
+        _, _, right, bottom = font.getbbox(text)
+        mask = Image.new("L", (max(right, 1), max(bottom, 1)), 0)
+        ImageDraw.Draw(mask).text((0, 0), text, fill=255, font=font)
+        return np.asarray(mask, dtype=np.uint16)
+
+    return _GLYPHS.get_or_build((*_font_key(font), text), build)
+
+
+def _blend_glyphs(canvas: np.ndarray, font, placements: dict, cell_size: int) -> None:
+    """Draw black text at many positions; `placements` maps text -> [(x, y)].
+
+    Positions are on a grid of `cell_size`; copies of a glyph wider or taller
+    than a cell overlap and must be blended one after another.
+    """
+    height, width = canvas.shape[:2]
+    for text, positions in placements.items():
+        alpha = _glyph(font, text)
+        gh, gw = alpha.shape
+        xy = np.asarray(positions)
+        # glyphs sticking out of the canvas are rare; draw those one by one
+        inside = (xy[:, 0] + gw <= width) & (xy[:, 1] + gh <= height)
+        if gw > cell_size or gh > cell_size:
+            inside[:] = False
+        xs, ys = xy[inside, 0], xy[inside, 1]
+        if len(xs):
+            rows = ys[:, None, None] + np.arange(gh)[None, :, None]
+            cols = xs[:, None, None] + np.arange(gw)[None, None, :]
+            region = canvas[rows, cols].astype(np.uint16)
+            canvas[rows, cols] = (region * (255 - alpha)[..., None] + 127) // 255
+        for x, y in xy[~inside].tolist():
+            h, w = min(gh, height - y), min(gw, width - x)
+            region = canvas[y:y + h, x:x + w].astype(np.uint16)
+            canvas[y:y + h, x:x + w] = (region * (255 - alpha[:h, :w])[..., None] + 127) // 255
+
+
+def _preview_thumbnail(
+    preview: Optional[PreviewLike], image_path: Optional[str], max_w: int, max_h: int
+) -> Optional[Image.Image]:
+    if preview is not None:
+        img = preview if isinstance(preview, Image.Image) else Image.fromarray(preview)
+        img = img.convert("RGB")
+        img.thumbnail((max_w, max_h), Resampling.NEAREST)
+        return img
+
+    def build() -> Image.Image:
+        img = Image.open(image_path).convert("RGB")
+        img.thumbnail((max_w, max_h), Resampling.NEAREST)
+        return img
+
+    key = (os.path.abspath(image_path), os.stat(image_path).st_mtime_ns, max_w, max_h)
+    return _PREVIEWS.get_or_build(key, build)
+
+
+def _layout(row_clues: List[List[int]], col_clues: List[List[int]], cell_size: int):
+    rows, cols = len(row_clues), len(col_clues)
+    row_pad = max(len(c) for c in row_clues)
+    col_pad = max(len(c) for c in col_clues)
+    grid_width = (row_pad + cols) * cell_size
+    grid_height = (col_pad + rows) * cell_size
+    pad = cell_size // 2  # extra space on bottom/right
+    return rows, cols, row_pad, col_pad, grid_width, grid_height, pad
+
+
+def _clue_positions(row_clues, col_clues, cell_size, row_pad, col_pad):
+    """Yield `(text, x, y)` for every clue number (top-left of the text)."""
+    for i, clues in enumerate(row_clues):
+        for k, num in enumerate(reversed(clues)):
+            yield str(num), (row_pad - 1 - k) * cell_size + 4, (col_pad + i) * cell_size + 4
+    for j, clues in enumerate(col_clues):
+        for k, num in enumerate(reversed(clues)):
+            yield str(num), (row_pad + j) * cell_size + 4, (col_pad - 1 - k) * cell_size + 4
+
 
 def render_clue_grid(
     row_clues: List[List[int]],
     col_clues: List[List[int]],
     cell_size: int = 20,
     image_path: Optional[str] = None,
+    preview: Optional[PreviewLike] = None,
 ) -> Image.Image:
-    """Return an image visualizing the puzzle clues with nicer styling."""
-    rows, cols = len(row_clues), len(col_clues)
-    row_pad = max(len(c) for c in row_clues)
-    col_pad = max(len(c) for c in col_clues)
+    """Return an image visualizing the puzzle clues with nicer styling.
 
-    grid_width = (row_pad + cols) * cell_size
-    grid_height = (col_pad + rows) * cell_size
-    pad = cell_size // 2  # extra space on bottom/right
+    The preview is taken from `preview` (an already decoded image or array)
+    if given, otherwise from the file at `image_path`.
+    """
+    rows, cols, row_pad, col_pad, grid_width, grid_height, pad = _layout(
+        row_clues, col_clues, cell_size
+    )
+    width, height = grid_width + pad, grid_height + pad
 
-    img = Image.new("RGB", (grid_width + pad, grid_height + pad), "lavenderblush")
-    draw = ImageDraw.Draw(img)
-    font = ImageFont.load_default()
+    # Grid lines with alternating colors; vertical lines are drawn last.
+    # Rows are copied from template rows, which is much faster than filling
+    # the canvas with a color.
+    x0, y0 = row_pad * cell_size, col_pad * cell_size
+    xs = (row_pad + np.arange(cols + 1)) * cell_size
+    ys = (col_pad + np.arange(rows + 1)) * cell_size
+    v_colors = np.array([ImageColor.getrgb(choose_color(j, cols)) for j in range(cols + 1)], np.uint8)
+    h_colors = np.array([ImageColor.getrgb(choose_color(i, rows)) for i in range(rows + 1)], np.uint8)
+    xs, v_colors = xs[xs < width], v_colors[xs < width]
+    ys, h_colors = ys[ys < height], h_colors[ys < height]
 
+    background = np.tile(np.array(ImageColor.getrgb(BACKGROUND), np.uint8), (width, 1))
+    canvas = np.empty((height, width, 3), dtype=np.uint8)
+    canvas[:] = background
+    crossing = background.copy()
+    crossing[xs] = v_colors
+    canvas[y0:grid_height + 1] = crossing
+    canvas[ys, x0:grid_width + 1] = h_colors[:, None, :]
+    canvas[np.ix_(ys, xs)] = v_colors[None, :, :]
+
+    font = _default_font()
+
+    placements: dict = {}
+    for text, x, y in _clue_positions(row_clues, col_clues, cell_size, row_pad, col_pad):
+        placements.setdefault(text, []).append((x, y))
+    _blend_glyphs(canvas, font, placements, cell_size)
+
+    img = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(img)
     # Dimensions label in the top-left corner
-    draw.text((4, 4), f"{rows}x{cols}", fill="darkblue", font=font)
+    draw.text((4, 4), f"{rows}x{cols}", fill=LABEL_COLOR, font=font)
 
     bbox = draw.textbbox((0, 0), "A", font=font)
     preview_y = bbox[3] + 6
-    if image_path:
-        try:
-            preview = Image.open(image_path).convert("RGB")
-            max_w = row_pad * cell_size
-            max_h = col_pad * cell_size - preview_y - 4
-            if max_w > 5 and max_h > 5:
-                preview.thumbnail((max_w, max_h), Resampling.NEAREST)
-                img.paste(preview, (4, preview_y))
-        except Exception as e:
-            print(f"Failed to load image preview from {image_path}: {e}")
-
-    def choose_color(idx: int, max_idx: int) -> str:
-        if idx == max_idx // 2:
-            return "mediumorchid"
-        if idx % 5 == 0:
-            return "darkviolet"
-        if idx % 2 == 0:
-            return "pink"
-        return "gray"
-
-    # Draw grid lines with alternating colors
+    if preview is not None or image_path:
+        max_w = row_pad * cell_size
+        max_h = col_pad * cell_size - preview_y - 4
+        if max_w > 5 and max_h > 5:
+            try:
+                thumb = _preview_thumbnail(preview, image_path, max_w, max_h)
+                img.paste(thumb, (4, preview_y))
+            except Exception as e:
+                print(f"Failed to load image preview from {image_path}: {e}")
+    return img
+
+
+def render_clue_grid_svg(
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    cell_size: int = 20,
+    image_path: Optional[str] = None,
+    preview: Optional[PreviewLike] = None,
+) -> str:
+    """Return the clue grid as an SVG document.
+
+    Same layout as `render_clue_grid`; lines of one color share a path and
+    the preview, if any, is embedded as a small PNG thumbnail.
+    """
+    rows, cols, row_pad, col_pad, grid_width, grid_height, pad = _layout(
+        row_clues, col_clues, cell_size
+    )
+    width, height = grid_width + pad, grid_height + pad
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" shape-rendering="crispEdges">',
+        f'<rect width="100%" height="100%" fill="{BACKGROUND}"/>',
+    ]
+
+    paths: dict = {}
     for i in range(rows + 1):
-        y = (col_pad + i) * cell_size
-        draw.line(
-            [(row_pad * cell_size, y), (grid_width, y)],
-            fill=choose_color(i, rows),
+        y = (col_pad + i) * cell_size + 0.5
+        paths.setdefault(choose_color(i, rows), []).append(
+            f"M{row_pad * cell_size} {y}H{grid_width + 1}"
         )
     for j in range(cols + 1):
-        x = (row_pad + j) * cell_size
-        draw.line(
-            [(x, col_pad * cell_size), (x, grid_height)],
-            fill=choose_color(j, cols),
+        x = (row_pad + j) * cell_size + 0.5
+        paths.setdefault(choose_color(j, cols), []).append(
+            f"M{x} {col_pad * cell_size}V{grid_height + 1}"
         )
+    for color, segments in paths.items():
+        parts.append(f'<path stroke="{color}" d="{"".join(segments)}"/>')
 
-    # Draw row clues
-    for i, clues in enumerate(row_clues):
-        for k, num in enumerate(reversed(clues)):
-            x = (row_pad - 1 - k) * cell_size + 4
-            y = (col_pad + i) * cell_size + 4
-            draw.text((x, y), str(num), fill="black", font=font)
+    font_size = 10
+    parts.append(
+        f'<g font-family="sans-serif" font-size="{font_size}" dominant-baseline="hanging">'
+    )
+    parts.append(f'<text x="4" y="4" fill="{LABEL_COLOR}">{rows}x{cols}</text>')
+    for text, x, y in _clue_positions(row_clues, col_clues, cell_size, row_pad, col_pad):
+        parts.append(f'<text x="{x}" y="{y}">{text}</text>')
+    parts.append("</g>")
 
-    # Draw column clues
-    for j, clues in enumerate(col_clues):
-        for k, num in enumerate(reversed(clues)):
-            x = (row_pad + j) * cell_size + 4
-            y = (col_pad - 1 - k) * cell_size + 4
-            draw.text((x, y), str(num), fill="black", font=font)
+    if preview is not None or image_path:
+        preview_y = font_size + 8
+        max_w = row_pad * cell_size
+        max_h = col_pad * cell_size - preview_y - 4
+        if max_w > 5 and max_h > 5:
+            thumb = _preview_thumbnail(preview, image_path, max_w, max_h)
+            buffer = io.BytesIO()
+            thumb.save(buffer, format="PNG")
+            data = base64.b64encode(buffer.getvalue()).decode()
+            parts.append(
+                f'<image x="4" y="{preview_y}" width="{thumb.width}" height="{thumb.height}" '
+                f'href="data:image/png;base64,{data}"/>'
+            )
+    parts.append("</svg>")
+    return "\n".join(parts)
 
-    return img
+
+def save_clue_grid(path: str, row_clues: List[List[int]], col_clues: List[List[int]], **kwargs) -> None:
+    """Render to `path`, as SVG if it ends in `.svg` and as a raster image otherwise."""
+    if path.lower().endswith(".svg"):
+        with open(path, "w") as f:
+            f.write(render_clue_grid_svg(row_clues, col_clues, **kwargs))
+    else:
+        render_clue_grid(row_clues, col_clues, **kwargs).save(path)
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 """Interactive nonogram solver demo."""
 
-from nonogram_solver import solve_nonogram
+import threading
+
+from nonogram_solver import Verdict, check_unique
 
 
 def print_grid(grid, title="Grid"):
@@ -40,6 +42,58 @@ def input_clues(dimension_name):
     return clues
 
 
+def input_time_limit():
+    """Ask for a time limit in seconds; None if left empty."""
+    while True:
+        limit = input("Time limit in seconds (empty for none): ").strip()
+        if not limit:
+            return None
+        try:
+            time_limit = float(limit)
+        except ValueError:
+            print("Invalid input. Please enter a number of seconds.")
+            continue
+        if time_limit > 0:
+            return time_limit
+        print("Invalid input. The time limit must be positive.")
+
+
+def show_progress(info):
+    """Print a one-line status while the solver is running."""
+    print(f"\r  {info['phase']}... {info['elapsed']:.1f}s", end="", flush=True)
+
+
+def solve_with_feedback(row_clues, col_clues, time_limit=None):
+    """Run `check_unique` in the background; Ctrl-C cancels the search."""
+    cancel = threading.Event()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = check_unique(
+                row_clues,
+                col_clues,
+                time_limit=time_limit,
+                cancel=cancel,
+                progress=show_progress,
+            )
+        except Exception as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    while worker.is_alive():
+        try:
+            worker.join(0.1)
+        except KeyboardInterrupt:
+            print("\n  Cancelling...")
+            cancel.set()
+    print()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
 def main():
     """Interactive nonogram solver."""
     print("Interactive Nonogram Solver")
@@ -114,12 +168,19 @@ def main():
         print("Invalid choice. Exiting.")
         return
 
+    time_limit = input_time_limit()
+
     # Solve the puzzle
-    print("\nSolving...")
+    print("\nSolving... (Ctrl-C to cancel)")
     try:
-        solutions = solve_nonogram(row_clues, col_clues, max_solutions=2)
-
-        if not solutions:
+        result = solve_with_feedback(row_clues, col_clues, time_limit)
+        solutions = result.solutions
+
+        if result.verdict is Verdict.UNKNOWN:
+            print("Gave up before the puzzle was decided.")
+            if solutions:
+                print_grid(solutions[0], "Solution found so far (uniqueness not proven)")
+        elif not solutions:
             print("No solution found. The puzzle may be unsolvable.")
         elif len(solutions) == 1:
             print("Found unique solution!")
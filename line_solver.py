@@ -0,0 +1,387 @@
+"""Line-by-line deduction for nonogram puzzles.
+
+Every row and column is solved on its own: first with the left-most /
+right-most block placement overlap, then with a DP over the clue automaton
+that marks which cells can still be 0 and which can still be 1.  Lines whose
+cells change are queued again until a fixpoint is reached.  Most
+image-derived puzzles are fully settled here; whatever is left over is
+handed to CP-SAT by `nonogram_solver.solve_nonogram`.
+
+Cells are encoded as 1 (filled), 0 (empty) and `UNKNOWN` (-1).
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from nonogram_automaton import Automaton, compile_automaton, normalize_clues
+
+UNKNOWN = -1
+
+Line = List[int]
+Segment = Tuple[int, int, Tuple[int, ...]]
+
+
+def leftmost_starts(clues: Sequence[int]) -> List[int]:
+    """Return the start of every block when all blocks are pushed left."""
+    starts = []
+    pos = 0
+    for run in clues:
+        starts.append(pos)
+        pos += run + 1
+    return starts
+
+
+def rightmost_starts(clues: Sequence[int], length: int) -> List[int]:
+    """Return the start of every block when all blocks are pushed right."""
+    starts = []
+    pos = length
+    for run in reversed(clues):
+        pos -= run
+        starts.append(pos)
+        pos -= 1
+    return starts[::-1]
+
+
+def overlap_line(clues: Sequence[int], length: int) -> Optional[Line]:
+    """Deduce cells of an empty line from the left-most/right-most overlap."""
+    clues = normalize_clues(clues)
+    if sum(clues) + len(clues) - 1 > length:
+        return None
+    line = [0] * length
+    if not clues:
+        return line
+    left = leftmost_starts(clues)
+    right = rightmost_starts(clues, length)
+    for run, lo, hi in zip(clues, left, right):
+        for i in range(lo, hi + run):
+            line[i] = UNKNOWN
+    for run, lo, hi in zip(clues, left, right):
+        for i in range(hi, lo + run):
+            line[i] = 1
+    return line
+
+
+def solve_line(clues: Sequence[int], line: Sequence[int]) -> Optional[Line]:
+    """Return `line` with every cell forced by `clues` filled in.
+
+    Returns None if no placement of the clues is consistent with the known
+    cells of `line`.
+    """
+    return _solve_line(compile_automaton(clues), line)
+
+
+def _solve_line(automaton: Automaton, line: Sequence[int]) -> Optional[Line]:
+    zero_loop = automaton.zero_loop
+    zero_step = automaton.zero_step
+    one_step = automaton.one_step
+    n = len(line)
+
+    # forward pass: states reachable after reading each prefix
+    reach = [0] * (n + 1)
+    reach[0] = states = 1
+    for i, v in enumerate(line):
+        nxt = 0
+        if v != 1:
+            nxt |= (states & zero_loop) | ((states & zero_step) << 1)
+        if v != 0:
+            nxt |= (states & one_step) << 1
+        if not nxt:
+            return None
+        reach[i + 1] = states = nxt
+    accept = 1 << automaton.final_state
+    if not states & accept:
+        return None
+
+    # backward pass: states from which the rest of the line can be accepted
+    out = list(line)
+    co = accept
+    for i in range(n - 1, -1, -1):
+        states = reach[i]
+        v = line[i]
+        can0 = v != 1 and bool(
+            ((states & zero_loop) | ((states & zero_step) << 1)) & co
+        )
+        can1 = v != 0 and bool(((states & one_step) << 1) & co)
+        if can0 and can1:
+            out[i] = UNKNOWN
+        elif can1:
+            out[i] = 1
+        elif can0:
+            out[i] = 0
+        else:
+            return None
+        prev = 0
+        if v != 1:
+            prev |= (co & zero_loop) | ((co >> 1) & zero_step)
+        if v != 0:
+            prev |= (co >> 1) & one_step
+        co = prev
+    return out
+
+
+def propagate(
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    grid: Optional[np.ndarray] = None,
+) -> Optional[np.ndarray]:
+    """Run line deduction to a fixpoint.
+
+    `grid` optionally holds cells that are already known (`UNKNOWN`
+    elsewhere).  Returns an int8 array with every deducible cell set, or
+    None if the clues contradict each other.
+    """
+    h, w = len(row_clues), len(col_clues)
+    rows = [normalize_clues(c) for c in row_clues]
+    cols = [normalize_clues(c) for c in col_clues]
+    if sum(map(sum, rows)) != sum(map(sum, cols)):
+        return None
+    row_automata = [compile_automaton(c) for c in rows]
+    col_automata = [compile_automaton(c) for c in cols]
+
+    if grid is None:
+        cells = []
+        for clues in rows:
+            line = overlap_line(clues, w)
+            if line is None:
+                return None
+            cells.append(line)
+        for c, clues in enumerate(cols):
+            line = overlap_line(clues, h)
+            if line is None:
+                return None
+            for r, v in enumerate(line):
+                if v == UNKNOWN:
+                    continue
+                if cells[r][c] == UNKNOWN:
+                    cells[r][c] = v
+                elif cells[r][c] != v:
+                    return None
+    else:
+        cells = np.asarray(grid, dtype=np.int8).tolist()
+
+    # dirty-line queue; index r < h is a row, h + c is column c
+    queue = deque(range(h + w))
+    queued = [True] * (h + w)
+    while queue:
+        idx = queue.popleft()
+        queued[idx] = False
+        if idx < h:
+            line = cells[idx]
+            new = _solve_line(row_automata[idx], line)
+            if new is None:
+                return None
+            for c in range(w):
+                if new[c] != line[c]:
+                    line[c] = new[c]
+                    if not queued[h + c]:
+                        queued[h + c] = True
+                        queue.append(h + c)
+        else:
+            c = idx - h
+            line = [cells[r][c] for r in range(h)]
+            new = _solve_line(col_automata[c], line)
+            if new is None:
+                return None
+            for r in range(h):
+                if new[r] != line[r]:
+                    cells[r][c] = new[r]
+                    if not queued[r]:
+                        queued[r] = True
+                        queue.append(r)
+
+    return np.array(cells, dtype=np.int8).reshape(h, w)
+
+
+def search(
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    fixed: Optional[np.ndarray] = None,
+    stop: Optional[Callable[[], bool]] = None,
+    stats: Optional[Dict[str, float]] = None,
+) -> Iterator[np.ndarray]:
+    """Yield the solutions of a puzzle by depth-first search.
+
+    Every node fixes one open cell (in the line with the fewest open cells)
+    and runs `propagate` again, so only the choices line deduction cannot
+    make are branched on.  `fixed` is an already propagated grid to start
+    from.  The search ends early once `stop()` returns True; `stats["nodes"]`
+    counts the visited nodes.
+    """
+    if fixed is None:
+        fixed = propagate(row_clues, col_clues)
+    stack = [] if fixed is None else [fixed]
+    nodes = 0
+    try:
+        while stack:
+            if stop is not None and stop():
+                return
+            grid = stack.pop()
+            nodes += 1
+            open_cells = grid == UNKNOWN
+            if not open_cells.any():
+                yield grid.astype(np.uint8)
+                continue
+            per_row = open_cells.sum(axis=1)
+            r = int(np.argmin(np.where(per_row > 0, per_row, grid.shape[1] + 1)))
+            c = int(np.argmax(open_cells[r]))
+            # push 0 first so the filled branch is explored first
+            for value in (0, 1):
+                child = grid.copy()
+                child[r, c] = value
+                child = propagate(row_clues, col_clues, child)
+                if child is not None:
+                    stack.append(child)
+    finally:
+        if stats is not None:
+            stats["nodes"] = stats.get("nodes", 0) + nodes
+
+
+def unknown_components(fixed: np.ndarray) -> List[np.ndarray]:
+    """Group the `UNKNOWN` cells of a propagated grid into independent parts.
+
+    Two open cells belong to the same part when they share a row or a column
+    (directly or through other open cells); no clue constrains cells of two
+    different parts together.  Returns one `(n, 2)` array of `(row, col)`
+    indices per part, largest first.
+    """
+    cells = np.argwhere(fixed == UNKNOWN)
+    h = fixed.shape[0]
+    # union-find over lines: a row r is node r, a column c is node h + c
+    parent = list(range(h + fixed.shape[1]))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for r, c in cells.tolist():
+        a, b = find(r), find(h + c)
+        if a != b:
+            parent[a] = b
+    roots = np.array([find(r) for r in cells[:, 0].tolist()], dtype=np.int64)
+    parts = [cells[roots == root] for root in np.unique(roots)]
+    parts.sort(key=len, reverse=True)
+    return parts
+
+
+def split_line(clues: Sequence[int], line: Sequence[int]) -> List[Segment]:
+    """Split a partly solved line at its known empty cells.
+
+    Returns `(start, stop, clues)` for every maximal run of cells not known
+    to be empty, if the blocks can be dealt out to those runs in only one
+    way.  Otherwise the line stays whole: `[(0, len(line), clues)]`.
+    """
+    clues = normalize_clues(clues)
+    n = len(line)
+    runs = []
+    start = None
+    for i, v in enumerate(list(line) + [0]):
+        if v != 0 and start is None:
+            start = i
+        elif v == 0 and start is not None:
+            runs.append((start, i))
+            start = None
+    if len(runs) <= 1:
+        return [(lo, hi, clues) for lo, hi in runs]
+
+    # ways[s][a]: number of ways (capped at 2) to place blocks a.. in runs s..
+    b_count, s_count = len(clues), len(runs)
+    ways = [[0] * (b_count + 1) for _ in range(s_count + 1)]
+    ways[s_count][b_count] = 1
+    choice = [[0] * (b_count + 1) for _ in range(s_count)]
+    for s in reversed(range(s_count)):
+        lo, hi = runs[s]
+        for a in range(b_count + 1):
+            total = 0
+            need = -1
+            for b in range(a, b_count + 1):
+                if b > a:
+                    need += clues[b - 1] + 1
+                    if need > hi - lo:
+                        break
+                if ways[s + 1][b] and solve_line(clues[a:b], line[lo:hi]) is not None:
+                    total += ways[s + 1][b]
+                    choice[s][a] = b
+                    if total > 1:
+                        break
+            ways[s][a] = min(total, 2)
+    if ways[0][0] != 1:
+        return [(0, n, clues)]
+
+    segments = []
+    a = 0
+    for s, (lo, hi) in enumerate(runs):
+        b = choice[s][a]
+        segments.append((lo, hi, clues[a:b]))
+        a = b
+    return segments
+
+
+@dataclass
+class Part:
+    """Open cells of a propagated grid that can be solved on their own.
+
+    `cells` holds `(row, col)` indices; `lines` pairs the `(k, 2)` cell
+    indices of every line segment crossing them with that segment's clues.
+    """
+
+    cells: np.ndarray
+    lines: List[Tuple[np.ndarray, Tuple[int, ...]]]
+
+
+def independent_parts(
+    row_clues: List[List[int]], col_clues: List[List[int]], fixed: np.ndarray
+) -> List[Part]:
+    """Split the open cells of a propagated grid into independent parts.
+
+    Lines are first cut at their known empty cells with `split_line`, so
+    two blobs sharing rows but separated by an empty column still come
+    apart when the row clues say which blocks belong to which blob.  Parts
+    are returned largest first.
+    """
+    h, w = fixed.shape
+    open_cells = fixed == UNKNOWN
+    segments: List[Tuple[np.ndarray, Tuple[int, ...]]] = []
+    row_node = np.full((h, w), -1, dtype=np.int64)
+    col_node = np.full((h, w), -1, dtype=np.int64)
+    for r in np.flatnonzero(open_cells.any(axis=1)).tolist():
+        for lo, hi, clues in split_line(row_clues[r], fixed[r].tolist()):
+            if open_cells[r, lo:hi].any():
+                row_node[r, lo:hi] = len(segments)
+                cols = np.arange(lo, hi)
+                segments.append((np.stack([np.full_like(cols, r), cols], axis=1), clues))
+    for c in np.flatnonzero(open_cells.any(axis=0)).tolist():
+        for lo, hi, clues in split_line(col_clues[c], fixed[:, c].tolist()):
+            if open_cells[lo:hi, c].any():
+                col_node[lo:hi, c] = len(segments)
+                rows = np.arange(lo, hi)
+                segments.append((np.stack([rows, np.full_like(rows, c)], axis=1), clues))
+
+    parent = list(range(len(segments)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    cells = np.argwhere(open_cells)
+    for a, b in zip(row_node[open_cells].tolist(), col_node[open_cells].tolist()):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[a] = b
+    cell_roots = np.array([find(a) for a in row_node[open_cells].tolist()], dtype=np.int64)
+    segment_roots = [find(i) for i in range(len(segments))]
+    parts = [
+        Part(
+            cells[cell_roots == root],
+            [seg for seg, seg_root in zip(segments, segment_roots) if seg_root == root],
+        )
+        for root in np.unique(cell_roots).tolist()
+    ]
+    parts.sort(key=lambda part: len(part.cells), reverse=True)
+    return parts
@@ -0,0 +1,147 @@
+"""Compiled clue automata shared by the CP-SAT model and the line solver.
+
+A line with clues `[3, 2]` is accepted by the automaton
+`0* 1 1 1 0+ 1 1 0*`.  Building it is cheap but happens for every row and
+column of every solve, and image puzzles repeat the same clues constantly,
+so compiled automata are kept in a process-wide LRU cache keyed by the clue
+tuple.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, NamedTuple, Sequence, Tuple
+
+
+class Automaton(NamedTuple):
+    """Immutable automaton for one clue tuple.
+
+    `transitions`, `initial_state`, `num_states` and `final_states` are in
+    the form `CpModel.AddAutomaton` expects (the last state is a sink so
+    every `(state, label)` pair has a transition).  `zero_loop`, `zero_step`
+    and `one_step` are bitmasks of the states that loop on 0, advance on 0
+    and advance on 1, used by the line solver to step sets of states.
+    """
+
+    transitions: Tuple[Tuple[int, int, int], ...]
+    initial_state: int
+    num_states: int
+    final_states: Tuple[int, ...]
+    zero_loop: int
+    zero_step: int
+    one_step: int
+
+    @property
+    def final_state(self) -> int:
+        return self.final_states[0]
+
+
+class LRUCache:
+    """Small thread-safe LRU cache with hit/miss/eviction counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], object]) -> object:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                pass
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = build()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+_CACHE = LRUCache(maxsize=4096)
+
+
+def normalize_clues(clues: Sequence[int]) -> Tuple[int, ...]:
+    """Return clues as a tuple with empty lines written as `()`."""
+    return tuple(int(c) for c in clues if c)
+
+
+def _build_automaton(clues: Tuple[int, ...]) -> Automaton:
+    base = []
+    zero_loop = zero_step = one_step = 0
+    state = 0
+
+    for idx, run in enumerate(clues):
+        # leading zeros or zeros between runs
+        base.append((state, 0, state))
+        zero_loop |= 1 << state
+        for _ in range(run):
+            base.append((state, 1, state + 1))
+            one_step |= 1 << state
+            state += 1
+        if idx < len(clues) - 1:
+            base.append((state, 0, state + 1))
+            zero_step |= 1 << state
+            state += 1
+
+    base.append((state, 0, state))  # trailing zeros
+    zero_loop |= 1 << state
+    final_state = state
+
+    # route every missing (state, label) pair to a sink state
+    trans_map = {(s, a): t for s, a, t in base}
+    sink = final_state + 1
+    for s in range(sink + 1):
+        for a in (0, 1):
+            trans_map.setdefault((s, a), sink)
+
+    return Automaton(
+        transitions=tuple((s, a, t) for (s, a), t in sorted(trans_map.items())),
+        initial_state=0,
+        num_states=sink + 1,
+        final_states=(final_state,),
+        zero_loop=zero_loop,
+        zero_step=zero_step,
+        one_step=one_step,
+    )
+
+
+def compile_automaton(clues: Sequence[int]) -> Automaton:
+    """Return the (cached) automaton accepting lines that match `clues`."""
+    key = normalize_clues(clues)
+    return _CACHE.get_or_build(key, lambda: _build_automaton(key))
+
+
+def cache_stats() -> Dict[str, int]:
+    """Return hit/miss/eviction counters of the automaton cache."""
+    return _CACHE.stats()
+
+
+def clear_cache() -> None:
+    """Drop all cached automata and reset the counters."""
+    _CACHE.clear()
@@ -0,0 +1,143 @@
+"""Thin client for `nonogram_daemon.py`.
+
+Mirrors the existing command lines but sends the work to a running daemon,
+so no heavy module is imported here:
+
+    python nonogram_client.py preprocess input.jpg output.png --grid-size 25
+    python nonogram_client.py clues output.png
+    python nonogram_client.py check output.png
+    python nonogram_client.py adapt output.png adapted.png --max-attempts 10
+    python nonogram_client.py render output.png clues.png
+"""
+
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+from typing import Optional
+
+DEFAULT_URL = os.environ.get("NONOGRAM_DAEMON", "http://127.0.0.1:8765")
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+def submit(kind: str, params: dict, url: str = DEFAULT_URL, timeout: Optional[float] = None):
+    """Run one job on the daemon and return its result."""
+    request = urllib.request.Request(
+        f"{url}/jobs/{kind}",
+        data=json.dumps(params).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.load(response)["result"]
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.load(e)["error"]
+        except ValueError:
+            message = e.reason
+        raise DaemonError(f"{kind} failed ({e.code}): {message}") from None
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Run nonogram jobs on a warm daemon")
+    p.add_argument('--url', default=DEFAULT_URL, help="Daemon address ($NONOGRAM_DAEMON)")
+    sub = p.add_subparsers(dest='command', required=True)
+
+    pre = sub.add_parser('preprocess', help="Same as nonogram_preprocess.py")
+    pre.add_argument('input')
+    pre.add_argument('output')
+    pre.add_argument('--grid-size', type=int, default=25)
+    pre.add_argument('--grid-height', type=int, default=None)
+    pre.add_argument('--no-aspect', action='store_true')
+    pre.add_argument('--method', choices=['threshold', 'adaptive', 'otsu', 'canny'], default='threshold')
+    pre.add_argument('--threshold', type=int, default=128)
+    pre.add_argument('--block-size', type=int, default=11)
+    pre.add_argument('--C', type=int, default=2)
+    pre.add_argument('--erode', type=int, default=0)
+    pre.add_argument('--dilate', type=int, default=0)
+
+    clues = sub.add_parser('clues', help="Same as nonogram_clues.py")
+    clues.add_argument('input')
+
+    check = sub.add_parser('check', help="Check a puzzle image for a unique solution")
+    check.add_argument('input')
+    check.add_argument('--time-limit', type=float, default=None)
+
+    adapt = sub.add_parser('adapt', help="Same as adapt_puzzle.py")
+    adapt.add_argument('input')
+    adapt.add_argument('output')
+    adapt.add_argument('--max-attempts', type=int, default=10)
+    adapt.add_argument('--strategy', choices=['backbone', 'random'], default='backbone')
+    adapt.add_argument('--time-limit', type=float, default=None)
+
+    render = sub.add_parser('render', help="Render the clue grid of a puzzle image")
+    render.add_argument('input')
+    render.add_argument('output')
+    render.add_argument('--cell-size', type=int, default=20)
+    render.add_argument('--preview', default=None, help="Image to embed as a preview")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # the daemon may run in another directory
+    path = os.path.abspath
+    try:
+        if args.command == 'preprocess':
+            submit('preprocess', {
+                "input": path(args.input),
+                "output": path(args.output),
+                "grid_size": args.grid_size,
+                "grid_height": args.grid_height,
+                "maintain_aspect": not args.no_aspect,
+                "method": args.method,
+                "threshold": args.threshold,
+                "block_size": args.block_size,
+                "C": args.C,
+                "erode": args.erode,
+                "dilate": args.dilate,
+            }, args.url)
+        elif args.command == 'clues':
+            result = submit('clues', {"input": path(args.input)}, args.url)
+            print('Grid shape:', tuple(result["grid_shape"]))
+            print('Row clues:', result["row_clues"])
+            print('Column clues:', result["col_clues"])
+        elif args.command == 'check':
+            result = submit(
+                'check', {"input": path(args.input), "time_limit": args.time_limit}, args.url
+            )
+            print(result["verdict"])
+            return 0 if result["verdict"] == "unique" else 1
+        elif args.command == 'adapt':
+            result = submit('adapt', {
+                "input": path(args.input),
+                "output": path(args.output),
+                "max_attempts": args.max_attempts,
+                "strategy": args.strategy,
+                "time_limit": args.time_limit,
+            }, args.url)
+            if result["ok"]:
+                print("Puzzle adapted to unique solution")
+            else:
+                print("Failed to achieve unique solution")
+        else:
+            submit('render', {
+                "input": path(args.input),
+                "output": path(args.output),
+                "cell_size": args.cell_size,
+                "image_path": path(args.preview) if args.preview else None,
+            }, args.url)
+    except (DaemonError, urllib.error.URLError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
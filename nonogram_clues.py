@@ -10,6 +10,28 @@ class NonogramPuzzle:
     grid_shape: tuple
 
 
+@dataclass
+class FlatClues:
+    """Clues of many lines packed into one array.
+
+    The clues of line `i` are `values[offsets[i]:offsets[i + 1]]`; a line
+    without filled cells holds a single 0, like `rle_line` returns `[0]`.
+    """
+    values: np.ndarray
+    offsets: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def line(self, i: int) -> list:
+        return self.values[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+    def to_lists(self) -> list:
+        values = self.values.tolist()
+        bounds = self.offsets.tolist()
+        return [values[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
 def load_grid(path: str) -> np.ndarray:
     """Load a preprocessed nonogram image and return a binary array."""
     img = Image.open(path).convert('L')
@@ -50,11 +72,59 @@ def rle_line(line: np.ndarray) -> list:
     return clues
 
 
-def extract_clues(grid: np.ndarray) -> tuple:
-    """Return row and column clues for the given binary grid."""
-    clues_row = [rle_line(row) for row in grid]
-    clues_col = [rle_line(col) for col in grid.T]
-    return clues_row, clues_col
+def run_lengths(lines: np.ndarray) -> FlatClues:
+    """Run-length encode every row of a 2D binary array at once."""
+    lines = np.asarray(lines)
+    n, w = lines.shape
+    padded = np.zeros((n, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = lines != 0
+    edges = np.diff(padded, axis=1)
+    # nonzero() walks row-major, so starts and ends of the same run line up
+    run_rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    counts = np.bincount(run_rows, minlength=n)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.maximum(counts, 1), out=offsets[1:])
+    first_run = np.cumsum(counts) - counts
+    slot = offsets[run_rows] + np.arange(len(run_rows)) - first_run[run_rows]
+
+    values = np.zeros(offsets[-1], dtype=np.int32)
+    values[slot] = ends - starts
+    return FlatClues(values=values, offsets=offsets)
+
+
+def extract_clues(grid: np.ndarray, flat: bool = False) -> tuple:
+    """Return row and column clues for the given binary grid.
+
+    With `flat=True` both are returned as `FlatClues` instead of lists.
+    """
+    grid = np.asarray(grid)
+    clues_row = run_lengths(grid)
+    clues_col = run_lengths(grid.T)
+    if flat:
+        return clues_row, clues_col
+    return clues_row.to_lists(), clues_col.to_lists()
+
+
+def extract_clues_batch(grids: np.ndarray, flat: bool = False):
+    """Return clues for a stack of equally sized grids (N x H x W).
+
+    Returns a list with one `(clues_row, clues_col)` pair per grid.  With
+    `flat=True` a single `(rows, cols)` pair of `FlatClues` is returned
+    instead, holding the N*H rows and N*W columns grid after grid.
+    """
+    grids = np.asarray(grids)
+    n, h, w = grids.shape
+    rows = run_lengths(grids.reshape(n * h, w))
+    cols = run_lengths(grids.transpose(0, 2, 1).reshape(n * w, h))
+    if flat:
+        return rows, cols
+    row_lists, col_lists = rows.to_lists(), cols.to_lists()
+    return [
+        (row_lists[k * h:(k + 1) * h], col_lists[k * w:(k + 1) * w])
+        for k in range(n)
+    ]
 
 
 def puzzle_from_image(path: str) -> NonogramPuzzle:
@@ -0,0 +1,281 @@
+"""Resident job server for the nonogram tools.
+
+Running `nonogram_preprocess.py`, `adapt_puzzle.py` or `nonogram_clues.py`
+once per file spends most of its time importing cv2, PIL and OR-Tools.
+The daemon imports them once, keeps the automaton and verdict caches warm
+and serves jobs over HTTP on localhost:
+
+    POST /jobs/<kind>   JSON parameters in, {"result": ...} or {"error": ...} out
+    GET  /health        queue and cache statistics
+
+Jobs (`preprocess`, `clues`, `check`, `adapt`, `render`) go through a
+bounded queue to a fixed set of worker threads; when the queue is full the
+request is refused with 503 instead of piling up.  Paths are resolved by
+the daemon, so clients should send absolute paths (`nonogram_client.py`
+does).
+
+    python nonogram_daemon.py --port 8765 --workers 2
+"""
+
+import argparse
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+from PIL import Image
+
+import nonogram_automaton
+from adapt_puzzle import adapt_grid_for_unique_solution
+from clue_grid import save_clue_grid
+from nonogram_clues import extract_clues, load_grid, puzzle_from_image
+from nonogram_preprocess import binarize_image, load_and_resize, post_process
+from nonogram_solver import check_unique
+from solution_cache import default_cache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def job_preprocess(params: dict) -> dict:
+    """Same as `nonogram_preprocess.py`."""
+    grid_size = params.get("grid_size", 25)
+    img = load_and_resize(
+        params["input"],
+        grid_size,
+        params.get("grid_height") or grid_size,
+        maintain_aspect=params.get("maintain_aspect", True),
+    )
+    bin_img = binarize_image(
+        img,
+        method=params.get("method", "threshold"),
+        threshold=params.get("threshold", 128),
+        block_size=params.get("block_size", 11),
+        C=params.get("C", 2),
+    )
+    proc_img = post_process(
+        bin_img, erode_iters=params.get("erode", 0), dilate_iters=params.get("dilate", 0)
+    )
+    proc_img.save(params["output"])
+    return {"output": params["output"]}
+
+
+def job_clues(params: dict) -> dict:
+    """Same as `nonogram_clues.py`."""
+    puzzle = puzzle_from_image(params["input"])
+    return {
+        "grid_shape": list(puzzle.grid_shape),
+        "row_clues": puzzle.clues_row,
+        "col_clues": puzzle.clues_col,
+    }
+
+
+def _clues(params: dict):
+    if "input" in params:
+        return extract_clues(load_grid(params["input"]))
+    return params["row_clues"], params["col_clues"]
+
+
+def job_check(params: dict) -> dict:
+    """`check_unique` on an image (`input`) or on `row_clues`/`col_clues`."""
+    row_clues, col_clues = _clues(params)
+    result = check_unique(row_clues, col_clues, time_limit=params.get("time_limit"))
+    return {
+        "verdict": result.verdict.value,
+        "solutions": result.solutions,
+        "stats": result.stats,
+    }
+
+
+def job_adapt(params: dict) -> dict:
+    """Same as `adapt_puzzle.py`."""
+    grid, ok = adapt_grid_for_unique_solution(
+        load_grid(params["input"]),
+        max_attempts=params.get("max_attempts", 10),
+        strategy=params.get("strategy", "backbone"),
+        time_limit=params.get("time_limit"),
+    )
+    Image.fromarray((1 - grid) * 255).save(params["output"])
+    return {"ok": ok, "output": params["output"]}
+
+
+def job_render(params: dict) -> dict:
+    """Render the clue grid of an image (`input`) or of given clues.
+
+    The output is SVG if its name ends in `.svg`.
+    """
+    if "input" in params:
+        puzzle = puzzle_from_image(params["input"])
+        row_clues, col_clues = puzzle.clues_row, puzzle.clues_col
+    else:
+        row_clues, col_clues = params["row_clues"], params["col_clues"]
+    save_clue_grid(
+        params["output"],
+        row_clues,
+        col_clues,
+        cell_size=params.get("cell_size", 20),
+        image_path=params.get("image_path"),
+    )
+    return {"output": params["output"]}
+
+
+JOBS: Dict[str, Callable[[dict], dict]] = {
+    "preprocess": job_preprocess,
+    "clues": job_clues,
+    "check": job_check,
+    "adapt": job_adapt,
+    "render": job_render,
+}
+
+
+class JobQueue:
+    """Bounded job queue served by a fixed pool of worker threads."""
+
+    def __init__(self, workers: int = 2, maxsize: int = 64):
+        self._queue: "queue.Queue" = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, kind: str, params: dict) -> Future:
+        """Queue a job; raises `KeyError` for unknown kinds, `queue.Full` if busy."""
+        job = JOBS[kind]
+        future: Future = Future()
+        self._queue.put_nowait((job, params, future))
+        return future
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job, params, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(job(params))
+                with self._lock:
+                    self.completed += 1
+            except Exception as e:
+                future.set_exception(e)
+                with self._lock:
+                    self.failed += 1
+
+    def stats(self) -> dict:
+        cache = default_cache()
+        return {
+            "workers": len(self._threads),
+            "queued": self._queue.qsize(),
+            "maxsize": self._queue.maxsize,
+            "completed": self.completed,
+            "failed": self.failed,
+            "automaton_cache": nonogram_automaton.cache_stats(),
+            "verdict_cache": cache.stats() if cache is not None else None,
+        }
+
+    def shutdown(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    server: "DaemonServer"
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._reply(200, self.server.jobs.stats())
+        else:
+            self._reply(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self) -> None:
+        prefix = "/jobs/"
+        if not self.path.startswith(prefix):
+            self._reply(404, {"error": f"Unknown path: {self.path}"})
+            return
+        kind = self.path[len(prefix):]
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+            future = self.server.jobs.submit(kind, params)
+        except KeyError:
+            self._reply(404, {"error": f"Unknown job: {kind}"})
+            return
+        except queue.Full:
+            self._reply(503, {"error": "Job queue is full"})
+            return
+        except ValueError as e:
+            self._reply(400, {"error": f"Invalid JSON: {e}"})
+            return
+        try:
+            self._reply(200, {"result": future.result()})
+        except Exception as e:
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class DaemonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, jobs: JobQueue, verbose: bool = False):
+        super().__init__(address, DaemonHandler)
+        self.jobs = jobs
+        self.verbose = verbose
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    workers: int = 2,
+    queue_size: int = 64,
+    verbose: bool = False,
+    ready: Optional[Callable[[DaemonServer], None]] = None,
+) -> None:
+    """Run the daemon until interrupted; `ready` is called once it listens."""
+    jobs = JobQueue(workers, queue_size)
+    server = DaemonServer((host, port), jobs, verbose)
+    print(f"Listening on http://{host}:{server.server_address[1]} with {workers} workers")
+    if ready is not None:
+        ready(server)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        jobs.shutdown()
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Serve nonogram jobs from a warm process")
+    p.add_argument('--host', default=DEFAULT_HOST, help="Interface to bind (keep it local)")
+    p.add_argument('--port', type=int, default=DEFAULT_PORT)
+    p.add_argument('--workers', type=int, default=2, help="Worker threads")
+    p.add_argument('--queue-size', type=int, default=64, help="Jobs waiting before 503s")
+    p.add_argument('--verbose', action='store_true', help="Log every request")
+    return p.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    serve(args.host, args.port, args.workers, args.queue_size, args.verbose)
@@ -0,0 +1,110 @@
+"""Compact grid representation.
+
+Grids are handled as C-contiguous uint8 arrays (1 = filled).  For storage,
+hashing and fast comparison, rows can additionally be bit-packed into
+uint64 words (`PackedGrid`), 64 cells per word, least significant bit first.
+Nested `List[List[int]]` grids are still accepted everywhere and converted
+with `as_grid_array`.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import List, Union
+
+import numpy as np
+
+Grid = List[List[int]]
+GridLike = Union[Grid, np.ndarray, "PackedGrid"]
+
+
+def as_grid_array(grid: GridLike) -> np.ndarray:
+    """Return `grid` as a 2D C-contiguous uint8 array (no copy if possible)."""
+    if isinstance(grid, PackedGrid):
+        return grid.to_array()
+    return np.ascontiguousarray(grid, dtype=np.uint8)
+
+
+def to_grid_list(grid: GridLike) -> Grid:
+    """Return `grid` as nested lists of Python ints."""
+    return as_grid_array(grid).tolist()
+
+
+def pack_rows(grid: GridLike) -> np.ndarray:
+    """Bit-pack each row into uint64 words; returns shape (h, ceil(w / 64))."""
+    arr = as_grid_array(grid)
+    h, w = arr.shape
+    n_words = max(1, -(-w // 64))
+    packed = np.zeros((h, n_words * 8), dtype=np.uint8)
+    packed[:, : -(-w // 8)] = np.packbits(arr, axis=1, bitorder="little")
+    return packed.view("<u8")
+
+
+def unpack_rows(words: np.ndarray, width: int) -> np.ndarray:
+    """Inverse of `pack_rows`."""
+    words = np.ascontiguousarray(words, dtype="<u8")
+    bits = np.unpackbits(words.view(np.uint8), axis=1, bitorder="little")
+    return np.ascontiguousarray(bits[:, :width])
+
+
+def popcount(words: np.ndarray) -> int:
+    """Return the number of set bits in an array of packed words."""
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum())
+    return int(np.unpackbits(np.ascontiguousarray(words).view(np.uint8)).sum())
+
+
+def diff_mask(a: GridLike, b: GridLike) -> np.ndarray:
+    """Return a boolean array marking the cells where `a` and `b` differ."""
+    return as_grid_array(a) != as_grid_array(b)
+
+
+def diff_count(a: GridLike, b: GridLike) -> int:
+    """Return the number of cells where `a` and `b` differ."""
+    if isinstance(a, PackedGrid) and isinstance(b, PackedGrid):
+        return popcount(a.words ^ b.words)
+    return int(np.count_nonzero(diff_mask(a, b)))
+
+
+def grid_hash(grid: GridLike) -> str:
+    """Return a stable hex digest of the grid's shape and cells."""
+    packed = grid if isinstance(grid, PackedGrid) else PackedGrid.from_array(grid)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.array([packed.height, packed.width], dtype="<u4").tobytes())
+    digest.update(packed.words.tobytes())
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True, eq=False)
+class PackedGrid:
+    """Grid with rows bit-packed into uint64 words."""
+
+    words: np.ndarray
+    width: int
+
+    @classmethod
+    def from_array(cls, grid: GridLike) -> "PackedGrid":
+        arr = as_grid_array(grid)
+        return cls(words=pack_rows(arr), width=arr.shape[1])
+
+    @property
+    def height(self) -> int:
+        return self.words.shape[0]
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    def to_array(self) -> np.ndarray:
+        return unpack_rows(self.words, self.width)
+
+    def count(self) -> int:
+        """Return the number of filled cells."""
+        return popcount(self.words)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PackedGrid):
+            return NotImplemented
+        return self.width == other.width and np.array_equal(self.words, other.words)
+
+    def __hash__(self) -> int:
+        return hash((self.width, self.words.tobytes()))
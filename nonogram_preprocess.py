@@ -3,13 +3,22 @@ import numpy as np
 from PIL import Image, ImageOps
 import cv2
 
+# decodes above this many pixels are refused (about 200 MB as RGB)
+MAX_DECODE_PIXELS = 64_000_000
 
-def load_and_resize(path, grid_width, grid_height, maintain_aspect=True, fill_color=255):
-    """Load image and resize to grid dimensions."""
-    img = Image.open(path)
+
+def resize_to_grid(img, grid_width, grid_height, maintain_aspect=True, fill_color=255):
+    """Resize an opened image to grid dimensions.
+
+    With `maintain_aspect` the image is thumbnailed in place and padded.
+    Grayscale images stay grayscale, anything else is padded onto RGB.
+    """
     if maintain_aspect:
         img.thumbnail((grid_width, grid_height), Image.LANCZOS)
-        background = Image.new('RGB', (grid_width, grid_height), (fill_color, fill_color, fill_color))
+        if img.mode == 'L':
+            background = Image.new('L', (grid_width, grid_height), fill_color)
+        else:
+            background = Image.new('RGB', (grid_width, grid_height), (fill_color, fill_color, fill_color))
         offset = ((grid_width - img.width) // 2, (grid_height - img.height) // 2)
         background.paste(img, offset)
         img = background
@@ -18,10 +27,52 @@ def load_and_resize(path, grid_width, grid_height, maintain_aspect=True, fill_co
     return img
 
 
+def open_reduced(path, width, height, mode=None, reducing_gap=3.0, max_pixels=MAX_DECODE_PIXELS):
+    """Open `path` decoded at roughly `reducing_gap` times `width` x `height`.
+
+    JPEGs are scaled down by up to 8 while decoding (`Image.draft`), and
+    decoding straight to `'L'` skips the colour conversion.  Whatever is
+    still larger than needed is box-reduced by an integer factor, so the
+    final resample works on a small image.  Raises `ValueError` if the
+    decoded image would have more than `max_pixels` pixels.
+    """
+    img = Image.open(path)
+    img.draft(mode, (int(width * reducing_gap), int(height * reducing_gap)))
+    if img.width * img.height > max_pixels:
+        raise ValueError(
+            f"{path}: decoding {img.width}x{img.height} exceeds {max_pixels} pixels"
+        )
+    if mode is not None and img.mode != mode:
+        img = img.convert(mode)
+    factor = int(min(img.width / (width * reducing_gap), img.height / (height * reducing_gap)))
+    if factor <= 1:
+        return img
+    # `reduce` does not average palette or bit images; 16-bit ones are left
+    # to the final resample
+    if img.mode == '1':
+        img = img.convert('L')
+    elif img.mode == 'P':
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    elif img.mode.startswith('I;16'):
+        return img
+    return img.reduce(factor)
+
+
+def load_and_resize(path, grid_width, grid_height, maintain_aspect=True, fill_color=255):
+    """Load image and resize to grid dimensions."""
+    img = open_reduced(path, grid_width, grid_height)
+    return resize_to_grid(img, grid_width, grid_height, maintain_aspect, fill_color)
+
+
 def binarize_image(img, method='threshold', threshold=128, block_size=11, C=2):
     """Binarize using different methods."""
     gray = ImageOps.grayscale(img)
     arr = np.array(gray)
+    return Image.fromarray(binarize_array(arr, method, threshold, block_size, C))
+
+
+def binarize_array(arr, method='threshold', threshold=128, block_size=11, C=2):
+    """Binarize a grayscale uint8 array; returns 0/255 values."""
     if method == 'threshold':
         _, binary = cv2.threshold(arr, threshold, 255, cv2.THRESH_BINARY)
     elif method == 'adaptive':
@@ -33,7 +84,66 @@ def binarize_image(img, method='threshold', threshold=128, block_size=11, C=2):
         binary = cv2.Canny(arr, 100, 200)
     else:
         raise ValueError(f"Unknown method: {method}")
-    return Image.fromarray(binary)
+    return binary
+
+
+def build_pyramid(gray, grid_sizes, maintain_aspect=True, fill_color=255, reducing_gap=3.0):
+    """Return `{grid_size: uint8 array}` resized from one grayscale image.
+
+    The source is box-reduced once to roughly `reducing_gap` times the
+    largest grid size, and every grid size is resampled from that level.
+    """
+    largest = max(grid_sizes)
+    factor = int(min(gray.width, gray.height) // (largest * reducing_gap))
+    base = gray.reduce(factor) if factor > 1 else gray
+    return {
+        size: np.array(resize_to_grid(base.copy(), size, size, maintain_aspect, fill_color))
+        for size in sorted(set(grid_sizes), reverse=True)
+    }
+
+
+def binarize_variants(arr, variants):
+    """Binarize one grayscale array with every variant in `variants`.
+
+    Variants are `binarize_image` keyword dicts.  All fixed-threshold
+    variants are computed together by broadcasting against the array.
+    """
+    outputs = [None] * len(variants)
+    fixed = [i for i, v in enumerate(variants) if v.get('method', 'threshold') == 'threshold']
+    if fixed:
+        thresholds = np.array([variants[i].get('threshold', 128) for i in fixed])
+        # cv2.THRESH_BINARY: 255 where src > threshold
+        stack = (arr[None, :, :] > thresholds[:, None, None]).astype(np.uint8) * 255
+        for i, binary in zip(fixed, stack):
+            outputs[i] = binary
+    for i, variant in enumerate(variants):
+        if outputs[i] is None:
+            params = {k: v for k, v in variant.items() if k not in ('erode', 'dilate')}
+            outputs[i] = binarize_array(arr, **params)
+    return outputs
+
+
+def sweep(path, grid_sizes, variants, maintain_aspect=True, fill_color=255):
+    """Preprocess one image for every grid size and binarization variant.
+
+    The image is decoded once, directly to grayscale and at reduced size
+    where the format allows (see `open_reduced`).  Each variant is a
+    dict of `binarize_image` keyword arguments plus optional `erode` and
+    `dilate` iteration counts.  Returns `{(grid_size, variant_index): image}`.
+    """
+    largest = max(grid_sizes)
+    gray = open_reduced(path, largest, largest, mode='L')
+    pyramid = build_pyramid(gray, grid_sizes, maintain_aspect, fill_color)
+    results = {}
+    for size, arr in pyramid.items():
+        for i, binary in enumerate(binarize_variants(arr, variants)):
+            variant = variants[i]
+            results[(size, i)] = post_process(
+                Image.fromarray(binary),
+                erode_iters=variant.get('erode', 0),
+                dilate_iters=variant.get('dilate', 0),
+            )
+    return results
 
 
 def post_process(img, erode_iters=0, dilate_iters=0):
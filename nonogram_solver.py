@@ -1,102 +1,924 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import Enum
 from ortools.sat.python import cp_model
-from typing import List, Tuple, Set, Dict
+from typing import Callable, Iterator, List, Optional, Tuple, Set, Dict, Union
 
-Grid = List[List[int]]
+import numpy as np
+
+from line_solver import (
+    UNKNOWN,
+    Part,
+    independent_parts,
+    leftmost_starts,
+    propagate,
+    rightmost_starts,
+    search,
+)
+from nonogram_automaton import compile_automaton, normalize_clues
+from nonogram_clues import extract_clues
+from nonogram_grid import Grid, as_grid_array, pack_rows
+from solution_cache import SolutionCache, default_cache
+
+CellVars = List[List[cp_model.IntVar]]
 
 
 def make_transition_matrix(
     clues: List[int],
-) -> Tuple[List[Tuple[int, int, int]], int, int, List[int], List[int]]:
+) -> Tuple[Tuple[Tuple[int, int, int], ...], int, int, Tuple[int, ...], Tuple[int, ...]]:
     """
     Build transition matrix from clues (e.g. [3, 2]) for AddAutomaton.
-    Returns: transitions, initial_state, final_state, input_domain, final_states
+    Returns: transitions, initial_state, num_states, input_domain, final_states
+
+    The automaton is taken from the shared cache in `nonogram_automaton`.
     """
-    # Build base transitions according to the clue pattern
-    base: List[Tuple[int, int, int]] = []
-    state = 0
+    automaton = compile_automaton(clues)
+    return (
+        automaton.transitions,
+        automaton.initial_state,
+        automaton.num_states,
+        (0, 1),
+        automaton.final_states,
+    )
 
-    # Build transitions following the standard nonogram automaton
-    for idx, run in enumerate(clues):
-        # leading zeros or zeros between runs
-        base.append((state, 0, state))
-        for _ in range(run):
-            base.append((state, 1, state + 1))
-            state += 1
-        if idx < len(clues) - 1:
-            base.append((state, 0, state + 1))
-            state += 1
 
-    base.append((state, 0, state))  # trailing zeros
-    final_state = state
+ENCODINGS = ("automaton", "placement")
 
-    # Add a sink state to satisfy AddAutomaton's requirement that every
-    # (state, label) pair has a transition.
-    # Remove duplicates and ensure exactly one transition per (state, label)
-    trans_map: Dict[Tuple[int, int], int] = {}
-    for s, a, t in base:
-        trans_map[(s, a)] = t
 
-    sink = final_state + 1
-    for s in range(sink):
-        for a in (0, 1):
-            if (s, a) not in trans_map:
-                trans_map[(s, a)] = sink
+def add_line_constraint(
+    model: cp_model.CpModel,
+    line: List[cp_model.IntVar],
+    clues: List[int],
+    encoding: str = "automaton",
+) -> Optional[cp_model.Constraint]:
+    """Constrain the cells of one row or column to match `clues`.
+
+    `encoding="automaton"` adds one `AddAutomaton` over the clue DFA and
+    returns it; `"placement"` uses `add_placement_constraint` and returns
+    None, as it adds several constraints.
+    """
+    if encoding == "placement":
+        add_placement_constraint(model, line, clues)
+        return None
+    if encoding != "automaton":
+        raise ValueError(f"Unknown encoding: {encoding}")
+    transitions, q0, n, sigma, final = make_transition_matrix(clues if clues else [0])
+    return model.AddAutomaton(line, q0, final, transitions)
 
-    trans_map[(sink, 0)] = sink
-    trans_map[(sink, 1)] = sink
 
-    transitions = [(s, a, t) for (s, a), t in sorted(trans_map.items())]
+def add_placement_constraint(
+    model: cp_model.CpModel, line: List[cp_model.IntVar], clues: List[int]
+) -> None:
+    """Encode a line by the start position of each block.
 
-    num_states = sink + 1
-    input_domain = [0, 1]
-    initial_state = 0
-    final_states = [final_state]
+    Block `j` gets one literal per start between its left-most and
+    right-most placement, exactly one of which holds; consecutive blocks
+    are ordered with a gap, and every cell equals the number of placed
+    blocks covering it (at most one, given the ordering).
+    """
+    clues = list(normalize_clues(clues))
+    n = len(line)
+    covering: List[list] = [[] for _ in range(n)]
+    starts = []
+    for j, (run, lo, hi) in enumerate(
+        zip(clues, leftmost_starts(clues), rightmost_starts(clues, n))
+    ):
+        literals = [model.NewBoolVar(f"start_{j}_{p}") for p in range(lo, hi + 1)]
+        model.AddExactlyOne(literals)
+        start = model.NewIntVar(lo, hi, f"start_{j}")
+        model.Add(start == sum(p * lit for p, lit in zip(range(lo, hi + 1), literals)))
+        for p, lit in zip(range(lo, hi + 1), literals):
+            for i in range(p, p + run):
+                covering[i].append(lit)
+        if starts:
+            model.Add(start >= starts[-1] + clues[j - 1] + 1)
+        starts.append(start)
+    for cell, lits in zip(line, covering):
+        model.Add(cell == sum(lits))
 
-    return transitions, initial_state, num_states, input_domain, final_states
 
+def cell_indices(grid: CellVars) -> np.ndarray:
+    """Return the proto variable index of every cell as an (h, w) array."""
+    return np.array([[cell.Index() for cell in row] for row in grid], dtype=np.int64)
 
-def solve_nonogram(
-    row_clues: List[List[int]], col_clues: List[List[int]], max_solutions: int = 2
-) -> List[Grid]:
-    model = cp_model.CpModel()
-    h, w = len(row_clues), len(col_clues)
 
+def _read_grid(solution, index: np.ndarray, as_array: bool):
+    """Extract the cell values of a response `solution` in one indexing step."""
+    values = np.asarray(solution, dtype=np.int64)[index].astype(np.uint8)
+    return values if as_array else values.tolist()
+
+
+class SolutionCollector(cp_model.CpSolverSolutionCallback):
+    def __init__(self, grid: CellVars, max_sols: int, as_array: bool = False):
+        super().__init__()
+        self.index = cell_indices(grid)
+        self.solutions: list = []
+        self.max_solutions = max_sols
+        self.as_array = as_array
+
+    def on_solution_callback(self):
+        if len(self.solutions) >= self.max_solutions:
+            self.StopSearch()
+            return
+
+        solution = _read_grid(self.Response().solution, self.index, self.as_array)
+        self.solutions.append(solution)
+        # stop at once rather than after searching for one more
+        if len(self.solutions) >= self.max_solutions:
+            self.StopSearch()
+
+
+def enumerate_solutions(
+    model: cp_model.CpModel,
+    grid: CellVars,
+    max_solutions: int,
+    as_array: bool = False,
+    budget: Optional["Budget"] = None,
+) -> list:
+    """Collect up to `max_solutions` solutions of `model` over `grid`."""
+    solver = cp_model.CpSolver()
+    # Fix: Use enumerate_all_solutions instead of max_number_of_solutions
+    solver.parameters.enumerate_all_solutions = True
+
+    collector = SolutionCollector(grid, max_solutions, as_array)
+    if budget is None:
+        solver.SearchForAllSolutions(model, collector)
+    elif not budget.exhausted():
+        with budget.solving(solver, "enumerate"):
+            solver.SearchForAllSolutions(model, collector)
+    return collector.solutions
+
+
+class Verdict(Enum):
+    UNSOLVABLE = "unsolvable"
+    UNIQUE = "unique"
+    AMBIGUOUS = "ambiguous"
+    # the time or work budget ran out, or the search was cancelled
+    UNKNOWN = "unknown"
+
+
+ProgressCallback = Callable[[dict], None]
+
+
+class Budget:
+    """Time, work and cancellation limits shared by the solves of one call.
+
+    `time_limit` is in wall-clock seconds and `deterministic_limit` in CP-SAT
+    deterministic time units (reproducible across machines, roughly seconds).
+    Both are counted from the creation of the budget and across every solve
+    it is used for.  `cancel` is any object with an `is_set()` method, e.g. a
+    `threading.Event`; setting it stops a running solve within
+    `poll_interval` seconds.  `progress` is called with a dict (`phase`,
+    `elapsed`, `solves`) before each solve and every `progress_interval`
+    seconds during one, from a helper thread.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(
+        self,
+        time_limit: Optional[float] = None,
+        deterministic_limit: Optional[float] = None,
+        cancel=None,
+        progress: Optional[ProgressCallback] = None,
+        progress_interval: float = 0.5,
+    ):
+        self.start = time.monotonic()
+        self.deadline = None if time_limit is None else self.start + time_limit
+        self.deterministic_left = deterministic_limit
+        self.cancel = cancel
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.solves = 0
+        self._lock = threading.Lock()
+
+    def exhausted(self) -> bool:
+        """Return True once the budget is used up or cancelled."""
+        if self.cancel is not None and self.cancel.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self.deterministic_left is not None and self.deterministic_left <= 0
+
+    def remaining_time(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def report(self, phase: str) -> None:
+        if self.progress is not None:
+            self.progress(
+                {
+                    "phase": phase,
+                    "elapsed": time.monotonic() - self.start,
+                    "solves": self.solves,
+                }
+            )
+
+    @contextmanager
+    def solving(self, solver: cp_model.CpSolver, phase: str) -> Iterator[None]:
+        """Apply the remaining limits to `solver` for the enclosed solve."""
+        remaining = self.remaining_time()
+        if remaining is not None:
+            solver.parameters.max_time_in_seconds = remaining
+        if self.deterministic_left is not None:
+            solver.parameters.max_deterministic_time = self.deterministic_left
+        self.report(phase)
+
+        done = threading.Event()
+        watcher = None
+        if self.cancel is not None or self.progress is not None:
+            watcher = threading.Thread(
+                target=self._watch, args=(solver, phase, done), daemon=True
+            )
+            watcher.start()
+        try:
+            yield
+        finally:
+            done.set()
+            if watcher is not None:
+                watcher.join()
+            with self._lock:
+                self.solves += 1
+                if self.deterministic_left is not None:
+                    self.deterministic_left -= solver.deterministic_time
+
+    def _watch(self, solver: cp_model.CpSolver, phase: str, done: threading.Event) -> None:
+        last_report = time.monotonic()
+        while not done.wait(self.poll_interval):
+            if self.cancel is not None and self.cancel.is_set():
+                solver.StopSearch()
+                return
+            if time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                self.report(phase)
+
+
+@dataclass
+class UniquenessResult:
+    """Outcome of `check_unique` with the solutions that witness it.
+
+    Witnesses are nested lists, or uint8 arrays when requested with
+    `as_array=True`.  `stats` holds CP-SAT counters summed over the solves
+    (`solves`, `branches`, `conflicts`, `wall_time`, `deterministic_time`,
+    and `components` when the puzzle was split); it is empty when the line
+    solver or the cache answered.
+    """
+
+    verdict: Verdict
+    solution: Optional[Union[Grid, np.ndarray]] = None
+    alternative: Optional[Union[Grid, np.ndarray]] = None
+    stats: Dict[str, float] = field(default_factory=dict, compare=False)
+
+    @property
+    def is_unique(self) -> bool:
+        return self.verdict is Verdict.UNIQUE
+
+    def to_lists(self) -> "UniquenessResult":
+        """Return a copy with array witnesses converted to nested lists."""
+        solution, alternative = (
+            g.tolist() if isinstance(g, np.ndarray) else g
+            for g in (self.solution, self.alternative)
+        )
+        return UniquenessResult(self.verdict, solution, alternative, self.stats)
+
+    @property
+    def solutions(self) -> list:
+        return [g for g in (self.solution, self.alternative) if g is not None]
+
+
+def build_model(
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    fixed: Optional[np.ndarray] = None,
+    encoding: str = "automaton",
+) -> Tuple[cp_model.CpModel, CellVars]:
+    """Build the puzzle model; cells known in `fixed` get a fixed domain.
+
+    `encoding` selects the line encoding (see `add_line_constraint`).
+    """
+    h, w = len(row_clues), len(col_clues)
+    model = cp_model.CpModel()
+    known = fixed.tolist() if fixed is not None else [[UNKNOWN] * w] * h
     grid = [
-        [model.NewIntVar(0, 1, f"cell_{r}_{c}") for c in range(w)] for r in range(h)
+        [
+            model.NewIntVar(0, 1, f"cell_{r}_{c}")
+            if known[r][c] == UNKNOWN
+            else model.NewIntVar(known[r][c], known[r][c], f"cell_{r}_{c}")
+            for c in range(w)
+        ]
+        for r in range(h)
     ]
 
     for r, clues in enumerate(row_clues):
-        row = grid[r]
-        transitions, q0, n, sigma, final = make_transition_matrix(
-            clues if clues else [0]
-        )
-        model.AddAutomaton(row, q0, final, transitions)
+        add_line_constraint(model, grid[r], clues, encoding)
 
     for c, clues in enumerate(col_clues):
-        col = [grid[r][c] for r in range(h)]
-        transitions, q0, n, sigma, final = make_transition_matrix(
-            clues if clues else [0]
-        )
-        model.AddAutomaton(col, q0, final, transitions)
+        add_line_constraint(model, [grid[r][c] for r in range(h)], clues, encoding)
+
+    return model, grid
 
+
+def build_part_model(
+    fixed: np.ndarray, part: Part, encoding: str = "automaton"
+) -> Tuple[cp_model.CpModel, CellVars]:
+    """Build a model over one part of a propagated grid.
+
+    Cells outside `part.cells` are constants.  The returned grid is a single
+    row holding the variables of `part.cells` in order.
+    """
+    model = cp_model.CpModel()
+    free = {
+        (r, c): model.NewBoolVar(f"cell_{r}_{c}") for r, c in part.cells.tolist()
+    }
+    constants = {0: model.NewConstant(0), 1: model.NewConstant(1)}
+    for coords, clues in part.lines:
+        line = [
+            free[r, c] if (r, c) in free else constants[int(fixed[r, c])]
+            for r, c in coords.tolist()
+        ]
+        add_line_constraint(model, line, list(clues), encoding)
+    return model, [list(free.values())]
+
+
+def _solve_once(
+    solver: cp_model.CpSolver,
+    model: cp_model.CpModel,
+    stats: Dict[str, float],
+    budget: Optional[Budget] = None,
+    phase: str = "solve",
+    callback: Optional[cp_model.CpSolverSolutionCallback] = None,
+) -> Optional[bool]:
+    """Run one solve, add its counters to `stats` and return whether a
+    solution was found, or None if `budget` ran out first."""
+    if budget is None:
+        status = solver.Solve(model, callback)
+    elif budget.exhausted():
+        return None
+    else:
+        with budget.solving(solver, phase):
+            status = solver.Solve(model, callback)
+    stats["solves"] = stats.get("solves", 0) + 1
+    stats["branches"] = stats.get("branches", 0) + solver.NumBranches()
+    stats["conflicts"] = stats.get("conflicts", 0) + solver.NumConflicts()
+    stats["wall_time"] = stats.get("wall_time", 0.0) + solver.WallTime()
+    stats["deterministic_time"] = (
+        stats.get("deterministic_time", 0.0) + solver.deterministic_time
+    )
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return True
+    if status == cp_model.INFEASIBLE:
+        return False
+    if status == cp_model.UNKNOWN and budget is not None:
+        return None
+    raise RuntimeError(f"CP-SAT returned {solver.StatusName(status)}")
+
+
+_default_parameters: Dict[str, object] = {}
+
+
+def set_default_parameters(parameters: Optional[Dict[str, object]]) -> None:
+    """Set the CP-SAT parameters of solves not given any, for this process.
+
+    Worker pools use it to split the cores, e.g. `{"num_workers": 2}` in
+    each of four processes on eight cores; None restores CP-SAT's defaults.
+    """
+    global _default_parameters
+    _default_parameters = dict(parameters or {})
+
+
+def prove_unique(
+    model: cp_model.CpModel,
+    grid: CellVars,
+    solution=None,
+    as_array: bool = False,
+    budget: Optional[Budget] = None,
+    parameters: Optional[Dict[str, object]] = None,
+    hint=None,
+    method: str = "auto",
+) -> UniquenessResult:
+    """Decide whether `model` has zero, one or several solutions.
+
+    `method="enumerate"` looks for two solutions in a single enumerating
+    solve, which runs on one worker without presolve.  `"disprove"` finds a
+    solution, then proves with a second solve and a "differs in at least
+    one cell" clause that there is no other; both solves use presolve and
+    every worker, but on a single core they cost about twice as much.
+    `"auto"` disproves only when `parameters` ask for `num_workers` > 1.
+    If `solution` is already known only the proof solve runs.
+
+    `hint` (a grid over `grid`) seeds the search.  Hints and the clause are
+    cleared afterwards so `model` can be reused.  If `budget` runs out the
+    verdict is `UNKNOWN`, with the first solution if one was found.
+    `parameters` are set on the `CpSolver` (e.g. `{"num_workers": 1}`) and
+    default to those of `set_default_parameters`.
+    """
+    if parameters is None:
+        parameters = _default_parameters
+    if method == "auto":
+        workers = parameters.get("num_workers", 0)
+        method = "disprove" if workers > 1 else "enumerate"
+    if method not in ("enumerate", "disprove"):
+        raise ValueError(f"unknown method {method!r}")
+    index = cell_indices(grid)
+    cells = [cell for row in grid for cell in row]
     solver = cp_model.CpSolver()
-    # Fix: Use enumerate_all_solutions instead of max_number_of_solutions
+    for name, value in parameters.items():
+        setattr(solver.parameters, name, value)
+    stats: Dict[str, float] = {}
+    if hint is not None:
+        for cell, value in zip(cells, as_grid_array(hint).ravel().tolist()):
+            model.AddHint(cell, value)
+    try:
+        if solution is None and method == "enumerate":
+            return _enumerate_two(solver, model, grid, as_array, budget, stats)
+        if solution is None:
+            found = _solve_once(solver, model, stats, budget, "solve")
+            if found is None:
+                return UniquenessResult(Verdict.UNKNOWN, stats=stats)
+            if not found:
+                return UniquenessResult(Verdict.UNSOLVABLE, stats=stats)
+            solution = _read_grid(solver.ResponseProto().solution, index, True)
+        else:
+            solution = as_grid_array(solution)
+
+        differs = model.AddBoolOr(
+            [
+                cell.Not() if value else cell
+                for cell, value in zip(cells, solution.ravel().tolist())
+            ]
+        )
+        try:
+            found = _solve_once(solver, model, stats, budget, "prove")
+        finally:
+            model.Proto().constraints[differs.Index()].clear_bool_or()
+    finally:
+        if hint is not None:
+            model.ClearHints()
+    if found is None:
+        return UniquenessResult(Verdict.UNKNOWN, _as_output(solution, as_array), stats=stats)
+    if not found:
+        return UniquenessResult(Verdict.UNIQUE, _as_output(solution, as_array), stats=stats)
+    alternative = _read_grid(solver.ResponseProto().solution, index, as_array)
+    return UniquenessResult(
+        Verdict.AMBIGUOUS, _as_output(solution, as_array), alternative, stats
+    )
+
+
+def _enumerate_two(
+    solver: cp_model.CpSolver,
+    model: cp_model.CpModel,
+    grid: CellVars,
+    as_array: bool,
+    budget: Optional[Budget],
+    stats: Dict[str, float],
+) -> UniquenessResult:
+    """The single-solve path of `prove_unique`: enumerate, stop at two."""
     solver.parameters.enumerate_all_solutions = True
+    collector = SolutionCollector(grid, 2, as_array)
+    found = _solve_once(solver, model, stats, budget, "enumerate", collector)
+    if len(collector.solutions) == 2:
+        return UniquenessResult(Verdict.AMBIGUOUS, *collector.solutions, stats=stats)
+    if found is False:
+        return UniquenessResult(Verdict.UNSOLVABLE, stats=stats)
+    # only a search run to the end proves there is no second solution
+    if found is None or solver.ResponseProto().status != cp_model.OPTIMAL:
+        return UniquenessResult(Verdict.UNKNOWN, *collector.solutions, stats=stats)
+    return UniquenessResult(Verdict.UNIQUE, collector.solutions[0], stats=stats)
+
+
+def _as_output(grid: np.ndarray, as_array: bool):
+    return grid if as_array else grid.tolist()
+
+
+def check_unique(
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    as_array: bool = False,
+    cache: Optional[SolutionCache] = None,
+    time_limit: Optional[float] = None,
+    deterministic_limit: Optional[float] = None,
+    cancel=None,
+    progress: Optional[ProgressCallback] = None,
+    workers: int = 1,
+    backend: Optional["SolverBackend"] = None,
+    encoding: str = "automaton",
+    hint=None,
+) -> UniquenessResult:
+    """Return whether the clues have no, exactly one or several solutions.
+
+    `cache` defaults to `solution_cache.default_cache()`; verdicts found
+    there are returned without solving.  `time_limit`, `deterministic_limit`,
+    `cancel` and `progress` are passed to a `Budget`; when it runs out the
+    verdict is `Verdict.UNKNOWN`, which is never cached.
+
+    Cells left open by line deduction often fall into independent parts
+    (blobs separated by empty or settled lines).  Each part is then proved
+    with its own small model, on up to `workers` threads.
+
+    `backend` replaces the default CP-SAT engine (see `BACKENDS`);
+    `encoding` selects the line encoding of the default one.  `hint` is a
+    grid expected to be close to a solution, such as the image a puzzle was
+    made from; if it solves the clues only the proof solve is left, and
+    otherwise it seeds the search.  Other backends ignore it.
+    """
+    if cache is None:
+        cache = default_cache()
+    if cache is not None:
+        hit = cache.get(row_clues, col_clues)
+        if hit is not None:
+            verdict, solution, alternative = hit
+            result = UniquenessResult(Verdict(verdict), solution, alternative)
+            return result if as_array else result.to_lists()
+
+    budget = Budget(time_limit, deterministic_limit, cancel, progress)
+    if backend is not None:
+        result = backend.check(row_clues, col_clues, budget)
+    else:
+        result = _check_unique(
+            row_clues, col_clues, budget, workers, encoding=encoding, hint=hint
+        )
+    if cache is not None and result.verdict is not Verdict.UNKNOWN:
+        cache.put(
+            row_clues, col_clues, result.verdict.value, result.solution, result.alternative
+        )
+    return result if as_array else result.to_lists()
+
+
+def _check_unique(
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    budget: Budget,
+    workers: int = 1,
+    parameters: Optional[Dict[str, object]] = None,
+    encoding: str = "automaton",
+    hint=None,
+    method: str = "auto",
+) -> UniquenessResult:
+    budget.report("propagate")
+    fixed = propagate(row_clues, col_clues)
+    if fixed is None:
+        return UniquenessResult(Verdict.UNSOLVABLE)
+    if not (fixed == UNKNOWN).any():
+        return UniquenessResult(Verdict.UNIQUE, fixed.astype(np.uint8))
+
+    solution = None
+    if hint is not None:
+        hint = as_grid_array(hint)
+        if hint.shape != fixed.shape:
+            raise ValueError(f"hint is {hint.shape}, the puzzle {fixed.shape}")
+        if _solves(hint, row_clues, col_clues):
+            solution = hint
+    parts = independent_parts(row_clues, col_clues, fixed)
+    if len(parts) > 1:
+        return _check_components(
+            fixed, parts, budget, workers, parameters, encoding, hint, solution, method
+        )
+    model, grid = build_model(row_clues, col_clues, fixed, encoding)
+    return prove_unique(
+        model,
+        grid,
+        solution,
+        as_array=True,
+        budget=budget,
+        parameters=parameters,
+        hint=hint if solution is None else None,
+        method=method,
+    )
+
+
+def _solves(grid: np.ndarray, row_clues: List[List[int]], col_clues: List[List[int]]) -> bool:
+    """Return whether `grid` has exactly the given clues."""
+    rows, cols = extract_clues(grid)
+    same = lambda a, b: [normalize_clues(x) for x in a] == [normalize_clues(x) for x in b]
+    return same(rows, row_clues) and same(cols, col_clues)
+
+
+def _check_components(
+    fixed: np.ndarray,
+    parts: List[Part],
+    budget: Budget,
+    workers: int = 1,
+    parameters: Optional[Dict[str, object]] = None,
+    encoding: str = "automaton",
+    hint: Optional[np.ndarray] = None,
+    solution: Optional[np.ndarray] = None,
+    method: str = "auto",
+) -> UniquenessResult:
+    """Prove each independent part on its own and stitch the witnesses.
+
+    The puzzle is unsolvable if any part is, ambiguous if any part is, and
+    unique if every part is.  An alternative differs from the solution in
+    the first ambiguous part only.  `hint` and a known `solution` are
+    full grids, cut down to each part.
+    """
+
+    def prove(part: Part) -> UniquenessResult:
+        model, grid = build_part_model(fixed, part, encoding)
+        rows, cols = part.cells[:, 0], part.cells[:, 1]
+        known = None if solution is None else solution[rows, cols][None]
+        seed = None if hint is None or known is not None else hint[rows, cols][None]
+        return prove_unique(
+            model,
+            grid,
+            known,
+            as_array=True,
+            budget=budget,
+            parameters=parameters,
+            hint=seed,
+            method=method,
+        )
+
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(prove, parts))
+    else:
+        results = []
+        for part in parts:
+            results.append(prove(part))
+            if results[-1].verdict in (Verdict.UNSOLVABLE, Verdict.UNKNOWN):
+                break
+
+    stats: Dict[str, float] = {"components": len(parts)}
+    for result in results:
+        for key, value in result.stats.items():
+            stats[key] = stats.get(key, 0) + value
+    verdicts = [result.verdict for result in results]
+    if Verdict.UNSOLVABLE in verdicts:
+        return UniquenessResult(Verdict.UNSOLVABLE, stats=stats)
+
+    solution = None
+    if len(results) == len(parts) and all(r.solution is not None for r in results):
+        solution = fixed.astype(np.uint8)
+        for part, result in zip(parts, results):
+            solution[part.cells[:, 0], part.cells[:, 1]] = result.solution[0]
+    if Verdict.UNKNOWN in verdicts:
+        return UniquenessResult(Verdict.UNKNOWN, solution, stats=stats)
+    if Verdict.AMBIGUOUS in verdicts:
+        i = verdicts.index(Verdict.AMBIGUOUS)
+        alternative = solution.copy()
+        cells = parts[i].cells
+        alternative[cells[:, 0], cells[:, 1]] = results[i].alternative[0]
+        return UniquenessResult(Verdict.AMBIGUOUS, solution, alternative, stats)
+    return UniquenessResult(Verdict.UNIQUE, solution, stats=stats)
+
+
+def solve_nonogram(
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    max_solutions: int = 2,
+    as_array: bool = False,
+    time_limit: Optional[float] = None,
+    deterministic_limit: Optional[float] = None,
+    cancel=None,
+    progress: Optional[ProgressCallback] = None,
+    backend: Optional["SolverBackend"] = None,
+    encoding: str = "automaton",
+) -> list:
+    """Return up to `max_solutions` solutions, as lists or uint8 arrays.
+
+    The limits, `backend` and `encoding` are those of `check_unique`.  If the limits run
+    out, the solutions found so far are returned; use `check_unique` to tell
+    that case apart.  Enumerating more than two solutions always uses CP-SAT.
+    """
+    limits = dict(
+        time_limit=time_limit,
+        deterministic_limit=deterministic_limit,
+        cancel=cancel,
+        progress=progress,
+    )
+    # Telling one solution from two only needs a search stopped at the
+    # second solution, or a proof that there is none (see `prove_unique`).
+    if max_solutions <= 2:
+        result = check_unique(
+            row_clues,
+            col_clues,
+            as_array=as_array,
+            backend=backend,
+            encoding=encoding,
+            **limits,
+        )
+        return result.solutions[:max_solutions]
+
+    # Line deduction settles most puzzles on its own; a fully determined grid
+    # is the only possible solution, so CP-SAT is only needed for the rest.
+    fixed = propagate(row_clues, col_clues)
+    if fixed is None:
+        return []
+    if not (fixed == UNKNOWN).any():
+        return [_as_output(fixed.astype(np.uint8), as_array)][:max_solutions]
 
-    class SolutionCollector(cp_model.CpSolverSolutionCallback):
-        def __init__(self, max_sols: int):
-            super().__init__()
-            self.solutions = []
-            self.max_solutions = max_sols
+    model, grid = build_model(row_clues, col_clues, fixed, encoding)
+    return enumerate_solutions(model, grid, max_solutions, as_array, Budget(**limits))
 
-        def on_solution_callback(self):
-            if len(self.solutions) >= self.max_solutions:
-                self.StopSearch()
+
+class _SolutionStream(cp_model.CpSolverSolutionCallback):
+    """Hand solutions from the solver thread to `iter_solutions` via a queue."""
+
+    def __init__(self, index: np.ndarray, items: "queue.Queue", mode: str, limit: Optional[int]):
+        super().__init__()
+        self.index = index
+        self.items = items
+        self.mode = mode
+        self.limit = limit
+        self.count = 0
+        self.closed = threading.Event()
+
+    def put(self, item) -> None:
+        # blocks while the consumer lags behind, which pauses the search
+        while not self.closed.is_set():
+            try:
+                self.items.put(item, timeout=0.1)
                 return
+            except queue.Full:
+                pass
 
-            solution = [[self.Value(grid[r][c]) for c in range(w)] for r in range(h)]
-            self.solutions.append(solution)
+    def on_solution_callback(self):
+        if self.closed.is_set():
+            self.StopSearch()
+            return
+        self.count += 1
+        if self.mode == "count":
+            self.put(self.count)
+        else:
+            values = _read_grid(self.Response().solution, self.index, as_array=True)
+            if self.mode == "packed":
+                self.put(pack_rows(values))
+            else:
+                self.put(values if self.mode == "array" else values.tolist())
+        if self.limit is not None and self.count >= self.limit:
+            self.StopSearch()
 
-    collector = SolutionCollector(max_solutions)
-    solver.SearchForAllSolutions(model, collector)
-    return collector.solutions
+
+_DONE = object()
+
+
+def iter_solutions(
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    max_solutions: Optional[int] = None,
+    as_array: bool = False,
+    packed: bool = False,
+    count_only: bool = False,
+    time_limit: Optional[float] = None,
+    deterministic_limit: Optional[float] = None,
+    cancel=None,
+    progress: Optional[ProgressCallback] = None,
+    encoding: str = "automaton",
+    buffer: int = 64,
+    stats: Optional[Dict[str, object]] = None,
+) -> Iterator:
+    """Yield the solutions of a puzzle one at a time, up to `max_solutions`.
+
+    CP-SAT enumerates on a background thread and hands solutions over
+    through a queue of `buffer` entries, pausing while the consumer falls
+    behind, so memory does not grow with the number of solutions.  Each
+    solution is a nested list, a uint8 array (`as_array`), or its rows
+    packed into uint64 words by `nonogram_grid.pack_rows` (`packed`; unpack
+    with `unpack_rows(s, w)`, or wrap in `PackedGrid(s, w)`).  With
+    `count_only` no cells are read at all and the running count 1, 2, ... is
+    yielded.
+
+    The limits are those of `check_unique`.  Closing the generator stops
+    the search.  `stats`, if given, receives `solutions` and `complete`
+    (True when every solution was enumerated).
+    """
+    if stats is None:
+        stats = {}
+    stats.update(solutions=0, complete=False)
+    mode = "count" if count_only else "packed" if packed else "array" if as_array else "list"
+    if max_solutions is not None and max_solutions <= 0:
+        return
+    fixed = propagate(row_clues, col_clues)
+    if fixed is None:
+        stats["complete"] = True
+        return
+    if not (fixed == UNKNOWN).any():
+        values = fixed.astype(np.uint8)
+        stats.update(solutions=1, complete=True)
+        yield {"count": 1, "packed": pack_rows(values), "array": values}.get(mode, values.tolist())
+        return
+
+    model, grid = build_model(row_clues, col_clues, fixed, encoding)
+    budget = Budget(time_limit, deterministic_limit, cancel, progress)
+    solver = cp_model.CpSolver()
+    solver.parameters.enumerate_all_solutions = True
+    items: "queue.Queue" = queue.Queue(max(1, buffer))
+    stream = _SolutionStream(cell_indices(grid), items, mode, max_solutions)
+    outcome: dict = {}
+
+    def run() -> None:
+        try:
+            if not budget.exhausted():
+                with budget.solving(solver, "enumerate"):
+                    outcome["status"] = solver.SearchForAllSolutions(model, stream)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            stream.put(_DONE)
+
+    thread = threading.Thread(target=run, name="iter-solutions", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            stats["solutions"] += 1
+            yield item
+    finally:
+        stream.closed.set()
+        solver.StopSearch()
+        thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    stats["complete"] = outcome.get("status") == cp_model.OPTIMAL
+
+
+def count_solutions(
+    row_clues: List[List[int]], col_clues: List[List[int]], limit: Optional[int] = None, **kwargs
+) -> int:
+    """Count solutions up to `limit` without storing any; see `iter_solutions`."""
+    count = 0
+    for count in iter_solutions(row_clues, col_clues, limit, count_only=True, **kwargs):
+        pass
+    return count
+
+
+class SolverBackend:
+    """An engine deciding uniqueness; `check_unique(..., backend=...)` uses it.
+
+    Backends are plain picklable objects so `solver_portfolio` can run them
+    in worker processes.
+    """
+
+    name = "backend"
+
+    def check(
+        self, row_clues: List[List[int]], col_clues: List[List[int]], budget: Budget
+    ) -> UniquenessResult:
+        """Return the verdict with array witnesses, or `UNKNOWN` once `budget` runs out."""
+        raise NotImplementedError
+
+
+@dataclass
+class CpSatBackend(SolverBackend):
+    """Line deduction followed by a CP-SAT model of the open cells."""
+
+    name: str = "cpsat"
+    parameters: Dict[str, object] = field(default_factory=dict)
+    workers: int = 1
+    encoding: str = "automaton"
+    # see `prove_unique`
+    method: str = "auto"
+
+    def check(self, row_clues, col_clues, budget):
+        return _check_unique(
+            row_clues,
+            col_clues,
+            budget,
+            self.workers,
+            self.parameters,
+            self.encoding,
+            method=self.method,
+        )
+
+
+class SearchBackend(SolverBackend):
+    """Line deduction with depth-first branching (`line_solver.search`).
+
+    No model is built, which wins on puzzles that propagation nearly
+    settles; heavily ambiguous puzzles are better left to CP-SAT.
+    """
+
+    name = "search"
+
+    def check(self, row_clues, col_clues, budget):
+        budget.report("search")
+        stats: Dict[str, float] = {}
+        found = []
+        for solution in search(row_clues, col_clues, stop=budget.exhausted, stats=stats):
+            found.append(solution)
+            if len(found) == 2:
+                return UniquenessResult(Verdict.AMBIGUOUS, *found, stats=stats)
+        if budget.exhausted():
+            return UniquenessResult(Verdict.UNKNOWN, *found, stats=stats)
+        if found:
+            return UniquenessResult(Verdict.UNIQUE, found[0], stats=stats)
+        return UniquenessResult(Verdict.UNSOLVABLE, stats=stats)
+
+
+BACKENDS: Dict[str, SolverBackend] = {
+    backend.name: backend
+    for backend in (
+        CpSatBackend(),
+        # one worker, no LP relaxation: less overhead on easy models
+        CpSatBackend("cpsat-lite", {"num_workers": 1, "linearization_level": 0}),
+        CpSatBackend("cpsat-placement", encoding="placement"),
+        SearchBackend(),
+    )
+}
@@ -0,0 +1,308 @@
+"""Single-file archive of finished puzzles.
+
+A batch run leaves one folder of PNGs per image; reading the puzzles back
+means listing and decoding every file.  An archive keeps the puzzles in one
+memory-mapped file instead, each record holding the bit-packed grid, the
+row and column clues as varints, the uniqueness verdict and a JSON blob of
+source metadata.  An offset index at the end gives O(1) access to record
+`i`; iteration walks the records in order.
+
+Layout (little endian)::
+
+    header   magic "NGAR", u16 version, u16 reserved, u64 count, u64 index offset
+    record   u16 height, u16 width, u8 verdict, u8 flags,
+             u32 clue bytes, u32 metadata bytes,
+             packed grid (if flags & HAS_GRID), varint clues, metadata JSON
+    index    u64 record offset * count
+
+The header's index offset is only written when the writer is closed.  An
+archive left behind by a crashed writer has offset 0 and is recovered by
+scanning the records, which are self-delimiting.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from nonogram_clues import extract_clues
+from nonogram_grid import GridLike, PackedGrid
+
+MAGIC = b"NGAR"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHQQ")
+_RECORD = struct.Struct("<HHBBII")
+HAS_GRID = 1
+
+# verdict codes; the strings are `nonogram_solver.Verdict` values
+VERDICTS = (None, "unsolvable", "unique", "ambiguous", "unknown")
+
+
+def encode_varints(values: List[int]) -> bytes:
+    """LEB128-encode non-negative integers."""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data, pos: int = 0, count: Optional[int] = None) -> Tuple[List[int], int]:
+    """Decode `count` varints (all of `data` if None); return them and the end."""
+    values = []
+    end = len(data)
+    while pos < end and (count is None or len(values) < count):
+        value = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        values.append(value)
+    return values, pos
+
+
+def encode_clues(row_clues: List[List[int]], col_clues: List[List[int]]) -> bytes:
+    """Encode every line as its block count followed by the blocks."""
+    values = []
+    for clues in (*row_clues, *col_clues):
+        blocks = [b for b in clues if b]
+        values.append(len(blocks))
+        values.extend(blocks)
+    return encode_varints(values)
+
+
+def decode_clues(data, height: int, width: int) -> Tuple[List[List[int]], List[List[int]]]:
+    lines = []
+    pos = 0
+    for _ in range(height + width):
+        (n,), pos = decode_varints(data, pos, 1)
+        blocks, pos = decode_varints(data, pos, n)
+        # empty lines are written as [0] like everywhere else
+        lines.append(blocks or [0])
+    return lines[:height], lines[height:]
+
+
+@dataclass
+class ArchiveEntry:
+    """One puzzle read from (or written to) an archive."""
+
+    row_clues: List[List[int]]
+    col_clues: List[List[int]]
+    grid: Optional[PackedGrid] = None
+    verdict: Optional[str] = None
+    metadata: dict = field(default_factory=dict)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.row_clues), len(self.col_clues)
+
+
+class ArchiveWriter:
+    """Append puzzles to an archive file.
+
+    An existing archive is extended; its index is rewritten on `close()`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets: List[int] = []
+        if os.path.exists(path) and os.path.getsize(path) >= _HEADER.size:
+            with PuzzleArchive(path) as existing:
+                self.offsets = list(existing.offsets)
+                end = existing.data_end
+            self._file: BinaryIO = open(path, "r+b")
+            # drop the old index; it is written again on close, and until
+            # then readers fall back to scanning
+            self._file.write(_HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._file = open(path, "wb")
+            self._file.write(_HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+
+    def add(
+        self,
+        grid: Optional[GridLike] = None,
+        row_clues: Optional[List[List[int]]] = None,
+        col_clues: Optional[List[List[int]]] = None,
+        verdict: Optional[str] = None,
+        metadata: Optional[dict] = None,
+    ) -> int:
+        """Append one puzzle and return its index.
+
+        Clues are extracted from `grid` when not given; at least one of the
+        two is required.
+        """
+        packed = None
+        if grid is not None:
+            packed = grid if isinstance(grid, PackedGrid) else PackedGrid.from_array(grid)
+            if row_clues is None or col_clues is None:
+                row_clues, col_clues = extract_clues(packed.to_array())
+        if row_clues is None or col_clues is None:
+            raise ValueError("Either a grid or both clue lists are required")
+        if verdict not in VERDICTS:
+            raise ValueError(f"Unknown verdict: {verdict}")
+
+        clues = encode_clues(row_clues, col_clues)
+        meta = json.dumps(metadata or {}, sort_keys=True).encode()
+        offset = self._file.tell()
+        self._file.write(
+            _RECORD.pack(
+                len(row_clues),
+                len(col_clues),
+                VERDICTS.index(verdict),
+                HAS_GRID if packed is not None else 0,
+                len(clues),
+                len(meta),
+            )
+        )
+        if packed is not None:
+            self._file.write(np.ascontiguousarray(packed.words, dtype="<u8").tobytes())
+        self._file.write(clues)
+        self._file.write(meta)
+        self.offsets.append(offset)
+        return len(self.offsets) - 1
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(np.asarray(self.offsets, dtype="<u8").tobytes())
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, 0, len(self.offsets), index_offset))
+        self._file.close()
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class PuzzleArchive:
+    """Read-only, memory-mapped view of an archive."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a puzzle archive")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, index_offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} puzzle archive")
+        if index_offset:
+            self.offsets = np.frombuffer(
+                self._mm, dtype="<u8", count=count, offset=index_offset
+            ).tolist()
+            self.data_end = index_offset
+        else:
+            self.offsets, self.data_end = self._scan(size)
+
+    def _scan(self, size: int) -> Tuple[List[int], int]:
+        """Rebuild the index of an archive whose writer did not finish."""
+        offsets = []
+        pos = _HEADER.size
+        while pos + _RECORD.size <= size:
+            end = pos + self._record_size(pos)
+            if end > size:
+                break  # torn last record
+            offsets.append(pos)
+            pos = end
+        return offsets, pos
+
+    def _record_size(self, offset: int) -> int:
+        height, width, _, flags, clue_len, meta_len = _RECORD.unpack_from(self._mm, offset)
+        grid_len = height * max(1, -(-width // 64)) * 8 if flags & HAS_GRID else 0
+        return _RECORD.size + grid_len + clue_len + meta_len
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> ArchiveEntry:
+        offset = self.offsets[i]
+        height, width, verdict, flags, clue_len, meta_len = _RECORD.unpack_from(
+            self._mm, offset
+        )
+        pos = offset + _RECORD.size
+        grid = None
+        if flags & HAS_GRID:
+            n_words = max(1, -(-width // 64))
+            words = np.frombuffer(
+                self._mm, dtype="<u8", count=height * n_words, offset=pos
+            ).reshape(height, n_words)
+            # copy so the mapping can be closed while entries are alive
+            grid = PackedGrid(words=words.copy(), width=width)
+            pos += words.nbytes
+        row_clues, col_clues = decode_clues(self._mm[pos:pos + clue_len], height, width)
+        pos += clue_len
+        metadata = json.loads(self._mm[pos:pos + meta_len]) if meta_len else {}
+        return ArchiveEntry(row_clues, col_clues, grid, VERDICTS[verdict], metadata)
+
+    def __iter__(self) -> Iterator[ArchiveEntry]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self) -> None:
+        if hasattr(self, "_mm"):
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "PuzzleArchive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect, verify or render a puzzle archive")
+    parser.add_argument('command', choices=['list', 'verify', 'render'])
+    parser.add_argument('archive', help='Path to the archive')
+    parser.add_argument('--output', default='rendered', help='Output folder for render')
+    parser.add_argument('--index', type=int, nargs='*', help='Only these entries')
+    parser.add_argument('--format', choices=['png', 'svg'], default='png', help='Format for render')
+    args = parser.parse_args()
+
+    with PuzzleArchive(args.archive) as archive:
+        indices = args.index if args.index else range(len(archive))
+        if args.command == 'render':
+            os.makedirs(args.output, exist_ok=True)
+        for i in indices:
+            entry = archive[i]
+            h, w = entry.shape
+            if args.command == 'list':
+                print(i, f"{h}x{w}", entry.verdict, json.dumps(entry.metadata, sort_keys=True))
+            elif args.command == 'verify':
+                from nonogram_solver import check_unique
+
+                verdict = check_unique(entry.row_clues, entry.col_clues).verdict.value
+                flag = "" if verdict == entry.verdict else f"  (stored {entry.verdict})"
+                print(i, f"{h}x{w}", verdict + flag)
+            else:
+                from clue_grid import save_clue_grid
+
+                path = os.path.join(args.output, f"{i:06d}_clues.{args.format}")
+                save_clue_grid(path, entry.row_clues, entry.col_clues)
+                print(path)
+
+
+if __name__ == '__main__':
+    main()
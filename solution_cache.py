@@ -0,0 +1,177 @@
+"""Persistent cache of uniqueness verdicts keyed by the puzzle clues.
+
+The same puzzle shows up again and again in our corpus (logos, re-uploads,
+the same image at the same grid size).  `SolutionCache` stores the verdict
+of `nonogram_solver.check_unique` and its witness solutions in SQLite,
+keyed by a canonical hash of `(row_clues, col_clues)`, so a repeated puzzle
+costs a lookup instead of a solve.  The least recently used entries are
+evicted once `max_entries` is exceeded.
+
+`check_unique` (and everything built on it) consults the default cache,
+which is opened from the path in the `NONOGRAM_CACHE` environment variable
+if it is set, or installed with `set_default_cache`.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from nonogram_automaton import normalize_clues
+from nonogram_grid import PackedGrid, pack_rows
+
+CACHE_ENV = "NONOGRAM_CACHE"
+
+CachedEntry = Tuple[str, Optional[np.ndarray], Optional[np.ndarray]]
+
+
+def clue_key(row_clues: List[List[int]], col_clues: List[List[int]]) -> str:
+    """Return a canonical hash of the clues (`[0]` and `[]` are the same)."""
+    payload = json.dumps(
+        [[normalize_clues(c) for c in row_clues], [normalize_clues(c) for c in col_clues]],
+        separators=(",", ":"),
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+
+class SolutionCache:
+    """SQLite-backed verdict cache with LRU eviction."""
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL lets the batch workers read while one of them writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                height INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                verdict TEXT NOT NULL,
+                solution BLOB,
+                alternative BLOB,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        self._conn.commit()
+
+    def get(self, row_clues: List[List[int]], col_clues: List[List[int]]) -> Optional[CachedEntry]:
+        """Return `(verdict, solution, alternative)` or None if not cached."""
+        key = clue_key(row_clues, col_clues)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT height, width, verdict, solution, alternative FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        height, width, verdict, solution, alternative = row
+        return (
+            verdict,
+            _unpack(solution, height, width),
+            _unpack(alternative, height, width),
+        )
+
+    def put(
+        self,
+        row_clues: List[List[int]],
+        col_clues: List[List[int]],
+        verdict: str,
+        solution=None,
+        alternative=None,
+    ) -> None:
+        """Store a verdict and its witness solutions."""
+        key = clue_key(row_clues, col_clues)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    len(row_clues),
+                    len(col_clues),
+                    verdict,
+                    _pack(solution),
+                    _pack(alternative),
+                    time.time(),
+                ),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count <= self.max_entries:
+            return
+        # trim a little below the bound so eviction is not run on every put
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM entries WHERE key IN "
+            "(SELECT key FROM entries ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _pack(grid) -> Optional[bytes]:
+    if grid is None:
+        return None
+    return pack_rows(grid).tobytes()
+
+
+def _unpack(blob: Optional[bytes], height: int, width: int) -> Optional[np.ndarray]:
+    if blob is None:
+        return None
+    words = np.frombuffer(blob, dtype="<u8").reshape(height, -1)
+    return PackedGrid(words=words, width=width).to_array()
+
+
+_default: Optional[SolutionCache] = None
+_default_pid: Optional[int] = None
+
+
+def set_default_cache(cache: Optional[SolutionCache]) -> None:
+    """Install (or with None, remove) the process-wide default cache."""
+    global _default, _default_pid
+    _default = cache
+    _default_pid = os.getpid()
+
+
+def default_cache() -> Optional[SolutionCache]:
+    """Return the default cache, opening `$NONOGRAM_CACHE` on first use."""
+    global _default, _default_pid
+    # SQLite connections must not be shared with forked workers
+    if _default_pid != os.getpid():
+        path = os.environ.get(CACHE_ENV)
+        _default = SolutionCache(path) if path else None
+        _default_pid = os.getpid()
+    return _default
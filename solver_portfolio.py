@@ -0,0 +1,209 @@
+"""Race several solver engines on a puzzle and keep the first verdict.
+
+No single engine is best across the puzzle mix: puzzles that line
+deduction almost settles are fastest with plain search, small models with a
+single CP-SAT worker, and heavily ambiguous ones with the full CP-SAT
+portfolio.  `race` runs the engines of `nonogram_solver.BACKENDS` in
+separate processes and returns the first definitive verdict; the other
+engines are cancelled through their budget and terminated if they do not
+stop in time.
+
+Every race can be appended to a JSON-lines history recording the puzzle
+class, the winner and each engine's time.  `winner_table` summarizes it so
+the default portfolio can be tuned from real runs:
+
+    python solver_portfolio.py check output.png --history portfolio.jsonl
+    python solver_portfolio.py stats portfolio.jsonl
+"""
+
+import argparse
+import json
+import multiprocessing
+import queue
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from line_solver import UNKNOWN, propagate
+from nonogram_solver import BACKENDS, Budget, UniquenessResult, Verdict
+
+DEFAULT_PORTFOLIO = ("cpsat", "cpsat-lite", "search")
+
+# engines get this long to notice the cancel event before being terminated
+GRACE_PERIOD = 1.0
+
+
+@dataclass
+class Race:
+    """Outcome of one `race`."""
+
+    result: UniquenessResult
+    winner: Optional[str]
+    puzzle_class: str
+    # seconds each engine took to finish; None if it was cancelled
+    elapsed: Dict[str, Optional[float]] = field(default_factory=dict)
+
+    def to_record(self) -> dict:
+        return {
+            "class": self.puzzle_class,
+            "winner": self.winner,
+            "verdict": self.result.verdict.value,
+            "elapsed": self.elapsed,
+        }
+
+
+def puzzle_class(shape, fixed: Optional[np.ndarray]) -> str:
+    """Bucket a puzzle by size and by how much line deduction leaves open."""
+    size = max(shape)
+    bucket = next((b for b in (10, 25, 50, 100, 200) if size <= b), 400)
+    if fixed is None or not (fixed == UNKNOWN).any():
+        return f"<={bucket}/settled"
+    open_share = float((fixed == UNKNOWN).mean())
+    level = "few" if open_share < 0.01 else "some" if open_share < 0.1 else "many"
+    return f"<={bucket}/{level}"
+
+
+def _engine(name, row_clues, col_clues, time_limit, cancel, results) -> None:
+    start = time.perf_counter()
+    try:
+        budget = Budget(time_limit, cancel=cancel)
+        outcome = BACKENDS[name].check(row_clues, col_clues, budget)
+    except Exception as e:
+        outcome = f"{type(e).__name__}: {e}"
+    results.put((name, outcome, time.perf_counter() - start))
+
+
+def _context():
+    # Forking a process that already runs CP-SAT threads can deadlock the
+    # child; a fork server is a clean, single-threaded parent that has
+    # imported the solver once, so engines still start quickly.
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(["nonogram_solver"])
+    return ctx
+
+
+def race(
+    row_clues: List[List[int]],
+    col_clues: List[List[int]],
+    engines: Sequence[str] = DEFAULT_PORTFOLIO,
+    time_limit: Optional[float] = None,
+    history: Optional[str] = None,
+) -> Race:
+    """Run `engines` in parallel processes; the first non-`UNKNOWN` verdict wins.
+
+    Puzzles settled by line deduction are answered without starting any
+    engine (winner None).  If every engine gives up the verdict is
+    `UNKNOWN`.  With `history`, the race is appended to that JSON-lines file.
+    """
+    fixed = propagate(row_clues, col_clues)
+    cls = puzzle_class((len(row_clues), len(col_clues)), fixed)
+    if fixed is None:
+        return Race(UniquenessResult(Verdict.UNSOLVABLE), None, cls)
+    if not (fixed == UNKNOWN).any():
+        return Race(UniquenessResult(Verdict.UNIQUE, fixed.astype(np.uint8)), None, cls)
+
+    ctx = _context()
+    cancel = ctx.Event()
+    results = ctx.Queue()
+    processes = {
+        name: ctx.Process(
+            target=_engine,
+            args=(name, row_clues, col_clues, time_limit, cancel, results),
+            daemon=True,
+        )
+        for name in engines
+    }
+    for process in processes.values():
+        process.start()
+
+    outcome = Race(UniquenessResult(Verdict.UNKNOWN), None, cls)
+    outcome.elapsed = {name: None for name in engines}
+    errors = []
+    pending = set(engines)
+    try:
+        while pending:
+            try:
+                name, result, elapsed = results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(processes[n].is_alive() for n in pending):
+                    break  # an engine died without reporting
+                continue
+            pending.discard(name)
+            outcome.elapsed[name] = elapsed
+            if isinstance(result, str):
+                errors.append(f"{name}: {result}")
+            elif result.verdict is not Verdict.UNKNOWN:
+                outcome.result, outcome.winner = result, name
+                break
+            elif result.solution is not None:
+                outcome.result = result
+    finally:
+        cancel.set()
+        # keep draining: a process cannot exit while its result is unread
+        deadline = time.monotonic() + GRACE_PERIOD
+        while time.monotonic() < deadline and any(p.is_alive() for p in processes.values()):
+            try:
+                results.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    if outcome.winner is None and len(errors) == len(engines):
+        raise RuntimeError("All engines failed: " + "; ".join(errors))
+    if history is not None:
+        with open(history, "a") as f:
+            f.write(json.dumps(outcome.to_record(), sort_keys=True) + "\n")
+    return outcome
+
+
+def winner_table(history: str) -> Dict[str, Counter]:
+    """Count the wins of every engine per puzzle class in a history file."""
+    table: Dict[str, Counter] = {}
+    with open(history) as f:
+        for line in f:
+            record = json.loads(line)
+            if record["winner"] is not None:
+                table.setdefault(record["class"], Counter())[record["winner"]] += 1
+    return table
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Race solver engines on puzzles")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("check", help="Race the engines on puzzle images")
+    check.add_argument("images", nargs="+")
+    check.add_argument("--engines", nargs="+", choices=sorted(BACKENDS), default=DEFAULT_PORTFOLIO)
+    check.add_argument("--time-limit", type=float, default=None)
+    check.add_argument("--history", default=None, help="JSON-lines file to append results to")
+    stats = sub.add_parser("stats", help="Summarize the winners in a history file")
+    stats.add_argument("history")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        from nonogram_clues import puzzle_from_image
+
+        for path in args.images:
+            puzzle = puzzle_from_image(path)
+            outcome = race(
+                puzzle.clues_row, puzzle.clues_col, args.engines, args.time_limit, args.history
+            )
+            times = ", ".join(
+                f"{name} {t:.3f}s" for name, t in outcome.elapsed.items() if t is not None
+            )
+            print(path, outcome.puzzle_class, outcome.result.verdict.value,
+                  outcome.winner or "line solver", times)
+    else:
+        for cls, wins in sorted(winner_table(args.history).items()):
+            total = sum(wins.values())
+            ranking = ", ".join(f"{name} {n / total:.0%}" for name, n in wins.most_common())
+            print(f"{cls:16} {total:5}  {ranking}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Tests for the batch pipeline bookkeeping."""
+
+import io
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+import batching
+from autotune import autotune, count_switches
+from batch_manifest import Manifest, file_digest, variant_key
+from batching import (
+    AUTO_METHOD,
+    all_variants,
+    cp_workers_per_process,
+    find_images,
+    plan_work,
+    process_image,
+    run_queue_worker,
+    watch_folder,
+    work_key,
+)
+from clue_grid import _GLYPHS, render_clue_grid, render_clue_grid_svg, save_clue_grid
+from nonogram_client import DaemonError, submit
+from nonogram_clues import extract_clues
+from nonogram_daemon import DaemonServer, JobQueue
+from puzzle_archive import ArchiveWriter, PuzzleArchive
+from tracing import Tracer
+from work_queue import WorkQueue
+
+
+def test_manifest_skips_completed_work(tmp_path):
+    """Completed variants are skipped; failed and changed inputs are redone."""
+    image = tmp_path / "img.png"
+    image.write_bytes(b"first")
+    output = tmp_path / "out.png"
+    output.write_bytes(b"")
+    manifest_path = tmp_path / "manifest.jsonl"
+
+    manifest = Manifest(str(manifest_path))
+    assert len(plan_work([str(image)], manifest)) == 1
+
+    digest = file_digest(str(image))
+    for grid_size, method in all_variants():
+        key = variant_key(digest, method["params"], grid_size)
+        manifest.add({"key": key, "status": "valid", "output": str(output)})
+
+    reloaded = Manifest(str(manifest_path))
+    assert plan_work([str(image)], reloaded) == []
+    assert plan_work([str(image)], reloaded, only_failed=True) == []
+
+    key = variant_key(digest, all_variants()[0][1]["params"], all_variants()[0][0])
+    reloaded.add({"key": key, "status": "error"})
+    assert len(plan_work([str(image)], Manifest(str(manifest_path)), only_failed=True)) == 1
+
+    image.write_bytes(b"second")
+    assert len(plan_work([str(image)], Manifest(str(manifest_path)))) == 1
+
+
+def test_tracer_records_spans(tmp_path):
+    """Spans keep fields added by the block, errors and land in the sink."""
+    sink = io.StringIO()
+    tracer = Tracer(sink=sink)
+    with tracer.stage("validate", grid_size=10) as span:
+        span["branches"] = 3
+    with pytest.raises(ValueError):
+        with tracer.stage("validate"):
+            raise ValueError("boom")
+
+    first, second = [json.loads(line) for line in sink.getvalue().splitlines()]
+    assert first["branches"] == 3 and first["grid_size"] == 10
+    assert first["wall_s"] >= 0 and first["rss_peak_mb"] > 0
+    assert second["error"] == "boom"
+    summary = tracer.summary()["validate"]
+    assert summary["count"] == 2 and summary["errors"] == 1
+
+
+def test_puzzle_archive_roundtrip(tmp_path):
+    """Archives round-trip, can be extended and survive an unfinished writer."""
+    path = str(tmp_path / "puzzles.ngar")
+    rng = np.random.default_rng(0)
+    grids = [(rng.random((7, 70)) < 0.5).astype(np.uint8) for _ in range(3)]
+    with ArchiveWriter(path) as writer:
+        writer.add(grids[0], verdict="unique", metadata={"image": "a.png"})
+        writer.add(row_clues=[[200], [0]], col_clues=[[1]] * 200)
+    with ArchiveWriter(path) as writer:
+        assert writer.add(grids[1], verdict="ambiguous") == 2
+
+    with PuzzleArchive(path) as archive:
+        assert len(archive) == 3
+        first, clues_only, last = list(archive)
+    assert np.array_equal(first.grid.to_array(), grids[0])
+    assert (first.row_clues, first.col_clues) == extract_clues(grids[0])
+    assert first.verdict == "unique" and first.metadata == {"image": "a.png"}
+    assert clues_only.grid is None and clues_only.verdict is None
+    assert clues_only.row_clues == [[200], [0]] and clues_only.shape == (2, 200)
+    assert last.verdict == "ambiguous"
+
+    # a writer that never closes leaves no index; the records are rescanned
+    writer = ArchiveWriter(path)
+    writer.add(grids[2])
+    writer.flush()
+    with PuzzleArchive(path) as archive:
+        assert len(archive) == 4
+        assert np.array_equal(archive[3].grid.to_array(), grids[2])
+
+
+def test_daemon_jobs(tmp_path):
+    """The daemon serves jobs over HTTP and refuses work beyond its queue."""
+    jobs = JobQueue(workers=1, maxsize=4)
+    server = DaemonServer(("127.0.0.1", 0), jobs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        result = submit("check", {"row_clues": [[1], [1]], "col_clues": [[1], [1]]}, url)
+        assert result["verdict"] == "ambiguous" and len(result["solutions"]) == 2
+        with pytest.raises(DaemonError, match="404"):
+            submit("nope", {}, url)
+        with pytest.raises(DaemonError, match="FileNotFoundError"):
+            submit("clues", {"input": str(tmp_path / "missing.png")}, url)
+    finally:
+        server.shutdown()
+        server.server_close()
+        jobs.shutdown()
+
+    full = JobQueue(workers=0, maxsize=1)
+    full.submit("clues", {})
+    with pytest.raises(queue.Full):
+        full.submit("clues", {})
+
+
+def test_watch_folder_picks_up_new_images(tmp_path, monkeypatch):
+    """Images dropped into a watched folder are processed once they settle."""
+    def digest(path):
+        if path.endswith("locked.jpg"):
+            raise PermissionError(13, "Permission denied", path)
+        return file_digest(path)
+
+    # an unreadable file is skipped instead of stopping the watcher
+    monkeypatch.setattr(batching, "file_digest", digest)
+
+    source = Path(__file__).parent / "input.jpg"
+    monkeypatch.chdir(tmp_path)  # keeps bad_logging.txt out of the repo
+    folder = tmp_path / "incoming"
+    folder.mkdir()
+    manifest_path = tmp_path / "manifest.jsonl"
+    stop = threading.Event()
+    watcher = threading.Thread(
+        target=watch_folder,
+        kwargs=dict(
+            folder=str(folder),
+            manifest_path=str(manifest_path),
+            metrics_path=None,
+            output_root=str(tmp_path / "output"),
+            poll_interval=0.05,
+            settle_time=0.2,
+            stop=stop,
+        ),
+    )
+    watcher.start()
+    try:
+        shutil.copy(source, folder / "locked.jpg")
+        shutil.copy(source, folder / "upload.jpg")
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and not manifest_path.exists():
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        watcher.join()
+
+    records = [json.loads(line) for line in manifest_path.read_text().splitlines()]
+    assert [r["image"] for r in records] == [str(folder / "upload.jpg")] * len(all_variants())
+    assert all(r["status"] in ("valid", "invalid") for r in records)
+
+
+def test_render_clue_grid_backends(tmp_path):
+    """Raster clues match PIL's own text drawing; the SVG has one text per clue."""
+    row_clues = [[1, 12], [3], [0]]
+    col_clues = [[1], [2], [1, 1], [100]]
+    img = render_clue_grid(row_clues, col_clues, cell_size=9, preview=np.zeros((5, 5), np.uint8))
+    assert img.size == (6 * 9 + 4, 5 * 9 + 4)
+
+    # every clue glyph equals draw.text on the same background
+    font = ImageFont.load_default()
+    ref = Image.new("RGB", (30, 29), "lavenderblush")
+    ImageDraw.Draw(ref).text((4, 3), "100", fill="black", font=font)
+    cell = render_clue_grid([[100]], [[1]], cell_size=30).crop((0, 31, 30, 60))
+    assert np.array_equal(np.asarray(cell), np.asarray(ref))
+
+    svg = render_clue_grid_svg(row_clues, col_clues)
+    texts = ET.fromstring(svg).iter("{http://www.w3.org/2000/svg}text")
+    assert sorted(t.text for t in texts) == sorted(
+        ["3x4", "1", "12", "3", "0", "1", "2", "1", "1", "100"]
+    )
+    save_clue_grid(str(tmp_path / "grid.svg"), row_clues, col_clues)
+    assert (tmp_path / "grid.svg").read_text() == svg
+
+
+def test_render_clue_grid_reuses_glyphs():
+    """A second render of the same clues hits the glyph cache only."""
+    render_clue_grid([[1, 2], [3]], [[1], [4, 5]])
+    misses = _GLYPHS.misses
+    hits = _GLYPHS.hits
+    render_clue_grid([[1, 2], [3]], [[1], [4, 5]])
+    assert _GLYPHS.misses == misses
+    assert _GLYPHS.hits > hits
+
+
+def test_autotune_picks_settled_candidate(tmp_path, monkeypatch):
+    """A setting settled by line deduction wins without any solver call."""
+    assert count_switches(np.array([[1, 0, 1], [0, 1, 0]])) == 2
+
+    source = str(Path(__file__).parent / "input.jpg")
+    stats = {}
+    best = autotune(source, grid_sizes=[30, 40], stats=stats)
+    assert best.grid_size in (30, 40)
+    assert best.verdict is not None and best.verdict.value == "unique"
+    assert stats["checked"] == 0 and stats["candidates"] > 1
+
+    monkeypatch.chdir(tmp_path)
+    result = process_image(source, str(tmp_path / "output"), [(0, AUTO_METHOD)])[0]
+    assert result["status"] == "valid"
+    assert result["tuned"]["grid_size"] in (30, 40, 50)
+
+
+def test_queue_workers_split_images(tmp_path, monkeypatch):
+    """Worker processes share the images; a dead worker's lease is taken over."""
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / "potential"
+    folder.mkdir()
+    source = Image.open(Path(__file__).parent / "input.jpg")
+    for i, angle in enumerate((0, 90, 180)):
+        source.rotate(angle, expand=True).save(folder / f"img{i}.png")
+
+    # a worker that crashed long ago still holds img1
+    manifest_path = tmp_path / "output" / "manifest.jsonl"
+    (image, digest, variants), = plan_work([str(folder / "img1.png")], Manifest(str(manifest_path)))
+    queue_dir = tmp_path / "queue"
+    stale = WorkQueue(str(queue_dir), worker_id="crashed")
+    assert stale.claim(work_key(image, digest, variants))
+    stale._stop.set()  # no heartbeat, no release
+    lease = next((queue_dir / "leases").iterdir())
+    os.utime(lease, (0, 0))
+
+    options = dict(
+        queue_dir=str(queue_dir),
+        folder=str(folder),
+        output_root=str(tmp_path / "output"),
+        manifest_path=str(manifest_path),
+        metrics_path=None,
+        lease_ttl=5,
+        poll_interval=0.1,
+    )
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=run_queue_worker, kwargs=options) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(120)
+        assert worker.exitcode == 0
+
+    records = [json.loads(line) for line in manifest_path.read_text().splitlines()]
+    assert sorted(r["image"] for r in records) == sorted(find_images(str(folder)))
+    assert all(r["status"] in ("valid", "invalid") for r in records)
+    assert WorkQueue(str(queue_dir)).status() == {"done": 3, "leased": 0, "expired": 0}
+
+
+def test_queue_lock_outlives_lease_ttl(tmp_path):
+    """A lock held longer than the lease TTL is kept fresh, not taken over."""
+    holder = WorkQueue(str(tmp_path), "holder", lease_ttl=0.3)
+    other = WorkQueue(str(tmp_path), "other", lease_ttl=0.3)
+    acquired = threading.Event()
+
+    def contend():
+        with other.locked("results"):
+            acquired.set()
+
+    with holder.locked("results"):
+        thread = threading.Thread(target=contend)
+        thread.start()
+        time.sleep(1.0)
+        assert not acquired.is_set()
+    thread.join(5)
+    assert acquired.is_set()
+    holder.close()
+    other.close()
+
+
+def test_cp_workers_split_cores(monkeypatch):
+    """Pool workers share the cores instead of each taking all of them."""
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    assert cp_workers_per_process(4) == 2
+    assert cp_workers_per_process(16) == 1
+    assert cp_workers_per_process(4, cp_workers=3) == 3
@@ -0,0 +1,63 @@
+"""Tests for image preprocessing."""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from nonogram_preprocess import binarize_array, binarize_variants, load_and_resize, open_reduced, sweep
+
+
+def test_binarize_variants_matches_single_calls():
+    """Broadcast fixed thresholds agree with cv2 thresholding one by one."""
+    arr = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    variants = [
+        {"method": "threshold", "threshold": 50},
+        {"method": "otsu"},
+        {"method": "threshold", "threshold": 200},
+    ]
+    outputs = binarize_variants(arr, variants)
+    for variant, binary in zip(variants, outputs):
+        assert np.array_equal(binary, binarize_array(arr, **variant))
+
+
+def test_sweep_every_size_and_variant(tmp_path):
+    """One decode yields a grid for every size/variant combination."""
+    path = tmp_path / "src.png"
+    gradient = np.tile(np.arange(0, 240, 2, dtype=np.uint8), (80, 1))
+    Image.fromarray(gradient).convert("RGB").save(path)
+
+    variants = [
+        {"method": "threshold", "threshold": 100},
+        {"method": "adaptive", "block_size": 5, "C": 2, "dilate": 1},
+    ]
+    results = sweep(str(path), [10, 20], variants)
+    assert sorted(results) == [(10, 0), (10, 1), (20, 0), (20, 1)]
+    assert results[(20, 0)].size == (20, 20)
+    assert set(np.unique(np.array(results[(10, 0)]))) <= {0, 255}
+
+
+def test_open_reduced_decodes_small(tmp_path):
+    """Large JPEGs are decoded at reduced size; oversized decodes are refused."""
+    path = tmp_path / "big.jpg"
+    gradient = np.tile(np.linspace(0, 255, 1600).astype(np.uint8), (1200, 1))
+    Image.fromarray(gradient).convert("RGB").save(path)
+
+    img = open_reduced(str(path), 50, 50, mode="L")
+    assert img.mode == "L"
+    assert 150 <= min(img.size) < 300
+    # the ramp survives the reduced decode
+    row = np.asarray(img, dtype=int)[img.height // 2]
+    assert row[0] < 10 and row[-1] > 245 and (np.diff(row) >= -3).all()
+
+    png = tmp_path / "big.png"
+    Image.fromarray(gradient).save(png)
+    assert min(open_reduced(str(png), 50, 50).size) < 300
+    with pytest.raises(ValueError):
+        open_reduced(str(png), 50, 50, max_pixels=1000)
+
+    # palette and 1-bit images cannot be box-reduced as they are
+    for mode in ("P", "1"):
+        path = tmp_path / f"big_{mode}.png"
+        Image.fromarray(gradient).convert(mode).save(path)
+        assert min(open_reduced(str(path), 50, 50).size) < 300
+        assert load_and_resize(str(path), 50, 50).size == (50, 50)
@@ -1,9 +1,31 @@
 #!/usr/bin/env python3
 """Test script for the nonogram solver."""
 
-from nonogram_solver import solve_nonogram
-from nonogram_clues import puzzle_from_image
+from nonogram_solver import (
+    BACKENDS,
+    CpSatBackend,
+    Verdict,
+    check_unique,
+    count_solutions,
+    iter_solutions,
+    solve_nonogram,
+)
+from nonogram_clues import puzzle_from_image, extract_clues, extract_clues_batch, rle_line
+from line_solver import (
+    UNKNOWN,
+    independent_parts,
+    propagate,
+    solve_line,
+    split_line,
+    unknown_components,
+)
+from adapt_puzzle import AdaptationSession, adapt_grid_for_unique_solution
+from nonogram_automaton import LRUCache, compile_automaton
+from nonogram_grid import PackedGrid, diff_count, grid_hash, unpack_rows
+from solution_cache import SolutionCache, clue_key
+from solver_portfolio import race, winner_table
 import os
+import numpy as np
 
 
 def print_grid(grid, title="Grid"):
@@ -195,6 +217,312 @@ def test_empty_puzzle():
     assert solutions[0] == [[0, 0], [0, 0]]
 
 
+def test_solve_line_deductions():
+    """Line deduction fills forced cells and leaves the rest unknown."""
+    U = UNKNOWN
+    assert solve_line([3], [U] * 5) == [U, U, 1, U, U]
+    assert solve_line([2, 2], [U] * 5) == [1, 1, 0, 1, 1]
+    assert solve_line([1], [U, 1, U]) == [0, 1, 0]
+    assert solve_line([0], [U, U]) == [0, 0]
+    assert solve_line([2], [U, 1, 0, U]) == [1, 1, 0, 0]
+    assert solve_line([3], [U, 0, U, U]) is None
+
+
+def test_propagate_fixpoint():
+    """Propagation settles line-solvable puzzles and flags contradictions."""
+    cross = propagate([[1], [3], [1]], [[1], [3], [1]])
+    assert cross.tolist() == [[0, 1, 0], [1, 1, 1], [0, 1, 0]]
+
+    lattice = propagate([[1], [1]], [[1], [1]])
+    assert (lattice == UNKNOWN).all()
+
+    assert propagate([[5], [5]], [[1]] * 5) is None
+
+
+def test_adaptation_session_flips():
+    """Flipping a cell updates only its row/column clues and the solutions."""
+    session = AdaptationSession([[1, 0], [0, 1]])
+    result = session.check_unique()
+    assert result.verdict is Verdict.AMBIGUOUS
+    assert result.alternative == [[0, 1], [1, 0]]
+
+    session.set_cell(0, 1, 1)
+    assert session.row_clues == [[2], [1]]
+    assert session.col_clues == [[1], [2]]
+    assert session.check_unique().solutions == [[[1, 1], [0, 1]]]
+
+
+def test_adapt_grid_checkerboard():
+    """A checkerboard is ambiguous but can be adapted to a unique puzzle."""
+    grid = [[(r + c) % 2 for c in range(6)] for r in range(6)]
+    for strategy in ("backbone", "random"):
+        adapted, ok = adapt_grid_for_unique_solution(
+            grid, max_attempts=100, strategy=strategy
+        )
+        assert ok
+        clues_row, clues_col = extract_clues(np.array(adapted, dtype=np.uint8))
+        assert solve_nonogram(clues_row, clues_col) == [adapted]
+
+
+def test_unknown_components():
+    """Open cells only group together through shared rows and columns."""
+    # two independent 2x2 "switches": rows 0-1 x cols 1, 3 and rows 2-3 x cols 0, 4
+    grid = np.array(
+        [
+            [0, 1, 1, 0, 0],
+            [0, 0, 1, 1, 0],
+            [1, 0, 1, 0, 0],
+            [0, 0, 1, 0, 1],
+            [0, 1, 1, 1, 0],
+        ],
+        dtype=np.uint8,
+    )
+    row_clues, col_clues = extract_clues(grid)
+    parts = unknown_components(propagate(row_clues, col_clues))
+    assert sorted(sorted(map(tuple, p.tolist())) for p in parts) == [
+        [(0, 1), (0, 3), (1, 1), (1, 3)],
+        [(2, 0), (2, 4), (3, 0), (3, 4)],
+    ]
+
+    stats = {}
+    adapted, ok = adapt_grid_for_unique_solution(grid, stats=stats)
+    assert ok and stats["iterations"] == 2  # both switches broken in one round
+
+
+def test_split_line():
+    """Lines split at empty cells only when the blocks can go one way."""
+    U = UNKNOWN
+    assert split_line([2, 1], [U, U, U, 0, U, U]) == [(0, 3, (2,)), (4, 6, (1,))]
+    assert split_line([1], [U, 0, U]) == [(0, 3, (1,))]
+    assert split_line([0], [0, 0]) == []
+
+
+def test_check_unique_independent_parts():
+    """Parts sharing a column split at its empty cells are proved separately."""
+    # two 2x2 switches in column 0, rows 0-1 and 4-5, kept apart by rows 2-3
+    grid = np.array(
+        [
+            [0, 1, 1, 1, 1, 1],
+            [1, 0, 1, 0, 0, 0],
+            [0, 0, 1, 0, 0, 0],
+            [0, 0, 0, 1, 1, 1],
+            [0, 1, 0, 1, 0, 1],
+            [1, 0, 0, 1, 0, 1],
+        ],
+        dtype=np.uint8,
+    )
+    row_clues, col_clues = extract_clues(grid)
+    fixed = propagate(row_clues, col_clues)
+    assert len(unknown_components(fixed)) == 1
+    parts = independent_parts(row_clues, col_clues, fixed)
+    assert sorted(sorted(map(tuple, p.cells.tolist())) for p in parts) == [
+        [(0, 0), (0, 5), (1, 0), (1, 5)],
+        [(4, 0), (4, 1), (5, 0), (5, 1)],
+    ]
+
+    for workers in (1, 2):
+        result = check_unique(row_clues, col_clues, as_array=True, workers=workers)
+        assert result.verdict is Verdict.AMBIGUOUS
+        assert result.stats["components"] == 2
+        for solution in result.solutions:
+            assert extract_clues(solution) == (row_clues, col_clues)
+        assert (result.solution != result.alternative).any()
+
+
+def test_backends_agree(tmp_path):
+    """Every engine gives the same verdicts, and the portfolio picks one."""
+    cases = [
+        (([[2], [0]], [[1], [0], [1]]), Verdict.UNSOLVABLE),
+        (([[1], [3], [1]], [[1], [3], [1]]), Verdict.UNIQUE),
+        (([[2], *[[1, 1]] * 6, [2]], [[2], *[[1, 1]] * 6, [2]]), Verdict.AMBIGUOUS),
+    ]
+    for (row_clues, col_clues), verdict in cases:
+        for backend in BACKENDS.values():
+            result = check_unique(row_clues, col_clues, as_array=True, backend=backend)
+            assert result.verdict is verdict, backend.name
+            for solution in result.solutions:
+                assert extract_clues(solution) == (row_clues, col_clues)
+
+    row_clues, col_clues = cases[2][0]
+    history = str(tmp_path / "portfolio.jsonl")
+    outcome = race(row_clues, col_clues, engines=["cpsat", "search"], history=history)
+    assert outcome.result.verdict is Verdict.AMBIGUOUS
+    assert outcome.winner in ("cpsat", "search")
+    assert outcome.elapsed[outcome.winner] is not None
+    assert winner_table(history) == {outcome.puzzle_class: {outcome.winner: 1}}
+
+
+def test_placement_encoding():
+    """Both line encodings admit exactly the same solutions."""
+    row_clues, col_clues = [[2], [1, 1], [1, 1], [2]], [[2], [1, 1], [1, 1], [2]]
+    found = {
+        encoding: sorted(
+            solve_nonogram(row_clues, col_clues, max_solutions=50, encoding=encoding)
+        )
+        for encoding in ("automaton", "placement")
+    }
+    assert len(found["automaton"]) == 3
+    assert found["automaton"] == found["placement"]
+
+
+def test_iter_solutions_streams():
+    """Streamed, packed and counted enumeration agree with solve_nonogram."""
+    rows = cols = [[1]] * 5  # permutation matrices: 120 solutions
+    expected = sorted(solve_nonogram(rows, cols, max_solutions=200))
+    stats = {}
+    assert sorted(iter_solutions(rows, cols, stats=stats)) == expected
+    assert stats == {"solutions": 120, "complete": True}
+    packed = list(iter_solutions(rows, cols, packed=True))
+    assert packed[0].dtype == np.dtype("<u8") and packed[0].shape == (5, 1)
+    assert sorted(unpack_rows(p, 5).tolist() for p in packed) == expected
+    assert count_solutions(rows, cols) == 120
+
+    stats = {}
+    assert count_solutions(rows, cols, limit=7, stats=stats) == 7
+    assert stats["complete"] is False
+    # closing the generator early stops the background search
+    stream = iter_solutions(rows, cols, as_array=True, buffer=1)
+    assert next(stream).shape == (5, 5)
+    stream.close()
+    # settled and contradictory puzzles never reach the solver
+    assert count_solutions([[1], [3], [1]], [[1], [3], [1]]) == 1
+    assert list(iter_solutions([[2], [0]], [[1], [0], [1]])) == []
+
+
+def test_check_unique_verdicts():
+    """check_unique reports the tri-state verdict with its witnesses."""
+    broken = check_unique([[2], [0]], [[1], [0], [1]])
+    assert broken.verdict is Verdict.UNSOLVABLE
+    assert broken.solutions == []
+
+    unique = check_unique([[1], [3], [1]], [[1], [3], [1]])
+    assert unique.is_unique
+    assert unique.solution == [[0, 1, 0], [1, 1, 1], [0, 1, 0]]
+
+    lattice = check_unique([[1], [1]], [[1], [1]])
+    assert lattice.verdict is Verdict.AMBIGUOUS
+    assert lattice.solution != lattice.alternative
+    assert sorted([lattice.solution, lattice.alternative]) == [
+        [[0, 1], [1, 0]],
+        [[1, 0], [0, 1]],
+    ]
+    assert lattice.stats["solves"] == 1  # one enumerating solve on one worker
+    assert unique.stats == {}  # settled by the line solver
+
+    # several workers find a solution, then disprove a second one
+    backend = CpSatBackend(parameters={"num_workers": 2})
+    assert check_unique([[1], [1]], [[1], [1]], backend=backend).stats["solves"] == 2
+    # a hint that solves the clues leaves only the proof
+    hinted = check_unique([[1], [1]], [[1], [1]], hint=[[0, 1], [1, 0]])
+    assert hinted.verdict is Verdict.AMBIGUOUS and hinted.solution == [[0, 1], [1, 0]]
+    assert hinted.stats["solves"] == 1
+
+
+def test_check_unique_budget(tmp_path):
+    """An exhausted budget yields an UNKNOWN verdict that is not cached."""
+    import threading
+
+    cancel = threading.Event()
+    cancel.set()
+    phases = []
+    cache = SolutionCache(str(tmp_path / "cache.sqlite"))
+    result = check_unique(
+        [[1], [1]],
+        [[1], [1]],
+        cache=cache,
+        cancel=cancel,
+        progress=lambda info: phases.append(info["phase"]),
+    )
+    assert result.verdict is Verdict.UNKNOWN and not result.is_unique
+    assert phases == ["propagate"]
+    assert len(cache) == 0
+
+    # line-solvable puzzles never reach the solver, so no budget is needed
+    assert check_unique([[1], [3], [1]], [[1], [3], [1]], time_limit=0).is_unique
+    assert check_unique([[1], [1]], [[1], [1]], time_limit=10).verdict is Verdict.AMBIGUOUS
+
+
+def test_automaton_cache():
+    """Automata are shared per clue tuple and the LRU counts its traffic."""
+    assert compile_automaton([2, 1]) is compile_automaton((2, 1))
+    assert compile_automaton([0]) is compile_automaton([])
+
+    cache = LRUCache(maxsize=2)
+    for key in ["a", "b", "a", "c", "b"]:
+        cache.get_or_build(key, lambda: key.upper())
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 4, 2)
+    assert stats["size"] == 2
+
+
+def test_extract_clues_vectorized():
+    """Whole-grid clue extraction matches the per-line encoder."""
+    rng = np.random.default_rng(0)
+    grids = (rng.random((4, 7, 9)) < 0.5).astype(np.uint8)
+    grids[0] = 0
+    for grid in grids:
+        clues_row, clues_col = extract_clues(grid)
+        assert clues_row == [rle_line(row) for row in grid]
+        assert clues_col == [rle_line(col) for col in grid.T]
+
+    assert extract_clues_batch(grids) == [extract_clues(g) for g in grids]
+
+    rows, cols = extract_clues(np.array([[1, 0, 1, 1], [0, 0, 0, 0]]), flat=True)
+    assert rows.values.tolist() == [1, 2, 0]
+    assert rows.offsets.tolist() == [0, 2, 3]
+    assert cols.to_lists() == [[1], [0], [1], [1]]
+
+
+def test_packed_grid():
+    """Bit-packed rows round-trip and support popcount, diff and hashing."""
+    rng = np.random.default_rng(1)
+    grid = (rng.random((5, 70)) < 0.5).astype(np.uint8)
+    packed = PackedGrid.from_array(grid)
+    assert packed.words.shape == (5, 2)
+    assert np.array_equal(packed.to_array(), grid)
+    assert packed.count() == int(grid.sum())
+
+    flipped = grid.copy()
+    flipped[3, 65] ^= 1
+    assert diff_count(packed, PackedGrid.from_array(flipped)) == 1
+    assert grid_hash(grid) == grid_hash(grid.tolist())
+    assert grid_hash(grid) != grid_hash(flipped)
+
+
+def test_array_grids_in_and_out():
+    """Solver and adaptation accept and return uint8 arrays on request."""
+    solutions = solve_nonogram([[1], [3], [1]], [[1], [3], [1]], as_array=True)
+    assert solutions[0].dtype == np.uint8
+    assert solutions[0].tolist() == [[0, 1, 0], [1, 1, 1], [0, 1, 0]]
+
+    lattice = check_unique([[1], [1]], [[1], [1]], as_array=True)
+    assert isinstance(lattice.alternative, np.ndarray)
+
+    grid = np.array([[1, 0], [0, 1]], dtype=np.uint8)
+    adapted, ok = adapt_grid_for_unique_solution(grid)
+    assert ok and isinstance(adapted, np.ndarray)
+
+
+def test_solution_cache(tmp_path):
+    """Verdicts are served from the cache and old entries are evicted."""
+    assert clue_key([[0]], [[]]) == clue_key([[]], [[0]])
+
+    cache = SolutionCache(str(tmp_path / "cache.sqlite"), max_entries=3)
+    first = check_unique([[1], [1]], [[1], [1]], cache=cache)
+    again = check_unique([[1], [1]], [[1], [1]], cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert again == first
+
+    for n in range(1, 5):
+        check_unique([[n]], [[1]] * n, cache=cache)
+    assert len(cache) <= 3
+
+    reopened = SolutionCache(str(tmp_path / "cache.sqlite"))
+    verdict, solution, _ = reopened.get([[4]], [[1]] * 4)
+    assert verdict == "unique"
+    assert solution.tolist() == [[1, 1, 1, 1]]
+
+
 if __name__ == "__main__":
     print("Nonogram Solver Test Suite")
     print("=" * 50)
@@ -0,0 +1,94 @@
+"""Lightweight per-stage tracing for the batch pipeline.
+
+`Tracer.stage` measures wall and CPU time of a block and the process RSS
+high-water mark after it, and attaches any fields the block adds (solver
+statistics, iteration counts, ...).  Finished spans are kept in memory and
+optionally written as JSON lines.  Python allocation peaks via `tracemalloc`
+are opt-in because they slow everything down; the rest costs a few
+microseconds per span and can stay on in production.
+"""
+
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, TextIO
+
+import numpy as np
+
+
+def _rss_peak_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+class Tracer:
+    """Collect timing spans and write them as JSON lines."""
+
+    def __init__(self, sink: Optional[TextIO] = None, trace_allocations: bool = False):
+        self.sink = sink
+        self.trace_allocations = trace_allocations
+        self.spans: List[dict] = []
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, **tags) -> Iterator[dict]:
+        """Time the enclosed block; fields added to the yielded dict are kept."""
+        span = {"stage": name, **tags}
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield span
+        except Exception as e:
+            span["error"] = str(e)
+            raise
+        finally:
+            span["wall_s"] = time.perf_counter() - wall
+            span["cpu_s"] = time.process_time() - cpu
+            span["rss_peak_mb"] = _rss_peak_mb()
+            if self.trace_allocations:
+                span["alloc_peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+            self.add(span)
+
+    def add(self, span: dict) -> None:
+        """Record a finished span (e.g. one returned by a worker process)."""
+        self.spans.append(span)
+        if self.sink is not None:
+            self.sink.write(json.dumps(span, sort_keys=True, default=str) + "\n")
+            self.sink.flush()
+
+    def summary(self) -> Dict[str, dict]:
+        """Return per-stage count, total/mean/p95 wall time and total CPU time."""
+        by_stage: Dict[str, List[dict]] = {}
+        for span in self.spans:
+            by_stage.setdefault(span["stage"], []).append(span)
+        summary = {}
+        for stage, spans in by_stage.items():
+            wall = np.array([s["wall_s"] for s in spans])
+            summary[stage] = {
+                "count": len(spans),
+                "wall_total_s": float(wall.sum()),
+                "wall_mean_s": float(wall.mean()),
+                "wall_p95_s": float(np.percentile(wall, 95)),
+                "cpu_total_s": float(sum(s["cpu_s"] for s in spans)),
+                "errors": sum(1 for s in spans if "error" in s),
+            }
+        return summary
+
+    def summary_table(self) -> str:
+        lines = [
+            f"{'stage':12} {'count':>6} {'total s':>9} {'mean ms':>9} {'p95 ms':>9} {'cpu s':>8} {'errors':>6}"
+        ]
+        for stage, s in self.summary().items():
+            lines.append(
+                f"{stage:12} {s['count']:6d} {s['wall_total_s']:9.2f} "
+                f"{s['wall_mean_s'] * 1000:9.1f} {s['wall_p95_s'] * 1000:9.1f} "
+                f"{s['cpu_total_s']:8.2f} {s['errors']:6d}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,232 @@
+"""Lease-file work queue on a shared filesystem.
+
+Any number of worker processes, on one host or on several hosts mounting
+the same directory, split a set of work items between them.  Each item has
+a string key; a worker claims it by creating `leases/<key>` with
+`O_CREAT | O_EXCL`, which only one creator can win, also over NFS.  While
+the worker runs, a heartbeat thread refreshes the lease's mtime.  A lease
+not refreshed for `lease_ttl` seconds belongs to a crashed worker and is
+reclaimed by whoever sees it next.
+
+A finished item gets a marker `done/<key>` holding its results.  The marker
+is published with `os.link`, so it appears complete or not at all, and at
+most once.  Even if a worker stalled for longer than `lease_ttl` and lost
+its item, only one of the two runs publishes its results.
+
+Lease ages compare file mtimes with the local clock, so hosts need roughly
+synchronized clocks (well within `lease_ttl`).  SQLite would be the
+obvious alternative, but its locking is unreliable on network filesystems.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set
+
+DEFAULT_LEASE_TTL = 60.0
+
+
+class WorkQueue:
+    """Claim, heartbeat and complete work items under a shared `root`."""
+
+    poll_interval = 0.05
+
+    def __init__(
+        self,
+        root: str,
+        worker_id: Optional[str] = None,
+        lease_ttl: float = DEFAULT_LEASE_TTL,
+        heartbeat_interval: Optional[float] = None,
+    ):
+        self.root = Path(root)
+        self.leases = self.root / "leases"
+        self.done = self.root / "done"
+        self.leases.mkdir(parents=True, exist_ok=True)
+        self.done.mkdir(parents=True, exist_ok=True)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval or lease_ttl / 4
+        # keys whose lease we hold
+        self.held: Set[str] = set()
+        # lock files held by `locked`, refreshed like leases
+        self._locks: Set[Path] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def is_done(self, key: str) -> bool:
+        return (self.done / key).exists()
+
+    def result(self, key: str) -> Optional[dict]:
+        """Return what `complete` stored for `key`, or None if it is not done."""
+        try:
+            with open(self.done / key) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def claim(self, key: str) -> bool:
+        """Try to take `key`; False if it is done or leased by a live worker."""
+        if self.is_done(key):
+            return False
+        path = self.leases / key
+        if not self._create(path):
+            return False
+        # the previous owner may have finished between the check and the create
+        if self.is_done(key):
+            path.unlink(missing_ok=True)
+            return False
+        with self._lock:
+            self.held.add(key)
+        self._start_heartbeat()
+        return True
+
+    def complete(self, key: str, result: dict) -> bool:
+        """Publish `result` for `key` and drop its lease.
+
+        Returns False if another worker published first, in which case
+        `result` should be discarded.
+        """
+        tmp = self.done / f".{key}.{self.worker_id}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(result, worker=self.worker_id, finished_at=time.time()), f, default=str)
+        try:
+            os.link(tmp, self.done / key)
+            published = True
+        except FileExistsError:
+            published = False
+        finally:
+            tmp.unlink()
+        self.release(key)
+        return published
+
+    def release(self, key: str) -> None:
+        """Give up the lease on `key` so another worker can take it at once."""
+        with self._lock:
+            self.held.discard(key)
+        path = self.leases / key
+        if self._owner(path) == self.worker_id:
+            path.unlink(missing_ok=True)
+
+    @contextmanager
+    def locked(self, name: str) -> Iterator[None]:
+        """Hold the queue-wide lock `name`, e.g. around appends to shared files.
+
+        The heartbeat keeps the lock fresh while it is held, however long
+        that takes; a lock left behind by a crashed worker expires like a
+        lease.
+        """
+        path = self.root / f"{name}.lock"
+        while not self._create(path):
+            time.sleep(self.poll_interval)
+        with self._lock:
+            self._locks.add(path)
+        self._start_heartbeat()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._locks.discard(path)
+            path.unlink(missing_ok=True)
+
+    def status(self) -> Dict[str, int]:
+        """Count done items and live or expired leases."""
+        now = time.time()
+        live = expired = 0
+        for path in self.leases.iterdir():
+            try:
+                age = now - path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if age < self.lease_ttl:
+                live += 1
+            else:
+                expired += 1
+        done = sum(1 for p in self.done.iterdir() if not p.name.startswith("."))
+        return {"done": done, "leased": live, "expired": expired}
+
+    def close(self) -> None:
+        """Stop the heartbeat and release every lease still held."""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        for key in list(self.held):
+            self.release(key)
+
+    def _create(self, path: Path) -> bool:
+        """Create the lease file `path` for this worker, reclaiming it if expired."""
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._reclaim(path):
+                    return False
+                continue
+            with os.fdopen(fd, "w") as f:
+                json.dump({"owner": self.worker_id, "host": socket.gethostname(), "pid": os.getpid()}, f)
+            return True
+        return False
+
+    def _reclaim(self, path: Path) -> bool:
+        """Remove `path` if its lease has expired; True if it is gone."""
+        try:
+            if time.time() - path.stat().st_mtime < self.lease_ttl:
+                return False
+        except FileNotFoundError:
+            return True
+        # of several workers reclaiming at once only one wins the rename
+        grave = path.with_name(f".{path.name}.{self.worker_id}.expired")
+        try:
+            os.rename(path, grave)
+        except FileNotFoundError:
+            return True
+        if time.time() - grave.stat().st_mtime < self.lease_ttl:
+            # someone re-created the lease after our check; put it back
+            try:
+                os.link(grave, path)
+            except FileExistsError:
+                pass
+            grave.unlink()
+            return False
+        grave.unlink()
+        return True
+
+    def _owner(self, path: Path) -> Optional[str]:
+        try:
+            with open(path) as f:
+                return json.load(f).get("owner")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _start_heartbeat(self) -> None:
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(
+                target=self._beat, name="lease-heartbeat", daemon=True
+            )
+            self._heartbeat.start()
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._lock:
+                held = list(self.held)
+                locks = list(self._locks)
+            for path in locks:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+            for key in held:
+                path = self.leases / key
+                if self._owner(path) == self.worker_id:
+                    try:
+                        os.utime(path)
+                        continue
+                    except FileNotFoundError:
+                        pass
+                with self._lock:
+                    self.held.discard(key)